@@ -18,9 +18,10 @@ qconfig.check_python_version()
 
 from site import addsitedir
 addsitedir(os.path.join(qconfig.LIBS_LOCATION, 'site_packages'))
-from quast_libs import qutils, run_barrnap, plotter_data, unique_kmers
+from quast_libs import qutils, run_barrnap, plotter_data, unique_kmers, reference_profile
 from quast_libs.qutils import cleanup, check_dirpath, check_reads_fpaths
 from quast_libs.options_parser import parse_options
+from quast_libs.scheduler import Stage, run_stages
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -29,6 +30,114 @@ logger.set_up_console_handler()
 is_combined_ref = False
 
 
+def _run_basic_stats(ref_fpath, contigs_fpaths, output_dirpath):
+    from quast_libs import basic_stats
+    return basic_stats.do(ref_fpath, contigs_fpaths, os.path.join(output_dirpath, 'basic_stats'), output_dirpath)
+
+
+def _prepare_tools(ref_fpath):
+    # tools used by several stages are compiled and downloaded before the stages are run concurrently
+    if ref_fpath:
+        from quast_libs.ca_utils.misc import compile_minimap, import_mappy
+        compile_minimap(logger)
+        if qconfig.use_mappy:
+            import_mappy(logger)
+        if qconfig.use_kmc and qconfig.platform_name != 'linux_32':
+            unique_kmers.download_kmc(logger)
+    if qconfig.glimmer and not qconfig.is_agb_mode:
+        from quast_libs import glimmer
+        glimmer.compile_glimmer(logger)
+
+
+def _run_kmer_stats(ref_fpath, contigs_fpaths, output_dirpath):
+    unique_kmers.do(os.path.join(output_dirpath, 'k_mer_stats'), ref_fpath, contigs_fpaths, logger)
+
+
+def _run_contigs_analyzer(ref_fpath, contigs_fpaths, old_contigs_fpaths, output_dirpath):
+    aligned_contigs_fpaths = []
+    aligned_lengths_lists = []
+    if ref_fpath:
+        ########################################################################
+        ### former PLANTAKOLYA, PLANTAGORA
+        ########################################################################
+        from quast_libs import contigs_analyzer
+        is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
+        aligner_statuses, aligned_lengths_per_fpath = contigs_analyzer.do(
+            ref_fpath, contigs_fpaths, is_cyclic, os.path.join(output_dirpath, qconfig.detailed_contigs_reports_dirname),
+            old_contigs_fpaths, qconfig.bed)
+        for contigs_fpath in contigs_fpaths:
+            if aligner_statuses[contigs_fpath] == contigs_analyzer.AlignerStatus.OK:
+                aligned_contigs_fpaths.append(contigs_fpath)
+                aligned_lengths_lists.append(aligned_lengths_per_fpath[contigs_fpath])
+    return aligned_contigs_fpaths, aligned_lengths_lists
+
+
+def _run_aligned_stats(ref_fpath, aligned_contigs_fpaths, aligned_lengths_lists, output_dirpath):
+    # Before continue evaluating, check if aligner didn't skip all of the contigs files.
+    if len(aligned_contigs_fpaths) and ref_fpath:
+        ########################################################################
+        ### NAx and NGAx ("aligned Nx and NGx")
+        ########################################################################
+        from quast_libs import aligned_stats
+        aligned_stats.do(
+            ref_fpath, aligned_contigs_fpaths, output_dirpath,
+            aligned_lengths_lists, os.path.join(output_dirpath, 'aligned_stats'))
+
+
+def _run_genome_analyzer(ref_fpath, aligned_contigs_fpaths, output_dirpath):
+    detailed_contigs_reports_dirpath = None
+    features_containers = None
+    if len(aligned_contigs_fpaths) and ref_fpath:
+        detailed_contigs_reports_dirpath = os.path.join(output_dirpath, qconfig.detailed_contigs_reports_dirname)
+
+        ########################################################################
+        ### GENOME_ANALYZER
+        ########################################################################
+        from quast_libs import genome_analyzer
+        features_containers = genome_analyzer.do(
+            ref_fpath, aligned_contigs_fpaths, output_dirpath,
+            qconfig.features, qconfig.operons, detailed_contigs_reports_dirpath,
+            os.path.join(output_dirpath, 'genome_stats'))
+    return detailed_contigs_reports_dirpath, features_containers
+
+
+def _predict_genes(contigs_fpaths, output_dirpath):
+    genes_by_labels = None
+    if qconfig.glimmer:
+        ########################################################################
+        ### Glimmer
+        ########################################################################
+        from quast_libs import glimmer
+        genes_by_labels = glimmer.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'))
+    if qconfig.gene_finding:
+        ########################################################################
+        ### GeneMark
+        ########################################################################
+        from quast_libs import genemark
+        genes_by_labels = genemark.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'),
+                    qconfig.prokaryote, qconfig.metagenemark)
+    if genes_by_labels is None:
+        logger.main_info("")
+        logger.notice("Genes are not predicted by default. Use --gene-finding or --glimmer option to enable it.")
+    return genes_by_labels
+
+
+def _predict_rna_genes(contigs_fpaths, output_dirpath):
+    run_barrnap.do(contigs_fpaths, os.path.join(output_dirpath, 'predicted_genes'), logger)
+
+
+def _run_busco(contigs_fpaths, output_dirpath):
+    if qconfig.platform_name == 'macosx':
+        logger.main_info("")
+        logger.warning("BUSCO can be run on Linux only")
+    elif sys.version[0:3] < '2.7':
+        logger.main_info("")
+        logger.warning("BUSCO does not support Python versions earlier than 2.7.")
+    else:
+        from quast_libs import run_busco
+        run_busco.do(contigs_fpaths, os.path.join(output_dirpath, qconfig.busco_dirname), logger)
+
+
 def main(args):
     check_dirpath(qconfig.QUAST_HOME, 'You are trying to run it from ' + str(qconfig.QUAST_HOME) + '\n.' +
                   'Please, put QUAST in a different directory, then try again.\n', exit_code=3)
@@ -86,6 +195,7 @@ def main(args):
         logger.main_info('Reference:')
         original_ref_fpath = ref_fpath
         ref_fpath = qutils.correct_reference(ref_fpath, corrected_dirpath)
+        reference_profile.do(ref_fpath, os.path.join(output_dirpath, 'basic_stats'))
         if qconfig.optimal_assembly:
             if not qconfig.pacbio_reads and not qconfig.nanopore_reads and not qconfig.mate_pairs:
                 logger.warning('Upper Bound Assembly cannot be created. It requires mate-pairs or long reads (Pacbio SMRT or Oxford Nanopore).')
@@ -143,89 +253,39 @@ def main(args):
             qconfig.json_output_dirpath = None
 
     ########################################################################
-    ### Stats and plots
+    ### Stats, alignments and gene finding (independent stages run concurrently)
     ########################################################################
-    from quast_libs import basic_stats
-    icarus_gc_fpath, circos_gc_fpath = basic_stats.do(ref_fpath, contigs_fpaths, os.path.join(output_dirpath, 'basic_stats'), output_dirpath)
-
+    # stages drawing plots (matplotlib is not thread-safe) or processing alignments in Python run in the main thread
+    stages = [Stage('basic_stats', _run_basic_stats, ['ref_fpath', 'contigs_fpaths', 'output_dirpath'],
+                    ['icarus_gc_fpath', 'circos_gc_fpath'], threads=1, in_main_thread=True)]
     if qconfig.use_kmc and ref_fpath:
-        unique_kmers.do(os.path.join(output_dirpath, 'k_mer_stats'), ref_fpath, contigs_fpaths, logger)
+        stages.append(Stage('k_mer_stats', _run_kmer_stats, ['ref_fpath', 'contigs_fpaths', 'output_dirpath']))
+    stages.append(Stage('contigs_analyzer', _run_contigs_analyzer, ['ref_fpath', 'contigs_fpaths', 'old_contigs_fpaths', 'output_dirpath'],
+                        ['aligned_contigs_fpaths', 'aligned_lengths_lists'], in_main_thread=True))
+    if not qconfig.is_agb_mode:  # AGB needs only alignments information
+        stages.append(Stage('aligned_stats', _run_aligned_stats, ['ref_fpath', 'aligned_contigs_fpaths', 'aligned_lengths_lists', 'output_dirpath'],
+                            threads=1, in_main_thread=True))
+        stages.append(Stage('genome_analyzer', _run_genome_analyzer, ['ref_fpath', 'aligned_contigs_fpaths', 'output_dirpath'],
+                            ['detailed_contigs_reports_dirpath', 'features_containers'], in_main_thread=True))
+        stages.append(Stage('gene_finding', _predict_genes, ['contigs_fpaths', 'output_dirpath'], ['genes_by_labels']))
+        if qconfig.rna_gene_finding:
+            stages.append(Stage('rna_gene_finding', _predict_rna_genes, ['contigs_fpaths', 'output_dirpath']))
+        if qconfig.run_busco and not qconfig.is_combined_ref:
+            # BUSCO keeps its configuration in global variables, so its runs need worker processes of the main thread
+            stages.append(Stage('busco', _run_busco, ['contigs_fpaths', 'output_dirpath'], in_main_thread=True))
+    _prepare_tools(ref_fpath)
+    data = run_stages(stages, dict(ref_fpath=ref_fpath, contigs_fpaths=contigs_fpaths, old_contigs_fpaths=old_contigs_fpaths,
+                                   output_dirpath=output_dirpath))
+    if qconfig.is_agb_mode:
+        sys.exit(0)
 
-    aligned_contigs_fpaths = []
-    aligned_lengths_lists = []
+    aligned_contigs_fpaths = data['aligned_contigs_fpaths']
+    icarus_gc_fpath, circos_gc_fpath = data['icarus_gc_fpath'], data['circos_gc_fpath']
+    detailed_contigs_reports_dirpath, features_containers = data['detailed_contigs_reports_dirpath'], data['features_containers']
+    genes_by_labels = data['genes_by_labels']
     icarus_html_fpath = None
     circos_png_fpath = None
-    if ref_fpath:
-        ########################################################################
-        ### former PLANTAKOLYA, PLANTAGORA
-        ########################################################################
-        from quast_libs import contigs_analyzer
-        is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
-        aligner_statuses, aligned_lengths_per_fpath = contigs_analyzer.do(
-            ref_fpath, contigs_fpaths, is_cyclic, os.path.join(output_dirpath, qconfig.detailed_contigs_reports_dirname),
-            old_contigs_fpaths, qconfig.bed)
-        for contigs_fpath in contigs_fpaths:
-            if aligner_statuses[contigs_fpath] == contigs_analyzer.AlignerStatus.OK:
-                aligned_contigs_fpaths.append(contigs_fpath)
-                aligned_lengths_lists.append(aligned_lengths_per_fpath[contigs_fpath])
-
-    if qconfig.is_agb_mode:  # AGB needs only alignments information
-        sys.exit(0)
-
-    # Before continue evaluating, check if aligner didn't skip all of the contigs files.
-    detailed_contigs_reports_dirpath = None
-    features_containers = None
-    if len(aligned_contigs_fpaths) and ref_fpath:
-        detailed_contigs_reports_dirpath = os.path.join(output_dirpath, qconfig.detailed_contigs_reports_dirname)
-
-        ########################################################################
-        ### NAx and NGAx ("aligned Nx and NGx")
-        ########################################################################
-        from quast_libs import aligned_stats
-        aligned_stats.do(
-            ref_fpath, aligned_contigs_fpaths, output_dirpath,
-            aligned_lengths_lists, os.path.join(output_dirpath, 'aligned_stats'))
-
-        ########################################################################
-        ### GENOME_ANALYZER
-        ########################################################################
-        from quast_libs import genome_analyzer
-        features_containers = genome_analyzer.do(
-            ref_fpath, aligned_contigs_fpaths, output_dirpath,
-            qconfig.features, qconfig.operons, detailed_contigs_reports_dirpath,
-            os.path.join(output_dirpath, 'genome_stats'))
-
-    genes_by_labels = None
-    if qconfig.glimmer:
-        ########################################################################
-        ### Glimmer
-        ########################################################################
-        from quast_libs import glimmer
-        genes_by_labels = glimmer.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'))
-    if qconfig.gene_finding:
-        ########################################################################
-        ### GeneMark
-        ########################################################################
-        from quast_libs import genemark
-        genes_by_labels = genemark.do(contigs_fpaths, qconfig.genes_lengths, os.path.join(output_dirpath, 'predicted_genes'),
-                    qconfig.prokaryote, qconfig.metagenemark)
-    if genes_by_labels is None:
-        logger.main_info("")
-        logger.notice("Genes are not predicted by default. Use --gene-finding or --glimmer option to enable it.")
 
-    if qconfig.rna_gene_finding:
-        run_barrnap.do(contigs_fpaths, os.path.join(output_dirpath, 'predicted_genes'), logger)
-
-    if qconfig.run_busco and not qconfig.is_combined_ref:
-        if qconfig.platform_name == 'macosx':
-            logger.main_info("")
-            logger.warning("BUSCO can be run on Linux only")
-        elif sys.version[0:3] < '2.7':
-            logger.main_info("")
-            logger.warning("BUSCO does not support Python versions earlier than 2.7.")
-        else:
-            from quast_libs import run_busco
-            run_busco.do(contigs_fpaths, os.path.join(output_dirpath, qconfig.busco_dirname), logger)
     ########################################################################
     reports_fpaths, transposed_reports_fpaths = reporting.save_total(output_dirpath)
 
@@ -5,6 +5,9 @@
 # See file LICENSE for details.
 ############################################################################
 
+from bisect import bisect_left
+
+
 def NG50(numlist, reference_length, percentage = 50.0):
     """
     Abstract: Returns the NG50 value of the passed list of numbers.
@@ -72,4 +75,37 @@ def NG50_and_LG50(numlist, reference_length, percentage=50.0, need_sort=False):
 
 
 def N50_and_L50(numlist, percentage = 50.0):
-    return NG50_and_LG50(numlist, sum(numlist), percentage)
\ No newline at end of file
+    return NG50_and_LG50(numlist, sum(numlist), percentage)
+
+
+class NxStats(object):
+    """
+    Abstract: Lengths sorted in descending order once and their cumulative sums.
+    Comments: NGx and LGx (Nx, NAx, NGAx and L-variants) for any percentage and total length
+              are found by binary search over cumulative sums, the sums are also points of Nx-like plots
+    Usage: stats = NxStats(numlist); stats.N50_and_L50(); stats.NG50_and_LG50(reference_length, 75.0)
+    """
+    def __init__(self, numlist, is_sorted=False):
+        self.lengths = numlist if is_sorted else sorted(numlist, reverse=True)
+        self.cum_lengths = []
+        self.total_length = 0
+        for l in self.lengths:
+            self.total_length += l
+            self.cum_lengths.append(self.total_length)
+
+    def NG50_and_LG50(self, reference_length, percentage=50.0):
+        assert percentage >= 0.0
+        assert percentage <= 100.0
+        limit = reference_length * (100.0 - percentage) / 100.0
+        lg50 = bisect_left(self.cum_lengths, reference_length - limit)
+        # the same condition as in NG50_and_LG50 is checked around the found index to avoid rounding errors
+        while lg50 > 0 and reference_length - self.cum_lengths[lg50 - 1] <= limit:
+            lg50 -= 1
+        while lg50 < len(self.cum_lengths) and reference_length - self.cum_lengths[lg50] > limit:
+            lg50 += 1
+        if lg50 == len(self.cum_lengths):
+            return None, None
+        return self.lengths[lg50], lg50 + 1
+
+    def N50_and_L50(self, percentage=50.0):
+        return self.NG50_and_LG50(self.total_length, percentage)
@@ -7,7 +7,7 @@
 
 import os
 import itertools
-from quast_libs import fastaparser, N50, plotter, reporting, qconfig, qutils
+from quast_libs import fastaparser, N50, plotter, reporting, qconfig, qutils, reference_profile
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
@@ -29,20 +29,20 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath,
     logger.print_timestamp()
     logger.main_info('Running NA-NGA calculation...')
 
-    ref_chr_lengths = fastaparser.get_chr_lengths_from_fastafile(ref_fpath)
+    ref_chr_lengths = reference_profile.get(ref_fpath).chr_lengths
     reference_length = sum(ref_chr_lengths.values())
     assembly_lengths = []
     for contigs_fpath in aligned_contigs_fpaths:
         assembly_lengths.append(sum(fastaparser.get_chr_lengths_from_fastafile(contigs_fpath).values()))
 
-    for i, (contigs_fpath, lens, assembly_len) in enumerate(
-            zip(aligned_contigs_fpaths, aligned_lengths_lists, assembly_lengths)):
-        sorted_lengths = sorted(lens, reverse=True)
-        na50, la50 = N50.NG50_and_LG50(sorted_lengths, assembly_len)
-        nax, lax = N50.NG50_and_LG50(sorted_lengths, assembly_len, qconfig.x_for_additional_Nx)
+    lists_of_nx_stats = [N50.NxStats(lens) for lens in aligned_lengths_lists]
+    for i, (contigs_fpath, lens, nx_stats, assembly_len) in enumerate(
+            zip(aligned_contigs_fpaths, aligned_lengths_lists, lists_of_nx_stats, assembly_lengths)):
+        na50, la50 = nx_stats.NG50_and_LG50(assembly_len)
+        nax, lax = nx_stats.NG50_and_LG50(assembly_len, qconfig.x_for_additional_Nx)
         if not qconfig.is_combined_ref:
-            nga50, lga50 = N50.NG50_and_LG50(sorted_lengths, reference_length)
-            ngax, lgax = N50.NG50_and_LG50(sorted_lengths, reference_length, qconfig.x_for_additional_Nx)
+            nga50, lga50 = nx_stats.NG50_and_LG50(reference_length)
+            ngax, lgax = nx_stats.NG50_and_LG50(reference_length, qconfig.x_for_additional_Nx)
 
         logger.info('  ' +
                     qutils.index_to_str(i) +
@@ -75,15 +75,15 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath,
 
     if qconfig.draw_plots:
         # Drawing cumulative plot (aligned contigs)...
-        plotter.cumulative_plot(ref_fpath, aligned_contigs_fpaths, aligned_lengths_lists,
+        plotter.cumulative_plot(ref_fpath, aligned_contigs_fpaths, lists_of_nx_stats,
                                 os.path.join(aligned_stats_dirpath, 'cumulative_plot'),
                                 'Cumulative length (aligned contigs)')
 
         # Drawing NAx and NGAx plots...
-    plotter.Nx_plot(output_dirpath, num_contigs > qconfig.max_points, aligned_contigs_fpaths, aligned_lengths_lists, aligned_stats_dirpath + '/NAx_plot', 'NAx',
+    plotter.Nx_plot(output_dirpath, num_contigs > qconfig.max_points, aligned_contigs_fpaths, lists_of_nx_stats, aligned_stats_dirpath + '/NAx_plot', 'NAx',
                     assembly_lengths)
     if not qconfig.is_combined_ref:
-        plotter.Nx_plot(output_dirpath, num_contigs > qconfig.max_points, aligned_contigs_fpaths, aligned_lengths_lists,
+        plotter.Nx_plot(output_dirpath, num_contigs > qconfig.max_points, aligned_contigs_fpaths, lists_of_nx_stats,
                         aligned_stats_dirpath + '/NGAx_plot', 'NGAx', [reference_length for i in range(len(aligned_contigs_fpaths))])
 
     logger.main_info('Done.')
@@ -9,22 +9,19 @@ from __future__ import with_statement
 from __future__ import division
 import os
 import re
+from array import array
+from bisect import bisect_right
 from os.path import join
 
-from quast_libs import fastaparser, qconfig, qutils, reporting, plotter
+from quast_libs import fastaparser, qconfig, qutils, reporting, plotter, reference_profile
+from quast_libs.gc_content import UNDEFINED_GC, count_blocks, get_windows_GC, get_GC_hist
 from quast_libs.circos import set_window_size
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 MIN_HISTOGRAM_POINTS = 5
-MIN_GC_WINDOW_SIZE = qconfig.GC_window_size // 2
 
 
-def GC_content(contigs_fpath, skip=False):
-    """
-       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
-    """
-    total_GC_amount = 0
-    total_contig_length = 0
+def _init_GC_distributions():
     GC_contigs_bin_num = int(100 / qconfig.GC_contig_bin_size) + 1
     GC_contigs_distribution_x = [i * qconfig.GC_contig_bin_size for i in range(0, GC_contigs_bin_num)] # list of X-coordinates, i.e. GC %
     GC_contigs_distribution_y = [0] * GC_contigs_bin_num # list of Y-coordinates, i.e. # contigs with GC % = x
@@ -32,26 +29,35 @@ def GC_content(contigs_fpath, skip=False):
     GC_bin_num = int(100 / qconfig.GC_bin_size) + 1
     GC_distribution_x = [i * qconfig.GC_bin_size for i in range(0, GC_bin_num)] # list of X-coordinates, i.e. GC %
     GC_distribution_y = [0] * GC_bin_num # list of Y-coordinates, i.e. # windows with GC % = x
+    return (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
+
+
+def GC_content(contigs_fpath, skip=False):
+    """
+       Returns percent of GC for assembly and GC distribution: (list of GC%, list of # windows)
+    """
+    total_GC_amount = 0
+    total_contig_length = 0
+    (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y) = _init_GC_distributions()
     total_GC = None
     if skip:
         return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
 
+    n = qconfig.GC_window_size
+    windows_gc_percents = array('b')
     for name, seq_full in fastaparser.read_fasta(contigs_fpath): # in tuples: (name, seq)
         contig_ACGT_len = len(seq_full) - seq_full.count("N")
         if not contig_ACGT_len:
             continue
-        contig_GC_len = seq_full.count("G") + seq_full.count("C")
+        # non-overlapping windows
+        ACGT_counts, GC_counts = count_blocks(seq_full, n)
+        contig_GC_len = sum(GC_counts)
         contig_GC_percent = 100.0 * contig_GC_len / contig_ACGT_len
         GC_contigs_distribution_y[int(contig_GC_percent // qconfig.GC_contig_bin_size)] += 1
-
-        n = qconfig.GC_window_size
-        # non-overlapping windows
-        for seq in (seq_full[i:i+n] for i in range(0, len(seq_full), n)):
-            GC_percent = get_GC_percent(seq)
-            if GC_percent is not None:
-                GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += 1
+        windows_gc_percents.extend(get_windows_GC(len(seq_full), ACGT_counts, GC_counts, n, n))
         total_GC_amount += contig_GC_len
         total_contig_length += contig_ACGT_len
+    add_GC_hist(GC_distribution_y, get_GC_hist(windows_gc_percents))
 
     if total_contig_length == 0:
         total_GC = None
@@ -61,58 +67,87 @@ def GC_content(contigs_fpath, skip=False):
     return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
 
 
-def get_GC_percent(seq):
-    if len(seq) < MIN_GC_WINDOW_SIZE:
-        return None
-    ACGT_len = len(seq) - seq.count("N")
-    # skip block if it has less than half of ACGT letters (it also helps with "ends of contigs")
-    if ACGT_len < len(seq) // 2:
-        return None
+def reference_GC_content(ref_profile):
+    """
+       The same as GC_content but takes precomputed reference profile
+    """
+    (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y) = _init_GC_distributions()
+    add_GC_hist(GC_distribution_y, ref_profile.gc_windows_hist)
+
+    total_GC_amount = 0
+    total_ref_length = 0
+    for chr_GC_len, chr_ACGT_len in ref_profile.gc_by_chromosomes.values():
+        if not chr_ACGT_len:
+            continue
+        chr_GC_percent = 100.0 * chr_GC_len / chr_ACGT_len
+        GC_contigs_distribution_y[int(chr_GC_percent // qconfig.GC_contig_bin_size)] += 1
+        total_GC_amount += chr_GC_len
+        total_ref_length += chr_ACGT_len
+
+    total_GC = total_GC_amount * 100.0 / total_ref_length if total_ref_length else None
+    return total_GC, (GC_distribution_x, GC_distribution_y), (GC_contigs_distribution_x, GC_contigs_distribution_y)
+
 
-    GC_len = seq.count("G") + seq.count("C")
-    GC_percent = 100 * GC_len // ACGT_len
-    return GC_percent
+def add_GC_hist(GC_distribution_y, gc_hist):
+    for GC_percent, windows_num in enumerate(gc_hist):
+        if windows_num:
+            GC_distribution_y[int(int(GC_percent / qconfig.GC_bin_size) * qconfig.GC_bin_size)] += windows_num
 
 
-def save_icarus_GC(ref_fpath, gc_fpath):
+def save_icarus_GC(ref_profile, gc_fpath):
     chr_index = 0
-    window_size = qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size  # non-overlapping windows
+    window_size = reference_profile.get_icarus_window_size()  # non-overlapping windows
     with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
+        for name, GC_percents in ref_profile.gc_windows[window_size].items():
             out_f.write('#' + name + ' ' + str(chr_index) + '\n')
-            for i in range(0, len(seq_full), window_size):
-                seq = seq_full[i:i + window_size]
-                GC_percent = get_GC_percent(seq)
-                if GC_percent is not None:
+            for GC_percent in GC_percents:
+                if GC_percent != UNDEFINED_GC:
                     out_f.write(str(chr_index) + ' ' + str(GC_percent) + '\n')
 
 
-def save_circos_GC(ref_fpath, reference_length, gc_fpath):
+def save_circos_GC(ref_profile, reference_length, gc_fpath):
     window_size = set_window_size(reference_length)
     with open(gc_fpath, 'w') as out_f:
-        for name, seq_full in fastaparser.read_fasta(ref_fpath):
-            for i in range(0, len(seq_full), window_size):
-                seq = seq_full[i:i + window_size]
-                GC_percent = get_GC_percent(seq)
-                if GC_percent is not None:
-                    out_f.write('\t'.join([name, str(i), str(i + len(seq)), str(GC_percent) + '\n']))
+        for name, start, end, GC_percent in ref_profile.iter_gc_windows(window_size):
+            out_f.write('\t'.join([name, str(start), str(end), str(GC_percent) + '\n']))
+
+
+def get_cumulative_coverage(values):
+    """
+        Takes numbers of bases by coverage values
+        Returns numbers of bases with coverage <= each value
+    """
+    cum_bases = []
+    total_bases = 0
+    for bases in values:
+        total_bases += bases
+        cum_bases.append(total_bases)
+    return cum_bases
+
+
+def count_bases_in_coverage_range(cum_bases, min_cov, max_cov=None):
+    """
+        Returns number of bases with min_cov <= coverage < max_cov (without the upper bound if max_cov is None)
+    """
+    max_cov = len(cum_bases) if max_cov is None else min(max_cov, len(cum_bases))
+    if min_cov >= max_cov:
+        return 0
+    return cum_bases[max_cov - 1] - (cum_bases[min_cov - 1] if min_cov > 0 else 0)
 
 
-def binning_coverage(cov_values, nums_contigs):
+def binning_coverage(cum_cov_values, nums_contigs):
     min_bins_cnt = 5
     bin_sizes = []
     low_thresholds = []
     high_thresholds = []
     cov_by_bins = []
-    max_cov = max(len(v) for v in cov_values)
-    for values, num_contigs in zip(cov_values, nums_contigs):
-        assembly_len = sum(values)
-        bases_by_cov = []
-        for coverage, bases in enumerate(values):
-            bases_by_cov.extend([coverage] * bases)
-        q1 = bases_by_cov[assembly_len // 4]
-        q2 = bases_by_cov[assembly_len // 2]
-        q3 = bases_by_cov[assembly_len * 3 // 4]
+    max_cov = max(len(cum_bases) for cum_bases in cum_cov_values)
+    for cum_bases, num_contigs in zip(cum_cov_values, nums_contigs):
+        assembly_len = cum_bases[-1]
+        # coverage of the base with the given index in the list of bases sorted by coverage
+        q1 = bisect_right(cum_bases, assembly_len // 4)
+        q2 = bisect_right(cum_bases, assembly_len // 2)
+        q3 = bisect_right(cum_bases, assembly_len * 3 // 4)
         iqr = q3 - q1
         low_thresholds.append(int(q2 - 1.5 * iqr))
         high_thresholds.append(int(q2 + 1.5 * iqr))
@@ -136,15 +171,16 @@ def binning_coverage(cov_values, nums_contigs):
         max_points -= offset
     else:
         low_threshold = 0
-    for index, values in enumerate(cov_values):
-        cov_by_bins.append([0] * int(max_points))
-        for coverage, bases in enumerate(values):
-            bin_idx = coverage // bin_size - offset
-            if coverage < low_threshold:
-                bin_idx = 0
-            elif coverage >= high_threshold:
-                bin_idx = max_points - 1
-            cov_by_bins[int(index)][int(bin_idx)] += bases
+    max_points = int(max_points)
+    for cum_bases in cum_cov_values:
+        bins = []
+        for bin_idx in range(max_points):
+            bin_start = (bin_idx + offset) * bin_size
+            bins.append(count_bases_in_coverage_range(cum_bases, max(bin_start, low_threshold),
+                                                      min(bin_start + bin_size, high_threshold)))
+        bins[0] += count_bases_in_coverage_range(cum_bases, 0, low_threshold)  # first bin
+        bins[-1] += count_bases_in_coverage_range(cum_bases, max(high_threshold, low_threshold))  # last bin
+        cov_by_bins.append(bins)
     return cov_by_bins, bin_size, low_threshold, high_threshold, max_cov
 
 
@@ -156,15 +192,17 @@ def draw_coverage_histograms(coverage_dict, contigs_fpaths, output_dirpath):
     for contigs_fpath in contigs_fpaths:
         total_len[contigs_fpath] = reporting.get(contigs_fpath).get_field(reporting.Fields.TOTALLEN)
         contigs_dict[contigs_fpath] = reporting.get(contigs_fpath).get_field(reporting.Fields.CONTIGS)
-    cov_values = [coverage_dict[contigs_fpath] for contigs_fpath in contigs_with_coverage]
+    cum_cov_values = dict((contigs_fpath, get_cumulative_coverage(coverage_dict[contigs_fpath]))
+                          for contigs_fpath in contigs_with_coverage)
     num_contigs = [contigs_dict[contigs_fpath] for contigs_fpath in contigs_with_coverage]
 
-    common_coverage_values, bin_size, low_threshold, high_threshold, max_cov = binning_coverage(cov_values, num_contigs)
+    common_coverage_values, bin_size, low_threshold, high_threshold, max_cov = \
+        binning_coverage([cum_cov_values[contigs_fpath] for contigs_fpath in contigs_with_coverage], num_contigs)
     histogram_title = 'Coverage histogram (bin size: ' + str(bin_size) + 'x)'
     plotter.coverage_histogram(contigs_with_coverage, common_coverage_values, output_dirpath + '/coverage_histogram',
                                histogram_title, bin_size=bin_size, max_cov=max_cov, low_threshold=low_threshold, high_threshold=high_threshold)
     for contigs_fpath in contigs_with_coverage:
-        coverage_values, bin_size, low_threshold, high_threshold, max_cov = binning_coverage([coverage_dict[contigs_fpath]],
+        coverage_values, bin_size, low_threshold, high_threshold, max_cov = binning_coverage([cum_cov_values[contigs_fpath]],
                                                                                              [contigs_dict[contigs_fpath]])
         label = qutils.label_from_fpath(contigs_fpath)
         corr_label = qutils.label_from_fpath_for_fname(contigs_fpath)
@@ -188,16 +226,17 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     icarus_gc_fpath = None
     circos_gc_fpath = None
     if ref_fpath:
-        reference_lengths = sorted(fastaparser.get_chr_lengths_from_fastafile(ref_fpath).values(), reverse=True)
+        ref_profile = reference_profile.get(ref_fpath)
+        reference_lengths = sorted(ref_profile.chr_lengths.values(), reverse=True)
         reference_fragments = len(reference_lengths)
         reference_length = sum(reference_lengths)
-        reference_GC, reference_GC_distribution, reference_GC_contigs_distribution = GC_content(ref_fpath)
+        reference_GC, reference_GC_distribution, reference_GC_contigs_distribution = reference_GC_content(ref_profile)
         if qconfig.create_icarus_html or qconfig.draw_plots:
             icarus_gc_fpath = join(output_dirpath, 'gc.icarus.txt')
-            save_icarus_GC(ref_fpath, icarus_gc_fpath)
+            save_icarus_GC(ref_profile, icarus_gc_fpath)
         if qconfig.draw_circos:
             circos_gc_fpath = join(output_dirpath, 'gc.circos.txt')
-            save_circos_GC(ref_fpath, reference_length, circos_gc_fpath)
+            save_circos_GC(ref_profile, reference_length, circos_gc_fpath)
 
         logger.info('  Reference genome:')
         logger.info('    ' + os.path.basename(ref_fpath) + ', length = ' + str(reference_length) +
@@ -275,17 +314,18 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
     list_of_GC_contigs_distributions = []
     largest_contig = 0
     from . import N50
-    for id, (contigs_fpath, lengths_list, number_of_Ns) in enumerate(zip(contigs_fpaths, lists_of_lengths, numbers_of_Ns)):
+    lists_of_nx_stats = [N50.NxStats(lengths_list, is_sorted=True) for lengths_list in lists_of_lengths]
+    for id, (contigs_fpath, lengths_list, nx_stats, number_of_Ns) in enumerate(zip(contigs_fpaths, lists_of_lengths, lists_of_nx_stats, numbers_of_Ns)):
         report = reporting.get(contigs_fpath)
-        n50, l50 = N50.N50_and_L50(lengths_list)
+        n50, l50 = nx_stats.N50_and_L50()
         ng50, lg50 = None, None
         if reference_length:
-            ng50, lg50 = N50.NG50_and_LG50(lengths_list, reference_length)
-        nx, lx = N50.N50_and_L50(lengths_list, qconfig.x_for_additional_Nx)
+            ng50, lg50 = nx_stats.NG50_and_LG50(reference_length)
+        nx, lx = nx_stats.N50_and_L50(qconfig.x_for_additional_Nx)
         ngx, lgx = None, None
         if reference_length:
-            ngx, lgx = N50.NG50_and_LG50(lengths_list, reference_length, qconfig.x_for_additional_Nx)
-        total_length = sum(lengths_list)
+            ngx, lgx = nx_stats.NG50_and_LG50(reference_length, qconfig.x_for_additional_Nx)
+        total_length = nx_stats.total_length
         total_GC, GC_distribution, GC_contigs_distribution = GC_content(contigs_fpath, skip=qconfig.no_gc)
         list_of_GC_distributions.append(GC_distribution)
         list_of_GC_contigs_distributions.append(GC_contigs_distribution)
@@ -339,15 +379,15 @@ def do(ref_fpath, contigs_fpaths, output_dirpath, results_dir):
 
     ########################################################################
     # Drawing Nx and NGx plots...
-    plotter.Nx_plot(results_dir, num_contigs > qconfig.max_points, contigs_fpaths, lists_of_lengths, join(output_dirpath, 'Nx_plot'), 'Nx', [])
+    plotter.Nx_plot(results_dir, num_contigs > qconfig.max_points, contigs_fpaths, lists_of_nx_stats, join(output_dirpath, 'Nx_plot'), 'Nx', [])
     if reference_length and not qconfig.is_combined_ref:
-        plotter.Nx_plot(results_dir, num_contigs > qconfig.max_points, contigs_fpaths, lists_of_lengths, join(output_dirpath, 'NGx_plot'), 'NGx',
+        plotter.Nx_plot(results_dir, num_contigs > qconfig.max_points, contigs_fpaths, lists_of_nx_stats, join(output_dirpath, 'NGx_plot'), 'NGx',
                         [reference_length for i in range(len(contigs_fpaths))])
 
     if qconfig.draw_plots:
         ########################################################################import plotter
         # Drawing cumulative plot...
-        plotter.cumulative_plot(ref_fpath, contigs_fpaths, lists_of_lengths, join(output_dirpath, 'cumulative_plot'), 'Cumulative length')
+        plotter.cumulative_plot(ref_fpath, contigs_fpaths, lists_of_nx_stats, join(output_dirpath, 'cumulative_plot'), 'Cumulative length')
         if not qconfig.no_gc:
             ########################################################################
             # Drawing GC content plot...
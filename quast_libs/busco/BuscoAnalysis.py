@@ -19,6 +19,8 @@ import os
 from quast_libs.busco.pipebricks.PipeHelper import Analysis
 from quast_libs.busco.pipebricks.PipeLogger import PipeLogger
 from quast_libs.busco.pipebricks.Toolset import Tool
+from quast_libs import index_cache
+from quast_libs.qutils import get_path_to_program
 import random
 import subprocess
 from collections import deque
@@ -91,6 +93,7 @@ class BuscoAnalysis(Analysis):
         self._ev_cutoff = config.getfloat('busco', 'evalue')
         self._region_limit = config.getint('busco', 'limit')
         self._has_variants_file = False
+        self._blast_db = None  # path prefix of the BLAST database of the input sequences
         self._missing_busco_list = []
         self._fragmented_busco_list = []
         # -- end --
@@ -841,16 +844,31 @@ class BuscoAnalysis(Analysis):
         if not missing_and_frag_only:
 
             BuscoAnalysis._logger.info('Create blast database...')
-            blast_job = self._mkblast.create_job(BuscoAnalysis._logger)
 
-            blast_job.add_parameter('-in')
-            blast_job.add_parameter('%s' % self._sequences)
-            blast_job.add_parameter('-dbtype')
-            blast_job.add_parameter('nucl')
-            blast_job.add_parameter('-out')
-            blast_job.add_parameter('%s%s%s' % (self._tmp, self._out, self._random))
-
-            self._mkblast.run_jobs(self._cpus, BuscoAnalysis._logger)
+            def build_blast_db(db_prefix):
+                blast_job = self._mkblast.create_job(BuscoAnalysis._logger)
+
+                blast_job.add_parameter('-in')
+                blast_job.add_parameter('%s' % self._sequences)
+                blast_job.add_parameter('-dbtype')
+                blast_job.add_parameter('nucl')
+                blast_job.add_parameter('-out')
+                blast_job.add_parameter(db_prefix)
+
+                self._mkblast.run_jobs(self._cpus, BuscoAnalysis._logger)
+                db_dirpath, db_name = os.path.split(db_prefix)
+                return any(fname.startswith(db_name + '.') for fname in os.listdir(db_dirpath or '.'))
+
+            # the database is taken from the shared index cache if it is enabled
+            db_prefix = '%s%s%s' % (self._tmp, self._out, self._random)
+            mkblast_dirpath, mkblast_name = os.path.split(self._mkblast.cmd[0])
+            mkblast_fpath = get_path_to_program(mkblast_name, mkblast_dirpath or None)
+            if mkblast_fpath:  # the cache entry is keyed by the checksum of the tool binary
+                self._blast_db = index_cache.get_index(mkblast_fpath, self._sequences, ['-dbtype', 'nucl'],
+                                                       build_blast_db, db_prefix, link=False) or db_prefix
+            else:
+                build_blast_db(db_prefix)
+                self._blast_db = db_prefix
 
             if not os.path.exists('%sblast_output' % self.mainout):
                 os.makedirs('%sblast_output' % self.mainout)
@@ -872,7 +890,7 @@ class BuscoAnalysis(Analysis):
         tblastn_job.add_parameter('-query')
         tblastn_job.add_parameter(query_file)
         tblastn_job.add_parameter('-db')
-        tblastn_job.add_parameter('%s%s%s' % (self._tmp, self._out, self._random))
+        tblastn_job.add_parameter(self._blast_db or '%s%s%s' % (self._tmp, self._out, self._random))
         tblastn_job.add_parameter('-out')
         tblastn_job.add_parameter('%sblast_output/tblastn_%s%s.tsv' % (self.mainout, self._out, output_suffix))
         tblastn_job.add_parameter('-outfmt')
@@ -12,16 +12,20 @@ import os
 from os.path import isfile
 import datetime
 
-from quast_libs import qconfig, qutils
+from quast_libs import qconfig, qutils, index_cache
+from quast_libs.ca_utils import mappy_aligner
+from quast_libs.ca_utils.alignment_store import AlignmentsWriter, get_store_fpath
 from quast_libs.ca_utils.analyze_misassemblies import Mapping
 from quast_libs.ca_utils.misc import minimap_fpath, parse_cs_tag
 
 from quast_libs.log import get_logger
 from quast_libs.qconfig import SPLIT_ALIGN_THRESHOLD
-from quast_libs.qutils import md5, is_non_empty_file
+from quast_libs.qutils import checksum
 
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+_minimap_indexes = dict()  # (reference fpath, preset) -> path to minimap2 index in the index cache
+
 
 class AlignerStatus:
     FAILED = 0
@@ -32,8 +36,8 @@ class AlignerStatus:
 
 def create_successful_check(fpath, contigs_fpath, ref_fpath):
     successful_check_file = open(fpath, 'w')
-    successful_check_file.write("Assembly md5 checksum: %s\n" % md5(contigs_fpath))
-    successful_check_file.write("Reference md5 checksum: %s\n" % md5(ref_fpath))
+    successful_check_file.write("Assembly checksum: %s\n" % checksum(contigs_fpath))
+    successful_check_file.write("Reference checksum: %s\n" % checksum(ref_fpath))
     successful_check_file.write("Successfully finished on " +
                                        datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S') + '\n')
     successful_check_file.close()
@@ -43,25 +47,22 @@ def check_successful_check(fpath, contigs_fpath, ref_fpath):
     successful_check_content = open(fpath).read().split('\n')
     if len(successful_check_content) < 2:
         return False
-    if successful_check_content[0].strip().split()[-1] != str(md5(contigs_fpath)):
+    if successful_check_content[0].strip().split()[-1] != checksum(contigs_fpath):
         return False
-    if successful_check_content[1].strip().split()[-1] != str(md5(ref_fpath)):
+    if successful_check_content[1].strip().split()[-1] != checksum(ref_fpath):
         return False
     return True
 
 
-def run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):  # run minimap2 for AGB
+def get_minimap_agb_options():  # options of minimap2 for AGB
     mask_level = '1' if qconfig.min_IDY < 95 else '0.9'
-    cmdline = [minimap_fpath(), '-cx', 'asm20', '--mask-level', mask_level, '-N', '100',
-               '--score-N', '0', '-E', '1,0', '-f', '200', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
-    return_code = qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'),
-                                         indent='  ' + qutils.index_to_str(index))
-    return return_code
+    return ['-cx', 'asm20', '--mask-level', mask_level, '-N', '100',
+            '--score-N', '0', '-E', '1,0', '-f', '200', '--cs']
 
 
-def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads):
+def get_minimap_options():
     if qconfig.is_agb_mode:
-        return run_minimap_agb(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads)
+        return get_minimap_agb_options()
 
     if qconfig.min_IDY < 90:
         preset = 'asm20'
@@ -75,12 +76,64 @@ def run_minimap(out_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_t
     num_alignments = '100' if qconfig.is_combined_ref else '50'
     additional_options = ['-B5', '-O4,16', '--no-long-join', '-r', str(qconfig.MAX_INDEL_LENGTH),
                           '-N', num_alignments, '-s', str(qconfig.min_alignment), '-z', '200']
-    cmdline = [minimap_fpath(), '-c', '-x', preset] + (additional_options if not qconfig.large_genome else []) + \
-              ['--mask-level', mask_level, '--min-occ', '200', '-g', '2500', '--score-N', '2', '--cs', '-t', str(max_threads), ref_fpath, contigs_fpath]
-    return_code = qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'),
-                                         indent='  ' + qutils.index_to_str(index))
+    return ['-c', '-x', preset] + (additional_options if not qconfig.large_genome else []) + \
+           ['--mask-level', mask_level, '--min-occ', '200', '-g', '2500', '--score-N', '2', '--cs']
+
+
+def get_minimap_cmdline(ref_fpath, contigs_fpath, max_threads):
+    return [minimap_fpath()] + get_minimap_options() + ['-t', str(max_threads), ref_fpath, contigs_fpath]
+
+
+def get_minimap_preset(minimap_options):
+    for i, option in enumerate(minimap_options):
+        if option in ('-x', '-cx'):
+            return minimap_options[i + 1]
+
+
+def prepare_minimap_index(ref_fpath, max_threads):
+    """
+        Returns the path to minimap2 index (.mmi) of the reference from the index cache
+        or ref_fpath if the index cache is not used (then minimap2 builds the index itself)
+    """
+    if not index_cache.get_cache_dirpath():
+        return ref_fpath
+    preset = get_minimap_preset(get_minimap_options())
+    key = (ref_fpath, preset)
+    if key not in _minimap_indexes:
+        def build_index(index_fpath):
+            cmdline = [minimap_fpath(), '-x', preset, '-t', str(max_threads), '-d', index_fpath, ref_fpath]
+            return qutils.call_subprocess(cmdline, stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w')) == 0
 
-    return return_code
+        index_fpath = index_cache.get_index(minimap_fpath(), ref_fpath, ['-x', preset], build_index, None, link=False)
+        _minimap_indexes[key] = index_fpath or ref_fpath
+    return _minimap_indexes[key]
+
+
+def prepare_mappy_aligner(ref_fpath, max_threads):
+    """
+        Builds the reference index for in-process alignment, it is shared by all assemblies
+        Returns None if mappy is not available
+    """
+    return mappy_aligner.get_aligner(ref_fpath, get_minimap_options(), max_threads)
+
+
+def run_minimap(coords_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, max_threads, raw_coords_fpath=None):
+    """
+        minimap2 output is parsed into coords_fpath while minimap2 is running.
+        Raw output is saved only if raw_coords_fpath is specified.
+        Returns the return code of minimap2 and the number of lines in its output
+    """
+    def parse_minimap_stdout(minimap_stdout):
+        return parse_minimap_output(minimap_stdout, coords_fpath, raw_coords_fpath)
+
+    if qconfig.use_mappy:
+        aligner = prepare_mappy_aligner(ref_fpath, max_threads)
+        if aligner is not None:
+            return mappy_aligner.align(aligner, contigs_fpath, max_threads, parse_minimap_stdout, log_err_fpath)
+
+    cmdline = get_minimap_cmdline(prepare_minimap_index(ref_fpath, max_threads), contigs_fpath, max_threads)
+    return qutils.call_subprocess_with_handler(cmdline, parse_minimap_stdout, stderr=open(log_err_fpath, 'a'),
+                                               indent='  ' + qutils.index_to_str(index))
 
 
 def get_aux_out_fpaths(fname):
@@ -91,12 +144,22 @@ def get_aux_out_fpaths(fname):
     return coords_fpath, coords_filtered_fpath, unaligned_fpath, used_snps_fpath
 
 
-def parse_minimap_output(raw_coords_fpath, coords_fpath):
+def parse_minimap_output(raw_coords, coords_fpath, raw_coords_fpath=None):
+    """
+        Takes minimap2 output (any iterable of lines), writes alignments to coords_fpath (and its binary store)
+        and, optionally, raw lines to raw_coords_fpath
+        Returns the number of lines in minimap2 output
+    """
     cigar_pattern = re.compile(r'(\d+[M=XIDNSH])')
 
-    with open(raw_coords_fpath) as f:
-        with open(coords_fpath, 'w') as coords_file:
-            for line in f:
+    lines_num = 0
+    raw_coords_file = open(raw_coords_fpath, 'w') if raw_coords_fpath else None
+    try:
+        with AlignmentsWriter(coords_fpath) as coords_file:
+            for line in raw_coords:
+                lines_num += 1
+                if raw_coords_file:
+                    raw_coords_file.write(line)
                 fs = line.split('\t')
                 if len(fs) < 10:
                     continue
@@ -137,14 +200,18 @@ def parse_minimap_output(raw_coords_fpath, coords_fpath):
                 align_end = align_start + (align_len - 1) * strand_direction
                 ref_end = ref_start + ref_len - 1
 
-                idy = '%.2f' % (matched_bases * 100.0 / bases_in_mapping)
+                idy = round(matched_bases * 100.0 / bases_in_mapping, 2)
                 if ref_name != "*":
-                    if float(idy) >= qconfig.min_IDY:
+                    if idy >= qconfig.min_IDY:
                         align = Mapping(s1=ref_start, e1=ref_end, s2=align_start, e2=align_end, len1=ref_len,
                                         len2=align_len, idy=idy, ref=ref_name, contig=contig, cigar=cs)
-                        coords_file.write(align.coords_str() + '\n')
+                        coords_file.write(align)
                     else:
                         split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs)
+    finally:
+        if raw_coords_file:
+            raw_coords_file.close()
+    return lines_num
 
 
 def split_align(coords_file, align_start, strand_direction, ref_start, ref_name, contig, cs):
@@ -153,9 +220,9 @@ def split_align(coords_file, align_start, strand_direction, ref_start, ref_name,
             return
         align.e1 = align.s1 + align.len1 - 1
         align.e2 = align.s2 + (align.len2 - 1) * strand_direction
-        align.idy = '%.2f' % (matched_bases * 100.0 / max(align.len1, align.len2))
-        if float(align.idy) >= qconfig.min_IDY:
-            coords_file.write(align.coords_str() + '\n')
+        align.idy = round(matched_bases * 100.0 / max(align.len1, align.len2), 2)
+        if align.idy >= qconfig.min_IDY:
+            coords_file.write(align)
 
     def _try_split(matched_bases, prev_op, n_refbases=0, n_alignbases=0):
         ## split alignment in positions of indels or stretch of mismatches to get smaller alignments with higher identity
@@ -210,10 +277,13 @@ def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_cont
         _, coords_to_reuse_fname, _, _ = get_aux_out_fpaths(os.path.basename(out_basename))
         coords_to_reuse_fpath = os.path.join(qconfig.alignments_for_reuse_dirpath, coords_to_reuse_fname)
         if isfile(coords_to_reuse_fpath):
-            # symlink coords.filtered from combined_reference stage to coords in the current run
-            if isfile(output_fpath):
-                os.remove(output_fpath)
-            os.symlink(os.path.relpath(coords_to_reuse_fpath, os.path.dirname(output_fpath)), output_fpath)
+            # symlink coords.filtered (and its binary store) from combined_reference stage to coords in the current run
+            for fpath_to_reuse, fpath in [(coords_to_reuse_fpath, output_fpath),
+                                          (get_store_fpath(coords_to_reuse_fpath), get_store_fpath(output_fpath))]:
+                if os.path.lexists(fpath):
+                    os.remove(fpath)
+                if isfile(fpath_to_reuse):
+                    os.symlink(os.path.relpath(fpath_to_reuse, os.path.dirname(fpath)), fpath)
             log_out_f.write('\tReusing alignments from the combined_reference stage...\n')
             logger.info('  ' + qutils.index_to_str(index) + 'Reusing alignments from the combined_reference stage... ')
             return AlignerStatus.OK
@@ -230,18 +300,16 @@ def align_contigs(output_fpath, out_basename, ref_fpath, contigs_fpath, old_cont
     log_out_f.write('\tAligning contigs to the reference\n')
     logger.info('  ' + qutils.index_to_str(index) + 'Aligning contigs to the reference')
 
-    tmp_output_fpath = output_fpath + '_tmp'
-    exit_code = run_minimap(tmp_output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads)
-    if exit_code != 0:
-        return AlignerStatus.ERROR
-
-    if not isfile(tmp_output_fpath):
-        return AlignerStatus.FAILED
-    if not is_non_empty_file(tmp_output_fpath):
-        return AlignerStatus.NOT_ALIGNED
+    raw_output_fpath = output_fpath + '_tmp'  # raw minimap2 output (PAF) is saved along with parsed alignments
+    exit_code, raw_lines_num = run_minimap(output_fpath, ref_fpath, contigs_fpath, log_err_fpath, index, threads,
+                                           raw_coords_fpath=raw_output_fpath)
+    if exit_code != 0 or not raw_lines_num:
+        for fpath in [output_fpath, get_store_fpath(output_fpath)]:
+            if isfile(fpath):
+                os.remove(fpath)
+        return AlignerStatus.ERROR if exit_code != 0 else AlignerStatus.NOT_ALIGNED
 
     create_successful_check(successful_check_fpath, old_contigs_fpath, ref_fpath)
     log_out_f.write('Filtering alignments...\n')
-    parse_minimap_output(tmp_output_fpath, output_fpath)
     return AlignerStatus.OK
 
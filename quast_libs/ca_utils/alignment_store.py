@@ -0,0 +1,224 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Binary store of alignments written next to .coords and .coords.filtered files.
+# Integer columns, identities, ids of reference and contig names (interned in name tables) and
+# an offset-indexed blob of cs tags are packed with array, the store is memory-mapped by readers.
+# Text files are still written for users, readers fall back to them if the store is missing or out of date.
+#
+############################################################################
+
+from __future__ import with_statement
+import mmap
+import os
+import struct
+from array import array
+from os.path import isfile
+
+from quast_libs.ca_utils.analyze_misassemblies import Mapping
+from quast_libs.qutils import is_python2
+
+STORE_EXT = '.bin'
+MAGIC = b'QALN'
+VERSION = 1
+BYTE_ORDER_MARK = 0x01020304
+try:
+    INT_TYPECODE = array('q').typecode
+except ValueError:  # Python 2
+    INT_TYPECODE = 'l'
+INT_COLUMNS = ['s1', 'e1', 's2', 'e2', 'len1', 'len2']
+# magic, version, byte order mark, size of integers, number of alignments, size and mtime of the text file,
+# sizes of blobs of reference names, contig names and cs tags
+HEADER = struct.Struct('=4sHIHqqqqqq')
+ALIGNMENT = 8
+
+
+def get_store_fpath(coords_fpath):
+    return coords_fpath + STORE_EXT
+
+
+def _get_mtime_ns(fpath):
+    file_stat = os.stat(fpath)
+    return getattr(file_stat, 'st_mtime_ns', None) or int(file_stat.st_mtime * 1e9)
+
+
+def _padding(size):
+    return -size % ALIGNMENT
+
+
+def _encode(text):
+    return text if is_python2() else text.encode('utf-8')
+
+
+def _decode(data):
+    return data if is_python2() else data.decode('utf-8')
+
+
+class AlignmentsWriter(object):
+    """
+        Writes alignments (Mapping objects) to a text coords file and to the binary store next to it.
+        Identities are written to the text file in idy_fmt format
+    """
+    def __init__(self, coords_fpath, idy_fmt='%.2f'):
+        self.coords_fpath = coords_fpath
+        self.idy_fmt = idy_fmt
+        self.coords_file = open(coords_fpath, 'w')
+        self.int_columns = [array(INT_TYPECODE) for _ in INT_COLUMNS]
+        self.idy = array('d')
+        self.ref_ids = array('i')
+        self.contig_ids = array('i')
+        self.ambiguous = array('b')
+        self.cs_ends = array(INT_TYPECODE)
+        self.cs_tags = []
+        self.cs_len = 0
+        self.names_ids = [dict(), dict()]  # reference names and contig names -> ids
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_name_id(self, names_ids, name):
+        if name not in names_ids:
+            names_ids[name] = len(names_ids)
+        return names_ids[name]
+
+    def write(self, mapping, ambiguous=False):
+        self.coords_file.write(mapping.coords_str(self.idy_fmt) + (' ambiguous\n' if ambiguous else '\n'))
+        for column, value in zip(self.int_columns, (mapping.s1, mapping.e1, mapping.s2, mapping.e2, mapping.len1, mapping.len2)):
+            column.append(value)
+        self.idy.append(mapping.idy)
+        self.ref_ids.append(self._get_name_id(self.names_ids[0], mapping.ref))
+        self.contig_ids.append(self._get_name_id(self.names_ids[1], mapping.contig))
+        self.ambiguous.append(int(ambiguous))
+        cs_tag = _encode(mapping.cigar or '')
+        self.cs_tags.append(cs_tag)
+        self.cs_len += len(cs_tag)
+        self.cs_ends.append(self.cs_len)
+
+    def close(self):
+        self.coords_file.close()
+        store_fpath = get_store_fpath(self.coords_fpath)
+        tmp_store_fpath = store_fpath + '.tmp'
+        names_blobs = [_encode('\n'.join(sorted(names_ids, key=names_ids.get))) for names_ids in self.names_ids]
+        with open(tmp_store_fpath, 'wb') as store_file:
+            store_file.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDER_MARK, array(INT_TYPECODE).itemsize, len(self.idy),
+                                         os.path.getsize(self.coords_fpath), _get_mtime_ns(self.coords_fpath),
+                                         len(names_blobs[0]), len(names_blobs[1]), self.cs_len))
+            store_file.write(b'\0' * _padding(HEADER.size))
+            for column in self.int_columns + [self.idy, self.ref_ids, self.contig_ids, self.ambiguous, self.cs_ends]:
+                column.tofile(store_file)
+                store_file.write(b'\0' * _padding(column.itemsize * len(column)))
+            for blob in names_blobs:
+                store_file.write(blob)
+                store_file.write(b'\0' * _padding(len(blob)))
+            for cs_tag in self.cs_tags:
+                store_file.write(cs_tag)
+        os.rename(tmp_store_fpath, store_fpath)
+
+
+class AlignmentStore(object):
+    """
+        Memory-mapped alignments: columns s1, e1, s2, e2, len1, len2, idy, ref_ids, contig_ids, ambiguous,
+        name tables refs and contigs, cs tags are decoded on request
+    """
+    def __init__(self, store_fpath):
+        with open(store_fpath, 'rb') as store_file:
+            self._mm = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        magic, version, byte_order_mark, int_size, self.size, self.text_size, self.text_mtime_ns, \
+            refs_len, contigs_len, cs_len = HEADER.unpack(self._mm[:HEADER.size])
+        if (magic, version, byte_order_mark, int_size) != (MAGIC, VERSION, BYTE_ORDER_MARK, array(INT_TYPECODE).itemsize):
+            self.close()
+            raise ValueError('Unsupported alignment store ' + store_fpath)
+        self._offset = HEADER.size + _padding(HEADER.size)
+        for name in INT_COLUMNS:
+            setattr(self, name, self._read_column(INT_TYPECODE))
+        self.idy = self._read_column('d')
+        self.ref_ids = self._read_column('i')
+        self.contig_ids = self._read_column('i')
+        self.ambiguous = self._read_column('b')
+        self.cs_ends = self._read_column(INT_TYPECODE)
+        self.refs = self._read_names(refs_len)
+        self.contigs = self._read_names(contigs_len)
+        self._cs_offset = self._offset
+        if self._cs_offset + cs_len != len(self._mm):
+            self.close()
+            raise ValueError('Truncated alignment store ' + store_fpath)
+
+    def _read_column(self, typecode):
+        size = array(typecode).itemsize * self.size
+        start = self._offset
+        self._offset += size + _padding(size)
+        if hasattr(memoryview, 'cast'):
+            column = memoryview(self._mm)[start:start + size].cast(typecode)
+            self._views.append(column)
+        else:
+            column = array(typecode)
+            column.fromstring(self._mm[start:start + size])
+        return column
+
+    def _read_names(self, size):
+        start = self._offset
+        self._offset += size + _padding(size)
+        return _decode(self._mm[start:start + size]).split('\n') if size else []
+
+    def __len__(self):
+        return self.size
+
+    def cigar(self, i):
+        start = self.cs_ends[i - 1] if i else 0
+        return _decode(self._mm[self._cs_offset + start:self._cs_offset + self.cs_ends[i]])
+
+    def mapping(self, i):
+        return Mapping(self.s1[i], self.e1[i], self.s2[i], self.e2[i], self.len1[i], self.len2[i], self.idy[i],
+                       self.refs[self.ref_ids[i]], self.contigs[self.contig_ids[i]], self.cigar(i))
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.mapping(i)
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._mm.close()
+
+
+def load_alignments(coords_fpath):
+    """
+        Returns AlignmentStore of the coords file or None if the store is missing or does not match the file
+    """
+    store_fpath = get_store_fpath(coords_fpath)
+    if not isfile(store_fpath) or not isfile(coords_fpath):
+        return None
+    try:
+        store = AlignmentStore(store_fpath)
+    except (IOError, OSError, ValueError, struct.error):
+        return None
+    if (store.text_size, store.text_mtime_ns) != (os.path.getsize(coords_fpath), _get_mtime_ns(coords_fpath)):
+        store.close()
+        return None
+    return store
+
+
+def iter_mappings(coords_fpath):
+    """
+        Generator of alignments (Mapping objects) of the coords file, the text file is parsed only if there is no store
+    """
+    store = load_alignments(coords_fpath)
+    if store is None:
+        with open(coords_fpath) as coords_file:
+            for line in coords_file:
+                yield Mapping.from_line(line)
+        return
+    try:
+        for mapping in store:
+            yield mapping
+    finally:
+        store.close()
@@ -47,6 +47,8 @@ class StructuralVariations(object):
 
 
 class Mapping(object):
+    __slots__ = ('s1', 'e1', 's2', 'e2', 'len1', 'len2', 'idy', 'ref', 'contig', 'cigar', 'ns_pos', 'sv_type')
+
     def __init__(self, s1, e1, s2=None, e2=None, len1=None, len2=None, idy=None, ref=None, contig=None, cigar=None, ns_pos=None, sv_type=None):
         self.s1, self.e1, self.s2, self.e2, self.len1, self.len2, self.idy, self.ref, self.contig = s1, e1, s2, e2, len1, len2, idy, ref, contig
         self.cigar = cigar
@@ -70,9 +72,9 @@ class Mapping(object):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2, '|',
                                          self.idy, '|', self.ref, self.contig])
 
-    def coords_str(self):
+    def coords_str(self, idy_fmt='%.2f'):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2, '|',
-                                         self.idy, '|', self.ref, self.contig, '|', self.cigar])
+                                         idy_fmt % self.idy, '|', self.ref, self.contig, '|', self.cigar])
 
     def short_str(self):
         return ' '.join(str(x) for x in [self.s1, self.e1, '|', self.s2, self.e2, '|', self.len1, self.len2])
@@ -329,6 +331,7 @@ def check_is_scaffold_gap(inconsistency, contig_seq, align1, align2):
 
 def exclude_internal_overlaps(align1, align2, i=None):
     # returns size of align1.len2 decrease (or 0 if not changed). It is important for cur_aligned_len calculation
+    # and the message about the modification (only if the alignment index i is specified)
     def __shift_cigar(align, new_start=None, new_end=None):
         new_cigar = 'cs:Z:'
         ctg_pos = align.s2
@@ -382,7 +385,7 @@ def exclude_internal_overlaps(align1, align2, i=None):
         return diff_len
 
     def __shift_start(align, new_start, diff_len):
-        align_modification = '%s' % align.short_str()
+        align_modification = '%s' % align.short_str() if i is not None else ''
         if align.s2 < align.e2:
             align.s1 += (new_start - align.s2) - diff_len
             align.s2 = new_start
@@ -392,11 +395,12 @@ def exclude_internal_overlaps(align1, align2, i=None):
             align.e2 = new_start
             align.len2 = align.s2 - align.e2 + 1
         align.len1 = align.e1 - align.s1 + 1
-        align_modification += ' --> %s\n' % align.short_str()
+        if i is not None:
+            align_modification += ' --> %s\n' % align.short_str()
         return align_modification
 
     def __shift_end(align, new_end, diff_len):
-        align_modification = '%s' % align.short_str()
+        align_modification = '%s' % align.short_str() if i is not None else ''
         if align.s2 < align.e2:
             align.e1 -= (align.e2 - new_end) - diff_len
             align.e2 = new_end
@@ -406,7 +410,8 @@ def exclude_internal_overlaps(align1, align2, i=None):
             align.s2 = new_end
             align.len2 = align.s2 - align.e2 + 1
         align.len1 = align.e1 - align.s1 + 1
-        align_modification += ' --> %s\n' % align.short_str()
+        if i is not None:
+            align_modification += ' --> %s\n' % align.short_str()
         return align_modification
 
     distance_on_contig = align2.start() - align1.end() - 1
@@ -426,6 +431,21 @@ def exclude_internal_overlaps(align1, align2, i=None):
     return prev_len2 - align1.len2, overlap_msg
 
 
+def get_aligns_without_overlap(align1, align2):
+    """
+        Non-mutating version of exclude_internal_overlaps: returns align1, align2 and the size of align1.len2 decrease.
+        Only the alignment shortened by the overlap excluding is copied, the other one is returned as is
+    """
+    if align2.start() - align1.end() - 1 >= 0:  # no overlap
+        return align1, align2, 0
+    if align1.len2 >= align2.len2:
+        align2 = align2.clone()
+    else:
+        align1 = align1.clone()
+    reduced_len, _ = exclude_internal_overlaps(align1, align2)
+    return align1, align2, reduced_len
+
+
 def count_ns_and_not_ns_between_aligns(contig_seq, align1, align2):
     gap_in_contig = contig_seq[align1.end(): align2.start() - 1]
     ns_count = gap_in_contig.count('N')
@@ -499,7 +519,7 @@ def process_misassembled_contig(sorted_aligns, is_cyclic, aligned_lengths, regio
         ca_output.stdout_f.write('\t\t\tReal Alignment %d: %s\n' % (i+1, str(prev_align)))
 
         ref_aligns.setdefault(prev_align.ref, []).append(prev_align)
-        ca_output.coords_filtered_f.write(prev_align.coords_str() + '\n')
+        ca_output.coords_filtered_f.write(prev_align)
         prev_ref, next_ref = get_ref_by_chromosome(prev_align.ref), get_ref_by_chromosome(next_align.ref)
         if aux_data["is_sv"]:
             ca_output.stdout_f.write('\t\t\t  Not a misassembly (structural variation of the genome) between these two alignments\n')
@@ -623,7 +643,7 @@ def process_misassembled_contig(sorted_aligns, is_cyclic, aligned_lengths, regio
     ca_output.stdout_f.write('\t\t\tReal Alignment %d: %s' % (i + 1, str(next_align)) + '\n')
     ca_output.icarus_out_f.write(next_align.icarus_report_str() + '\n')
     ref_aligns.setdefault(next_align.ref, []).append(next_align)
-    ca_output.coords_filtered_f.write(next_align.coords_str() + '\n')
+    ca_output.coords_filtered_f.write(next_align)
 
     contig_aligned_lengths.append(cur_aligned_length)
     contig_aligned_length = sum(contig_aligned_lengths)
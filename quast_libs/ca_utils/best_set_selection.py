@@ -5,13 +5,11 @@
 # See file LICENSE for details.
 ############################################################################
 
+from bisect import bisect_left, insort
 from heapq import heappush, heappop
-try:
-   from collections import OrderedDict
-except ImportError:
-   from quast_libs.site_packages.ordered_dict import OrderedDict
+
 from quast_libs import qconfig
-from quast_libs.ca_utils.analyze_misassemblies import is_misassembly, exclude_internal_overlaps, Misassembly, \
+from quast_libs.ca_utils.analyze_misassemblies import is_misassembly, get_aligns_without_overlap, Misassembly, \
     is_fragmented_ref_fake_translocation
 from quast_libs.ca_utils.misc import is_same_reference
 
@@ -23,6 +21,62 @@ class ScoredSet(object):
         self.uncovered = uncovered
 
 
+class SetAlignsView(object):
+    """
+        Alignments of a scored set extended with a new alignment (supports negative indexing only).
+        The last alignments (the tail) can be replaced with their versions without internal overlaps,
+        the rest are taken from sorted_aligns as is.
+    """
+    tail_len = 3  # the number of the last alignments that can be modified by internal overlaps excluding
+
+    def __init__(self, sorted_aligns, indexes, new_align, tail=None):
+        self.sorted_aligns = sorted_aligns
+        self.indexes = indexes
+        if tail is None:
+            tail = [sorted_aligns[i] for i in indexes[-(self.tail_len - 1):]] + [new_align]
+        self.tail = tail
+
+    def with_tail(self, tail):
+        return SetAlignsView(self.sorted_aligns, self.indexes, None, tail=self.tail[:-len(tail)] + tail)
+
+    def __len__(self):
+        return len(self.indexes) + 1
+
+    def __getitem__(self, idx):
+        if -idx <= len(self.tail):
+            return self.tail[idx]
+        return self.sorted_aligns[self.indexes[idx + 1]]
+
+
+class ScoredSetsIndex(object):
+    """
+        Static max-tree over the scores of scored sets (in the order of their last alignments).
+        Used for enumerating the sets preceding the given alignment from the best score to the worst.
+    """
+    def __init__(self, scored_sets):
+        self.size = 1
+        while self.size < len(scored_sets):
+            self.size *= 2
+        self.tree = [float('-inf')] * (2 * self.size)
+        for pos, scored_set in enumerate(scored_sets):
+            self.tree[self.size + pos] = scored_set.score
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def iter_by_score(self, prefix_len):
+        # yields positions of the sets [0, prefix_len) in non-increasing order of their scores
+        nodes = [(-self.tree[1], 1, 0, self.size)]
+        while nodes:
+            _, node, start, end = heappop(nodes)
+            if node >= self.size:
+                yield start
+                continue
+            middle = (start + end) // 2
+            heappush(nodes, (-self.tree[2 * node], 2 * node, start, middle))
+            if middle < prefix_len:
+                heappush(nodes, (-self.tree[2 * node + 1], 2 * node + 1, middle, end))
+
+
 class PutativeBestSet(object):
     def __init__(self, indexes, score_drop, uncovered):
         self.indexes = indexes
@@ -173,8 +227,12 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
             stdout_f.write('\t\tNothing was skipped\n')
 
     # Stage 1: Dynamic programming for finding the best score
+    # Scored sets are stored in the order of their last alignments, the sets preceding the current alignment
+    # are checked from the best score to the worst until no one can beat the best found transition
     stdout_f.write('\t\t\tLooking for the best set of alignments (out of %d total alignments)\n' % len(sorted_aligns))
     all_scored_sets = [ScoredSet(0, [], ctg_len)]
+    last_indexes = [-1]
+    sets_by_score = [(0, 0)]  # (-score, -position in all_scored_sets)
     max_score = 0
 
     cur_solid_idx = -1
@@ -183,42 +241,46 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
     for idx, align in enumerate(sorted_aligns):
         local_max_score = 0
         new_scored_set = None
+        new_set_pos = None
         if solids and align == solids[-1]:
             next_solid_idx = idx
             del solids[-1]
-        for scored_set in reversed(all_scored_sets):
-            if scored_set.indexes and scored_set.indexes[-1] < cur_solid_idx:
+        # sets ending before the current solid alignment are not allowed (the empty set is allowed only if all others are)
+        first_allowed_pos = bisect_left(last_indexes, cur_solid_idx, 1)
+        if first_allowed_pos == 1:
+            first_allowed_pos = 0
+        max_score_gain = get_max_score_gain(align)
+        for neg_score, neg_pos in sets_by_score:
+            if -neg_score + max_score_gain < local_max_score:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
-            score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
-                                         seq, region_struct_variations, penalties)
+            pos = -neg_pos
+            if pos < first_allowed_pos:
+                continue
+            scored_set = all_scored_sets[pos]
+            score, uncovered = get_score(scored_set.score, SetAlignsView(sorted_aligns, scored_set.indexes, align),
+                                         ref_lens, is_cyclic, scored_set.uncovered, seq, region_struct_variations, penalties)
             if score is None:  # incorrect set, i.e. internal overlap excluding resulted in incorrectly short alignment
                 continue
-            if score > local_max_score:
+            # in case of equal scores the set with the latest last alignment is preferred
+            if score > local_max_score or (new_scored_set and score == local_max_score and pos > new_set_pos):
                 local_max_score = score
+                new_set_pos = pos
                 new_scored_set = ScoredSet(score, scored_set.indexes + [idx], uncovered)
         if new_scored_set:
+            insort(sets_by_score, (-local_max_score, -len(all_scored_sets)))
             all_scored_sets.append(new_scored_set)
+            last_indexes.append(idx)
             if local_max_score > max_score:
                 max_score = local_max_score
         if next_solid_idx != cur_solid_idx:
             cur_solid_idx = next_solid_idx
 
     # Stage 2: DFS for finding multiple best sets with almost equally good score
-
-    ## special case for speed up (when we really not very interested in whether the contig is ambiguous or not)
-    if len(sorted_aligns) > qconfig.BSS_critical_number_of_aligns and qconfig.ambiguity_usage != 'all':
-        stdout_f.write('\t\tAmbiguity for this contig is not checked for speed up '
-                       '(too much alignments and --ambiguity-usage is "%s")\n' % qconfig.ambiguity_usage)
-        best_set = all_scored_sets.pop()
-        while best_set.score != max_score:
-            best_set = all_scored_sets.pop()
-        return False, False, sorted_aligns, [best_set]
-
     max_allowed_score_drop = max_score - max_score * qconfig.ambiguity_score
 
     putative_sets = []
     best_sets = []
+    scored_sets_index = ScoredSetsIndex(all_scored_sets)
     for scored_set in all_scored_sets:
         score_drop = max_score - scored_set.score
         if score_drop <= max_allowed_score_drop:
@@ -245,24 +307,33 @@ def get_best_aligns_sets(sorted_aligns, ctg_len, stdout_f, seq, ref_lens, is_cyc
             continue
         # the main part: trying to enlarge the set to the left (use "earlier" alignments)
         align = sorted_aligns[putative_set.indexes[0]]
+        # we can enlarge the set with "earlier" alignments only;
+        # predecessors which are unable to fit into the allowed score drop are not scored at all
+        max_score_gain = get_max_score_gain(align)
+        allowed_score_drop = max_allowed_score_drop - putative_set.score_drop
         local_max_score = 0
-        local_uncovered = putative_set.uncovered
-        putative_predecessors = OrderedDict()
-        for scored_set in all_scored_sets:
-            # we can enlarge the set with "earlier" alignments only
-            if scored_set.indexes and scored_set.indexes[-1] >= putative_set.indexes[0]:
+        putative_predecessors = {}
+        for pos in scored_sets_index.iter_by_score(bisect_left(last_indexes, putative_set.indexes[0], 1)):
+            scored_set = all_scored_sets[pos]
+            if scored_set.score + max_score_gain < local_max_score - allowed_score_drop:
                 break
-            cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
-            score, uncovered = get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered,
-                                         seq, region_struct_variations, penalties)
+            score, uncovered = get_score(scored_set.score, SetAlignsView(sorted_aligns, scored_set.indexes, align),
+                                         ref_lens, is_cyclic, scored_set.uncovered, seq, region_struct_variations, penalties)
             if score is not None:
-                putative_predecessors[scored_set] = (score, uncovered)
-                if score > local_max_score:
-                    local_max_score = score
-                    local_uncovered = uncovered
-                elif score == local_max_score and uncovered < local_uncovered:
-                    local_uncovered = uncovered
-        for preceding_set, (score, uncovered) in putative_predecessors.items():
+                putative_predecessors[pos] = (score, uncovered)
+                local_max_score = max(local_max_score, score)
+        local_max_score = 0
+        local_uncovered = putative_set.uncovered
+        for pos in sorted(putative_predecessors):
+            score, uncovered = putative_predecessors[pos]
+            if score > local_max_score:
+                local_max_score = score
+                local_uncovered = uncovered
+            elif score == local_max_score and uncovered < local_uncovered:
+                local_uncovered = uncovered
+        for pos in sorted(putative_predecessors):
+            preceding_set = all_scored_sets[pos]
+            score, uncovered = putative_predecessors[pos]
             score_drop = local_max_score - score + putative_set.score_drop
             if score_drop > max_allowed_score_drop:
                 continue
@@ -300,14 +371,17 @@ def get_score(score, aligns, ref_lens, is_cyclic, uncovered_len, seq, region_str
         align1, align2 = aligns[-2], aligns[-1]
         is_fake_translocation = is_fragmented_ref_fake_translocation(align1, align2, ref_lens)
         overlaped_len = max(0, align1.end() - align2.start() + 1)
+        # alignments are not modified, their versions without internal overlaps are used instead
+        tail = []
         if len(aligns) > 2:  # does not affect score and uncovered but it is important for further checking on set correctness
-            exclude_internal_overlaps(aligns[-3], align1)
-        reduced_len, _ = exclude_internal_overlaps(align1, align2)  # reduced_len is for align1 only
+            prev_align, align1, _ = get_aligns_without_overlap(aligns[-3], align1)
+            tail.append(prev_align)
+        align1, align2, reduced_len = get_aligns_without_overlap(align1, align2)  # reduced_len is for align1 only
         # check whether the set is still correct, i.e both alignments are rather large
         if min(align1.len2, align2.len2) < qconfig.min_alignment:
             return None, None
 
-        added_len = get_added_len(aligns, aligns[-1])
+        added_len = get_added_len(aligns.with_tail(tail + [align1, align2]), align2)
         uncovered_len -= (added_len - reduced_len)
         score += score_single_align(align2, ctg_len=added_len) - score_single_align(align1, ctg_len=reduced_len)
         is_extensive_misassembly, aux_data = is_misassembly(align1, align2, seq, ref_lens, is_cyclic, region_struct_variations,
@@ -341,6 +415,12 @@ def get_score(score, aligns, ref_lens, is_cyclic, uncovered_len, seq, region_str
     return score, uncovered_len
 
 
+def get_max_score_gain(align):
+    # upper bound of the score increase caused by adding the alignment to any set (see get_score):
+    # the added length is limited by the doubled alignment length, the penalties are non-negative
+    return score_single_align(align, ctg_len=2 * (align.end() - align.start() + 1)) + 1
+
+
 def score_single_align(align, ctg_len=None):
     if ctg_len is None:
         ctg_len = align.len2
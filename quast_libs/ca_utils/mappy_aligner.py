@@ -0,0 +1,146 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# In-process alignment of contigs with the bundled minimap2 Python bindings (mappy).
+# The reference index is built once per reference and set of minimap2 options and shared by all assemblies
+# (worker processes inherit it from the main process). The output is the same PAF as minimap2 writes,
+# except for references longer than 4 Gbp: mappy always builds a uni-part index, while minimap2 splits
+# the index into parts of -I bases, so alignments of such references may differ.
+#
+############################################################################
+
+from __future__ import with_statement
+import threading
+from multiprocessing.pool import ThreadPool
+
+from quast_libs import fastaparser, qconfig
+from quast_libs.ca_utils.misc import import_mappy
+from quast_libs.log import get_logger
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+# minimap2 flags (see minimap.h)
+MM_F_CIGAR = 0x004
+MM_F_OUT_CG = 0x020
+MM_F_OUT_CS = 0x040
+MM_F_NO_LJOIN = 0x400
+
+MINIMAP_FLAGS = {'-c': MM_F_OUT_CG | MM_F_CIGAR, '--cs': MM_F_OUT_CS | MM_F_CIGAR, '--no-long-join': MM_F_NO_LJOIN}
+MINIMAP_OPTIONS = {'-B': 'b', '-r': 'bw', '-N': 'best_n', '-s': 'min_dp_score', '-z': 'zdrop', '-g': 'max_gap',
+                   '-f': 'mid_occ', '--min-occ': 'min_mid_occ', '--score-N': 'sc_ambi'}
+MINIMAP_FLOAT_OPTIONS = {'--mask-level': 'mask_level'}
+MINIMAP_PAIRED_OPTIONS = {'-O': ('q', 'q2'), '-E': ('e', 'e2')}
+
+BATCH_SIZE = 50 * 1000 * 1000  # total length of contigs which are mapped by threads at once
+
+_aligners = dict()  # (reference fpath, minimap2 options) -> mappy.Aligner or None
+
+
+def get_mappy_options(minimap_options):
+    """
+        Translates minimap2 command line options into keyword arguments of mappy.Aligner
+        Returns None if some option is not supported by mappy
+    """
+    kwargs = {'extra_flags': 0}
+    options = iter(minimap_options)
+    for option in options:
+        if option == '-cx':
+            kwargs['extra_flags'] |= MINIMAP_FLAGS['-c']
+            option = '-x'
+        if option in MINIMAP_FLAGS:
+            kwargs['extra_flags'] |= MINIMAP_FLAGS[option]
+            continue
+        if not option.startswith('--') and len(option) > 2:  # value is attached to the option, e.g. -B5
+            option, value = option[:2], option[2:]
+        else:
+            value = next(options, None)
+        if value is None:
+            return None
+
+        if option == '-x':
+            kwargs['preset'] = value
+        elif option in MINIMAP_PAIRED_OPTIONS:
+            values = [int(v) for v in value.split(',')]
+            first_arg, second_arg = MINIMAP_PAIRED_OPTIONS[option]
+            kwargs[first_arg], kwargs[second_arg] = values[0], values[-1]
+        elif option in MINIMAP_FLOAT_OPTIONS:
+            kwargs[MINIMAP_FLOAT_OPTIONS[option]] = float(value)
+        elif option in MINIMAP_OPTIONS and not (option == '-f' and float(value) < 1):  # fraction for -f is not supported
+            kwargs[MINIMAP_OPTIONS[option]] = int(value)
+        else:
+            return None
+    return kwargs
+
+
+def get_aligner(ref_fpath, minimap_options, max_threads):
+    """
+        Returns mappy.Aligner for the reference and minimap2 options (the index is built once per process)
+        or None if mappy is not available
+    """
+    key = (ref_fpath, tuple(minimap_options))
+    if key not in _aligners:
+        mappy = import_mappy(logger)
+        kwargs = get_mappy_options(minimap_options)
+        aligner = None
+        if mappy is not None and kwargs is not None:
+            logger.info('  Building reference index for in-process alignment...')
+            aligner = mappy.Aligner(ref_fpath, n_threads=max_threads, **kwargs) or None
+        if aligner is None:
+            logger.notice('In-process alignment with mappy is not available, minimap2 will be run as a separate process.')
+        _aligners[key] = aligner
+    return _aligners[key]
+
+
+def _iter_batches(fasta_entries, batch_size):
+    batch = []
+    batch_len = 0
+    for name, seq in fasta_entries:
+        batch.append((name, seq))
+        batch_len += len(seq)
+        if batch_len >= batch_size:
+            yield batch
+            batch = []
+            batch_len = 0
+    if batch:
+        yield batch
+
+
+def iter_paf_lines(aligner, contigs_fpath, max_threads):
+    """
+        Generator that maps contigs and returns PAF lines in the order of contigs (as minimap2 does)
+    """
+    mappy = import_mappy(logger)
+    thread_data = threading.local()
+
+    def map_contig(entry):
+        if not hasattr(thread_data, 'buf'):
+            thread_data.buf = mappy.ThreadBuffer()
+        name, seq = entry
+        return aligner.map_paf(name, seq, buf=thread_data.buf)
+
+    pool = ThreadPool(max_threads) if max_threads > 1 else None
+    try:
+        for batch in _iter_batches(fastaparser.read_fasta(contigs_fpath), BATCH_SIZE):
+            for paf in (pool.map(map_contig, batch) if pool else map(map_contig, batch)):
+                for line in paf.splitlines(True):
+                    yield line
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+
+def align(aligner, contigs_fpath, max_threads, paf_handler, log_err_fpath):
+    """
+        Passes PAF lines to paf_handler while contigs are being aligned.
+        Returns the return code (as for minimap2) and the result of paf_handler
+    """
+    try:
+        return 0, paf_handler(iter_paf_lines(aligner, contigs_fpath, max_threads))
+    except Exception as e:
+        with open(log_err_fpath, 'a') as log_err_f:
+            log_err_f.write('In-process alignment failed: ' + str(e) + '\n')
+        return 1, None
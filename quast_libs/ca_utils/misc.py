@@ -13,8 +13,10 @@ from __future__ import with_statement
 import gzip
 import os
 import re
+import sys
+import sysconfig
 from itertools import repeat
-from os.path import isdir, join, basename
+from os.path import isdir, isfile, join, basename
 
 try:
    from collections import OrderedDict
@@ -22,9 +24,11 @@ except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
 from quast_libs import qconfig
-from quast_libs.qutils import compile_tool, val_to_str, get_path_to_program
+from quast_libs.qutils import compile_tool, val_to_str, get_path_to_program, call_subprocess, safe_rm, \
+    check_prev_compilation_failed, write_failed_compilation_flag, tools_lock
 
 contig_aligner_dirpath = join(qconfig.LIBS_LOCATION, 'minimap2')
+_mappy = None  # the bundled mappy module once it is imported
 ref_labels_by_chromosomes = OrderedDict()
 intergenomic_misassemblies_by_asm = {}
 contigs_aligned_lengths = {}
@@ -45,7 +49,72 @@ def compile_minimap(logger, only_clean=False):
     return False
 
 
+def mappy_fpath():
+    return join(contig_aligner_dirpath, 'mappy' + (sysconfig.get_config_var('EXT_SUFFIX') or '.so'))
+
+
+def compile_mappy(logger, only_clean=False):
+    with tools_lock:
+        return _compile_mappy(logger, only_clean=only_clean)
+
+
+def _compile_mappy(logger, only_clean=False):
+    make_logs_basepath = join(contig_aligner_dirpath, 'make_mappy')
+    failed_compilation_flag = make_logs_basepath + '.failed'
+    if only_clean:
+        safe_rm(mappy_fpath())
+        safe_rm(failed_compilation_flag)
+        return True
+
+    if isfile(mappy_fpath()):
+        return True
+    if check_prev_compilation_failed('mappy', failed_compilation_flag, just_notice=True, logger=logger):
+        return False
+
+    logger.main_info('Compiling mappy (details are in ' + make_logs_basepath + '.log and make_mappy.err)')
+    prev_dir = os.getcwd()
+    os.chdir(contig_aligner_dirpath)
+    try:
+        return_code = call_subprocess([sys.executable, 'setup.py', 'build_ext', '--inplace'],
+                                      stdout=open(make_logs_basepath + '.log', 'w'),
+                                      stderr=open(make_logs_basepath + '.err', 'w'), logger=logger)
+    except (IOError, OSError):
+        return_code = -1
+    finally:
+        os.chdir(prev_dir)
+    if return_code != 0 or not isfile(mappy_fpath()):
+        write_failed_compilation_flag('mappy', contig_aligner_dirpath, failed_compilation_flag, just_notice=True,
+                                      logger=logger)
+        return False
+    return True
+
+
+def import_mappy(logger):
+    """
+        Returns the bundled mappy module (it is compiled if needed) or None if it is not available
+    """
+    global _mappy
+    if _mappy is not None:  # workers forked while the lock is held by another thread do not wait for it
+        return _mappy
+    with tools_lock:  # sys.path is changed for the import
+        if not compile_mappy(logger):
+            return None
+        sys.path.insert(0, contig_aligner_dirpath)
+        try:
+            import mappy
+        except ImportError:
+            return None
+        finally:
+            sys.path.remove(contig_aligner_dirpath)
+    if not hasattr(mappy.Aligner, 'map_paf'):  # mappy from another source was imported
+        return None
+    _mappy = mappy
+    return mappy
+
+
 def compile_aligner(logger, only_clean=False):
+    if only_clean:
+        compile_mappy(logger, only_clean=True)
     if compile_minimap(logger, only_clean=only_clean):
         return True
     logger.error("Compilation of contig aligner software was unsuccessful! QUAST functionality will be limited.")
@@ -10,6 +10,7 @@ from collections import defaultdict
 
 from quast_libs import qconfig, qutils, reporting
 from quast_libs.ca_utils.analyze_misassemblies import Misassembly
+from quast_libs.fastaparser import read_fasta_lengths
 from quast_libs.ca_utils.misc import print_file, intergenomic_misassemblies_by_asm, ref_labels_by_chromosomes
 
 
@@ -197,9 +198,11 @@ def save_result(result, report, fname, ref_fpath, genome_size):
     return report
 
 
-def save_result_for_unaligned(result, report):
-    unaligned_ctgs = report.get_field(reporting.Fields.CONTIGS)
-    unaligned_length = report.get_field(reporting.Fields.TOTALLEN)
+def save_result_for_unaligned(result, report, contigs_fpath):
+    # contigs are counted here: basic stats of the assembly may be not calculated yet
+    contigs_lengths = [seq_len for _, seq_len in read_fasta_lengths(contigs_fpath)]
+    unaligned_ctgs = len(contigs_lengths)
+    unaligned_length = sum(contigs_lengths)
     report.add_field(reporting.Fields.UNALIGNED, '%d + %d part' % (unaligned_ctgs, 0))
     report.add_field(reporting.Fields.UNALIGNEDBASES, unaligned_length)
 
@@ -18,10 +18,10 @@ try:
 except ImportError:
    from quast_libs.site_packages.ordered_dict import OrderedDict
 
-from quast_libs import qutils, qconfig
+from quast_libs import qutils, qconfig, reference_profile
 from quast_libs.ca_utils.align_contigs import get_aux_out_fpaths
+from quast_libs.ca_utils.alignment_store import iter_mappings
 from quast_libs.ca_utils.misc import create_minimap_output_dir, parse_cs_tag
-from quast_libs.fastaparser import get_chr_lengths_from_fastafile
 from quast_libs.icarus_utils import get_assemblies, check_misassembled_blocks, Alignment
 from quast_libs.qutils import get_path_to_program, is_non_empty_file, relpath
 from quast_libs.reads_analyzer import COVERAGE_FACTOR
@@ -276,19 +276,15 @@ def create_mismatches_plot(assembly, window_size, ref_len, root_dir, output_dir)
 
     mismatches_fpath = join(output_dir, assembly_label + '.mismatches.txt')
     mismatch_density_by_chrom = defaultdict(lambda : [0] * (ref_len // window_size + 1))
-    with open(coords_filtered_fpath) as coords_file:
-        for line in coords_file:
-            s1 = int(line.split('|')[0].split()[0])
-            chrom = line.split()[11].strip()
-            cigar = line.split()[-1].strip()
-            ref_pos = s1
-            for op in parse_cs_tag(cigar):
-                n_bases = len(op) - 1
-                if op.startswith('*'):
-                    mismatch_density_by_chrom[chrom][int(ref_pos) // window_size] += 1
-                    ref_pos += 1
-                elif not op.startswith('+'):
-                    ref_pos += n_bases
+    for mapping in iter_mappings(coords_filtered_fpath):
+        ref_pos = mapping.s1
+        for op in parse_cs_tag(mapping.cigar):
+            n_bases = len(op) - 1
+            if op.startswith('*'):
+                mismatch_density_by_chrom[mapping.ref][int(ref_pos) // window_size] += 1
+                ref_pos += 1
+            elif not op.startswith('+'):
+                ref_pos += n_bases
     with open(mismatches_fpath, 'w') as out_f:
         for chrom, density_list in mismatch_density_by_chrom.items():
             start, end = 0, 0
@@ -420,7 +416,7 @@ def create_conf(ref_fpath, contigs_fpaths, contig_report_fpath_pattern, output_d
     if not exists(data_dir):
         os.makedirs(data_dir)
 
-    chr_lengths = get_chr_lengths_from_fastafile(ref_fpath)
+    chr_lengths = reference_profile.get(ref_fpath).chr_lengths
     max_len, karyotype_fpath, ideogram_fpath = create_ideogram(chr_lengths, data_dir)
     if max_len >= 10 ** 6:
         chrom_units = 10 ** 5
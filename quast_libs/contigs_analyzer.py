@@ -23,17 +23,19 @@ import re
 from collections import defaultdict
 from os.path import join, dirname
 
-from quast_libs import reporting, qconfig, qutils, fastaparser
+from quast_libs import reporting, qconfig, qutils, fastaparser, reference_profile
 from quast_libs.ca_utils import misc
+from quast_libs.ca_utils.alignment_store import AlignmentsWriter, iter_mappings
 from quast_libs.ca_utils.analyze_contigs import analyze_contigs
-from quast_libs.ca_utils.analyze_misassemblies import Mapping, IndelsInfo
+from quast_libs.ca_utils.analyze_misassemblies import IndelsInfo
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes, compile_aligner, \
     create_minimap_output_dir, close_handlers, parse_cs_tag
 
-from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, AlignerStatus
+from quast_libs.ca_utils.align_contigs import align_contigs, get_aux_out_fpaths, prepare_mappy_aligner, \
+    prepare_minimap_index, AlignerStatus
 from quast_libs.ca_utils.save_results import print_results, save_result, save_result_for_unaligned, \
     save_combined_ref_stats
-from quast_libs.fastaparser import get_genome_stats
+from quast_libs.intervals import merge_intervals, intervals_length
 
 from quast_libs.log import get_logger
 from quast_libs.qutils import is_python2, run_parallel
@@ -52,9 +54,7 @@ class CAOutput():
 
 def analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_snps_fpath):
     indels_info = IndelsInfo()
-    genome_mapping = {}
-    for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
+    covered_bases_by_chromosomes = defaultdict(list)
     with open(used_snps_fpath, 'w') as used_snps_f:
         for chr_name, aligns in ref_aligns.items():
             for align in aligns:
@@ -91,17 +91,15 @@ def analyze_coverage(ref_aligns, reference_chromosomes, ns_by_chromosomes, used_
                         ref_pos += n_bases
                         ctg_pos += n_bases * strand_direction
                 if align.s1 < align.e1:
-                    for pos in range(align.s1, align.e1 + 1):
-                        genome_mapping[align.ref][pos] = 1
+                    covered_bases_by_chromosomes[align.ref].append((align.s1, align.e1))
                 else:
-                    for pos in range(align.s1, len(genome_mapping[align.ref])):
-                        genome_mapping[align.ref][pos] = 1
-                    for pos in range(1, align.e1 + 1):
-                        genome_mapping[align.ref][pos] = 1
-            for i in ns_by_chromosomes[align.ref]:
-                genome_mapping[align.ref][i] = 0
-
-    covered_ref_bases = sum([sum(genome_mapping[chrom]) for chrom in genome_mapping])
+                    covered_bases_by_chromosomes[align.ref].append((align.s1, reference_chromosomes[align.ref]))
+                    covered_bases_by_chromosomes[align.ref].append((1, align.e1))
+
+    covered_ref_bases = 0
+    for chr_name, chr_intervals in covered_bases_by_chromosomes.items():
+        covered_intervals = merge_intervals(chr_intervals)
+        covered_ref_bases += intervals_length(covered_intervals) - ns_by_chromosomes[chr_name].overlap(covered_intervals)
     return covered_ref_bases, indels_info
 
 
@@ -161,11 +159,9 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     # Loading the alignment files
     log_out_f.write('Parsing coords...\n')
     aligns = {}
-    with open(coords_fpath) as coords_file:
-        for line in coords_file:
-            mapping = Mapping.from_line(line)
-            if not qconfig.alignments_for_reuse_dirpath or mapping.ref in reference_chromosomes.keys():
-                aligns.setdefault(mapping.contig, []).append(mapping)
+    for mapping in iter_mappings(coords_fpath):
+        if not qconfig.alignments_for_reuse_dirpath or mapping.ref in reference_chromosomes.keys():
+            aligns.setdefault(mapping.contig, []).append(mapping)
 
     # Loading the reference sequences
     log_out_f.write('Loading reference...\n') # TODO: move up
@@ -186,12 +182,14 @@ def align_and_analyze(is_cyclic, index, contigs_fpath, output_dirpath, ref_fpath
     log_out_f.write('\tTotal Regions: %d\n' % total_regions)
     log_out_f.write('\tTotal Region Length: %d\n' % total_reg_len)
 
-    ca_output = CAOutput(stdout_f=log_out_f, misassembly_f=misassembly_f, coords_filtered_f=open(coords_filtered_fpath, 'w'),
+    # identities of filtered alignments are written as parsed numbers (e.g. 100.0), as in previous versions
+    ca_output = CAOutput(stdout_f=log_out_f, misassembly_f=misassembly_f, coords_filtered_f=AlignmentsWriter(coords_filtered_fpath, idy_fmt='%s'),
                          icarus_out_f=icarus_out_f)
 
     log_out_f.write('Analyzing contigs...\n')
     result, ref_aligns, total_indels_info, aligned_lengths, misassembled_contigs, misassemblies_in_contigs, aligned_lengths_by_contigs =\
-        analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, reference_chromosomes, is_cyclic)
+        analyze_contigs(ca_output, contigs_fpath, unaligned_fpath, unaligned_info_fpath, aligns, ref_features, reference_chromosomes, is_cyclic,
+                        threads=threads)
 
     log_out_f.write('Analyzing coverage...\n')
     if qconfig.show_snps:
@@ -260,11 +258,14 @@ def do(reference, contigs_fpaths, is_cyclic, output_dir, old_contigs_fpaths, bed
 
     num_nf_errors = logger._num_nf_errors
     create_minimap_output_dir(output_dir)
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    threads = max(1, qconfig.max_threads // n_jobs)
-
-    genome_size, reference_chromosomes, ns_by_chromosomes = get_genome_stats(reference, skip_ns=True)
-    threads = qconfig.max_threads if qconfig.memory_efficient else threads
+    n_jobs = min(len(contigs_fpaths), qutils.get_max_threads())
+    threads = max(1, qutils.get_max_threads() // n_jobs)
+
+    genome_size, reference_chromosomes, ns_by_chromosomes = reference_profile.get(reference).get_genome_stats(skip_ns=True)
+    threads = qutils.get_max_threads() if qconfig.memory_efficient else threads
+    # the index is prepared before starting workers, so it is shared by them
+    if not (qconfig.use_mappy and prepare_mappy_aligner(reference, qutils.get_max_threads())):
+        prepare_minimap_index(reference, qutils.get_max_threads())
     args = [(is_cyclic, i, contigs_fpath, output_dir, reference, reference_chromosomes, ns_by_chromosomes,
             old_contigs_fpath, bed_fpath, threads)
             for i, (contigs_fpath, old_contigs_fpath) in enumerate(zip(contigs_fpaths, old_contigs_fpaths))]
@@ -284,7 +285,7 @@ def do(reference, contigs_fpaths, is_cyclic, output_dir, old_contigs_fpaths, bed
         if statuses[index] == AlignerStatus.OK:
             reports.append(save_result(results[index], report, fname, reference, genome_size))
         elif statuses[index] == AlignerStatus.NOT_ALIGNED:
-            save_result_for_unaligned(results[index], report)
+            save_result_for_unaligned(results[index], report, fname)
 
     if AlignerStatus.OK in aligner_statuses.values():
         reporting.save_misassemblies(output_dir)
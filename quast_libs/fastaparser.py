@@ -6,7 +6,9 @@
 ############################################################################
 
 from __future__ import with_statement
+import mmap
 import os
+import re
 import sys
 import gzip
 import zipfile
@@ -23,14 +25,22 @@ except ImportError:
 if sys.version_info[0] == 3:
     import io
 from quast_libs import qconfig
+from quast_libs.intervals import NsIndex
 # There is a pyfasta package -- http://pypi.python.org/pypi/pyfasta/
 # Use it!
 
 from quast_libs.log import get_logger
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+FASTA_CHUNK_SIZE = 16 * 1024 * 1024  # for reading compressed files and counting lengths of long sequences
 
-def _get_fasta_file_handler(fpath):
+
+def _is_compressed(fpath):
+    _, ext = os.path.splitext(fpath)
+    return ext in ['.gz', '.gzip', '.bz2', '.bzip2', '.zip']
+
+
+def _get_fasta_file_handler(fpath, binary=False):
     fasta_file = None
 
     _, ext = os.path.splitext(fpath)
@@ -39,11 +49,12 @@ def _get_fasta_file_handler(fpath):
         logger.error('Permission denied accessing ' + fpath, to_stderr=True, exit_with_code=1)
 
     if ext in ['.gz', '.gzip']:
-        fasta_file = gzip.open(fpath, mode="rt")
+        fasta_file = gzip.open(fpath, mode="rb" if binary else "rt")
 
     elif ext in ['.bz2', '.bzip2']:
         fasta_file = bz2.BZ2File(fpath, mode="r")
-        fasta_file = _read_compressed_file(fasta_file)
+        if not binary:
+            fasta_file = _read_compressed_file(fasta_file)
 
     elif ext in ['.zip']:
         try:
@@ -61,12 +72,13 @@ def _get_fasta_file_handler(fpath):
 
             try:
                 fasta_file = zfile.open(names[0])
-                fasta_file = _read_compressed_file(fasta_file)
+                if not binary:
+                    fasta_file = _read_compressed_file(fasta_file)
             except AttributeError:
                 logger.error('Use python 2.6 or newer to work with contigs directly in zip.', exit_with_code=20)
     else:
         try:
-            fasta_file = open(fpath)
+            fasta_file = open(fpath, 'rb' if binary else 'r')
         except IOError:
             exc_type, exc_value, _ = sys.exc_info()
             logger.exception(exc_value, exit_code=1)
@@ -80,6 +92,129 @@ def _read_compressed_file(compressed_file):
     return compressed_file
 
 
+def _decode(data):
+    if sys.version_info[0] == 3:
+        return data.decode()
+    return data
+
+
+def _iter_fasta_blocks(fpath):
+    """
+        Generator that returns buffers (bytes or mmap) with the whole FASTA entries.
+        Uncompressed files are memory-mapped, compressed ones are read in chunks.
+    """
+    if not _is_compressed(fpath):
+        fasta_file = _get_fasta_file_handler(fpath, binary=True)
+        try:
+            if os.fstat(fasta_file.fileno()).st_size:
+                fasta_mmap = mmap.mmap(fasta_file.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    yield fasta_mmap
+                finally:
+                    fasta_mmap.close()
+        finally:
+            fasta_file.close()
+        return
+
+    fasta_file = _get_fasta_file_handler(fpath, binary=True)
+    try:
+        parts = []
+        while True:
+            chunk = fasta_file.read(FASTA_CHUNK_SIZE)
+            if not chunk:
+                break
+            entry_start = max(chunk.rfind(b'\n>'), chunk.rfind(b'\r>')) + 1
+            if not entry_start and chunk[:1] == b'>' and parts and parts[-1][-1:] in [b'\n', b'\r']:
+                yield b''.join(parts)
+                parts = []
+            elif entry_start:
+                parts.append(chunk[:entry_start])
+                yield b''.join(parts)
+                parts = [chunk[entry_start:]]
+                continue
+            parts.append(chunk)
+        if parts:
+            yield b''.join(parts)
+    finally:
+        fasta_file.close()
+
+
+class _EntryStartsFinder(object):
+    """
+        Finds positions of '>' at the beginning of lines, caches the search results for each type of line breaks
+    """
+    def __init__(self, data):
+        self.data = data
+        self.has_cr = data.find(b'\r') != -1
+        self.patterns = [b'\n>', b'\r>'] if self.has_cr else [b'\n>']
+        self.found = [-2] * len(self.patterns)
+
+    def find(self, start):
+        positions = []
+        for i, pattern in enumerate(self.patterns):
+            if self.found[i] != -1 and self.found[i] < start:
+                self.found[i] = self.data.find(pattern, start)
+            if self.found[i] != -1:
+                positions.append(self.found[i] + 1)
+        return min(positions) if positions else -1
+
+    def find_line_end(self, start):
+        line_end = self.data.find(b'\n', start)
+        if line_end == -1:
+            line_end = len(self.data)
+        if self.has_cr:
+            cr_pos = self.data.find(b'\r', start, line_end)
+            if cr_pos != -1:
+                line_end = cr_pos
+        return line_end
+
+
+def _iter_fasta_regions(fpath):
+    """
+        Generator that returns FASTA entries in tuples (name, buffer, start, end),
+        where buffer[start:end] is the entry sequence with line breaks.
+        Sequence preceding the first name (if any) is returned with None name.
+    """
+    headless_block = None
+    for data in _iter_fasta_blocks(fpath):
+        if headless_block is not None:
+            yield None, headless_block, 0, len(headless_block)
+            headless_block = None
+        finder = _EntryStartsFinder(data)
+        pos = 0
+        if data[:1] != b'>':
+            pos = finder.find(0)
+            if pos == -1:
+                headless_block = data[:]
+                continue
+            yield None, data, 0, pos  # sequence before the first name
+        while pos != -1:
+            line_end = finder.find_line_end(pos)
+            name = __get_entry_name(_decode(data[pos:line_end]))
+            next_pos = finder.find(line_end)
+            yield name, data, line_end, next_pos if next_pos != -1 else len(data)
+            pos = next_pos
+    if headless_block:  # sequence without a name is reported as an entry only if it is the whole file
+        yield '', headless_block, 0, len(headless_block)
+
+
+def _get_seq(data, start, end):
+    seq = data[start:end].translate(None, b'\r\n')
+    if b' ' in seq or b'\t' in seq:  # only whitespaces at line ends are stripped
+        seq = b''.join(line.strip() for line in re.split(b'[\r\n]', data[start:end]))
+    return _decode(seq)
+
+
+def _get_seq_len(data, start, end):
+    seq_len = 0
+    for piece_start in range(start, end, FASTA_CHUNK_SIZE):
+        piece = data[piece_start:min(end, piece_start + FASTA_CHUNK_SIZE)]
+        if b' ' in piece or b'\t' in piece:
+            return len(_get_seq(data, start, end))
+        seq_len += len(piece) - piece.count(b'\n') - piece.count(b'\r')
+    return seq_len
+
+
 def __get_entry_name(line):
     """
         Extracts name from fasta entry line:
@@ -99,25 +234,13 @@ def get_chr_lengths_from_fastafile(fpath):
     chr_lengths = OrderedDict()
     l = 0
     chr_name = None
-    fasta_file = _get_fasta_file_handler(fpath)
-    for raw_line in fasta_file:
-        if raw_line.find('\r') != -1:
-            lines = raw_line.split('\r')
-        else:
-            lines = [raw_line]
-        for line in lines:
-            if not line:
-                continue
-            if line[0] == '>':
-                if l:  # not the first sequence in FASTA
-                    chr_lengths[chr_name] = l
-                    l = 0
-                chr_name = __get_entry_name(line)
-            else:
-                l += len(line.strip())
+    for name, data, start, end in _iter_fasta_regions(fpath):
+        l = _get_seq_len(data, start, end)
+        if l:
+            chr_lengths[name] = l
+        chr_name = name
 
-    chr_lengths[chr_name] = l
-    fasta_file.close()
+    chr_lengths[chr_name] = l  # the last sequence is saved even if it is empty
     return chr_lengths
 
 
@@ -129,7 +252,7 @@ def get_genome_stats(fasta_fpath, skip_ns=False):
         chr_name = name.split()[0]
         chr_len = len(seq)
         genome_size += chr_len
-        ns_by_chromosomes[chr_name] = set(x + 1 for x, s in enumerate(seq) if s == 'N')
+        ns_by_chromosomes[chr_name] = NsIndex(seq)
         if skip_ns:
             genome_size -= len(ns_by_chromosomes[chr_name])
         reference_chromosomes[chr_name] = chr_len
@@ -196,31 +319,55 @@ def read_fasta(fpath):
     """
         Generator that returns FASTA entries in tuples (name, seq)
     """
-    first = True
-    seq = []
-    name = ''
-
-    fasta_file = _get_fasta_file_handler(fpath)
+    for name, data, start, end in _iter_fasta_regions(fpath):
+        if name is not None:
+            yield name, _get_seq(data, start, end)
 
-    for raw_line in fasta_file:
-        lines = raw_line.split('\r')
-        for line in lines:
-            if not line:
-                continue
-            if line[0] == '>':
-                if not first:
-                    yield name, "".join(seq)
 
-                first = False
-                name = __get_entry_name(line)
-                seq = []
-            else:
-                seq.append(line.strip())
+def read_fasta_lengths(fpath):
+    """
+        Generator that returns FASTA entries in tuples (name, seq_len) without loading sequences
+    """
+    for name, data, start, end in _iter_fasta_regions(fpath):
+        if name is not None:
+            yield name, _get_seq_len(data, start, end)
 
-    if name or seq:
-        yield name, "".join(seq)
 
-    fasta_file.close()
+def read_fasta_range(fpath, start, end):
+    """
+        Generator that returns FASTA entries with indexes from start to end (exclusive) in tuples (name, seq),
+        sequences of other entries are not extracted
+    """
+    idx = 0
+    for name, data, seq_start, seq_end in _iter_fasta_regions(fpath):
+        if name is None:
+            continue
+        if idx >= end:
+            break
+        if idx >= start:
+            yield name, _get_seq(data, seq_start, seq_end)
+        idx += 1
+
+
+def read_fasta_with_fai_fields(fpath):
+    """
+        Generator that returns FASTA entries in tuples (name, seq, fai_fields),
+        where fai_fields are the fields of the entry line in .fai file (as in create_fai_file).
+        fai_fields are None for empty entries and for compressed files
+    """
+    is_compressed = _is_compressed(fpath)
+    for name, data, start, end in _iter_fasta_regions(fpath):
+        if name is None:
+            continue
+        seq = _get_seq(data, start, end)
+        fai_fields = None
+        if seq and not is_compressed:
+            seq_offset = start + (2 if data[start:start + 2] == b'\r\n' else 1 if data[start:start + 1] in [b'\r', b'\n'] else 0)
+            first_line_end = data.find(b'\n', seq_offset, end)
+            first_line_end = first_line_end + 1 if first_line_end != -1 else end
+            fai_fields = [name, len(seq), seq_offset, len(data[seq_offset:first_line_end].strip()),
+                          first_line_end - seq_offset]
+        yield name, seq, fai_fields
 
 
 def read_fasta_one_time(fpath):
@@ -237,20 +384,7 @@ def read_fasta_str(fpath):
     """
         Returns string
     """
-    fasta_file = _get_fasta_file_handler(fpath)
-    list_seq = []
-
-    for raw_line in fasta_file:
-        lines = raw_line.split('\r')
-        for line in lines:
-            if not line:
-                continue
-            if line[0] != '>':
-                list_seq.append(line.strip())
-
-    fasta_file.close()
-    fasta_str = ''.join(list_seq)
-    return fasta_str
+    return ''.join(seq for _, seq in read_fasta(fpath))
 
 
 def print_fasta(fasta):
@@ -260,13 +394,17 @@ def print_fasta(fasta):
             print(seq[i:i + 60])
 
 
+def write_fasta_entry(outfile, name, seq):
+    outfile.write('>%s\n' % name)
+    if seq:
+        outfile.write('\n'.join(seq[i:i + 60] for i in range(0, len(seq), 60)) + '\n')
+
+
 def write_fasta(fpath, fasta, mode='w'):
     outfile = open(fpath, mode)
 
     for name, seq in fasta:
-        outfile.write('>%s\n' % name)
-        for i in range(0, len(seq), 60):
-            outfile.write(seq[i:i + 60] + '\n')
+        write_fasta_entry(outfile, name, seq)
     outfile.close()
 
 
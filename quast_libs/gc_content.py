@@ -0,0 +1,154 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Batched calculation of GC content in non-overlapping windows.
+# Sequences are counted block by block (block is the smallest window), larger windows are sums of blocks.
+# NumPy is used if available, otherwise counting is done by bytes.count on a translated sequence.
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+import sys
+from array import array
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from quast_libs import qconfig
+
+UNDEFINED_GC = -1
+MIN_GC_WINDOW_SIZE = qconfig.GC_window_size // 2
+MAX_GC_PERCENT = 100
+
+
+def _make_translation_table(letters, replacement):
+    table = bytearray(range(256))
+    for letter in letters:
+        table[ord(letter)] = ord(replacement)
+    return bytes(table)
+
+
+_GC_TABLE = _make_translation_table('C', 'G')  # G and C are counted together as G
+
+
+def _to_bytes(seq):
+    if sys.version_info[0] == 3 and not isinstance(seq, bytes):
+        return seq.encode()
+    return seq
+
+
+def _array_to_bytes(arr):
+    return arr.tobytes() if hasattr(arr, 'tobytes') else arr.tostring()
+
+
+def _array_from_bytes(typecode, data):
+    arr = array(typecode)
+    if hasattr(arr, 'frombytes'):
+        arr.frombytes(data)
+    else:
+        arr.fromstring(data)
+    return arr
+
+
+def _get_counts_typecode(block_size):
+    return 'B' if block_size <= 255 else 'L'
+
+
+def get_GC_percent_by_counts(seq_len, ACGT_len, GC_len):
+    if seq_len < MIN_GC_WINDOW_SIZE:
+        return None
+    # skip block if it has less than half of ACGT letters (it also helps with "ends of contigs")
+    if ACGT_len < seq_len // 2:
+        return None
+    return 100 * GC_len // ACGT_len
+
+
+def count_blocks(seq, block_size):
+    """
+        Returns arrays of # ACGT and # G and C in non-overlapping blocks of the sequence
+    """
+    typecode = _get_counts_typecode(block_size)
+    seq = _to_bytes(seq)
+    seq_len = len(seq)
+    if not seq_len:
+        return array(typecode), array(typecode)
+    if numpy is not None:
+        letters = numpy.frombuffer(seq, dtype=numpy.uint8)
+        block_starts = numpy.arange(0, seq_len, block_size)
+        counts_dtype = numpy.dtype('u%d' % array(typecode).itemsize)
+        GC_counts = numpy.add.reduceat((letters == ord('G')) | (letters == ord('C')), block_starts, dtype=counts_dtype)
+        block_lens = numpy.minimum(block_size, seq_len - block_starts).astype(counts_dtype)
+        ACGT_counts = block_lens - numpy.add.reduceat(letters == ord('N'), block_starts, dtype=counts_dtype)
+        return _array_from_bytes(typecode, ACGT_counts.tobytes()), _array_from_bytes(typecode, GC_counts.tobytes())
+
+    block_starts = range(0, seq_len, block_size)
+    block_ends = range(block_size, seq_len + block_size, block_size)
+    GC_counts = array(typecode, map(seq.translate(_GC_TABLE).count, repeat(b'G'), block_starts, block_ends))
+    if b'N' in seq:
+        Ns_counts = map(seq.count, repeat(b'N'), block_starts, block_ends)
+        ACGT_counts = array(typecode, [block_size - Ns_count for Ns_count in Ns_counts])
+    else:
+        ACGT_counts = array(typecode, [block_size]) * len(GC_counts)
+    ACGT_counts[-1] -= block_ends[-1] - seq_len
+    return ACGT_counts, GC_counts
+
+
+def get_windows_GC(seq_len, ACGT_counts, GC_counts, block_size, window_size):
+    """
+        Takes counts of blocks returned by count_blocks, window_size must be a multiple of block_size
+        Returns array of GC % of non-overlapping windows (UNDEFINED_GC for windows with undefined GC)
+    """
+    blocks_in_window = window_size // block_size
+    if not len(ACGT_counts):
+        return array('b')
+    if numpy is not None:
+        counts_dtype = numpy.dtype('u%d' % ACGT_counts.itemsize)
+        block_starts = numpy.arange(0, len(ACGT_counts), blocks_in_window)
+        windows_ACGT = numpy.add.reduceat(numpy.frombuffer(_array_to_bytes(ACGT_counts), dtype=counts_dtype),
+                                          block_starts, dtype=numpy.int64)
+        windows_GC = numpy.add.reduceat(numpy.frombuffer(_array_to_bytes(GC_counts), dtype=counts_dtype),
+                                        block_starts, dtype=numpy.int64)
+        window_lens = numpy.minimum(window_size, seq_len - block_starts * block_size)
+        is_defined = (window_lens >= MIN_GC_WINDOW_SIZE) & (windows_ACGT >= window_lens // 2) & (windows_ACGT > 0)
+        gc_percents = numpy.full(len(block_starts), UNDEFINED_GC, dtype=numpy.int8)
+        gc_percents[is_defined] = 100 * windows_GC[is_defined] // windows_ACGT[is_defined]
+        return _array_from_bytes('b', gc_percents.tobytes())
+
+    if blocks_in_window == 1:
+        windows_ACGT, windows_GC = ACGT_counts, GC_counts
+    else:
+        windows_ACGT = [sum(ACGT_counts[i:i + blocks_in_window]) for i in range(0, len(ACGT_counts), blocks_in_window)]
+        windows_GC = [sum(GC_counts[i:i + blocks_in_window]) for i in range(0, len(GC_counts), blocks_in_window)]
+    gc_percents = array('b', [UNDEFINED_GC]) * len(windows_ACGT)
+    for i, (window_ACGT, window_GC) in enumerate(zip(windows_ACGT, windows_GC)):
+        gc_percent = get_GC_percent_by_counts(min(window_size, seq_len - i * window_size), window_ACGT, window_GC)
+        if gc_percent is not None:
+            gc_percents[i] = gc_percent
+    return gc_percents
+
+
+def get_GC_hist(gc_percents):
+    """
+        Takes array of GC % returned by get_windows_GC
+        Returns list of # windows by GC % (from 0 to 100)
+    """
+    if numpy is not None:
+        gc_percents = numpy.frombuffer(_array_to_bytes(gc_percents), dtype=numpy.int8)
+        return [int(windows_num) for windows_num in
+                numpy.bincount(gc_percents[gc_percents >= 0], minlength=MAX_GC_PERCENT + 1)]
+    if len(gc_percents) < 10 * (MAX_GC_PERCENT + 1):
+        gc_hist = [0] * (MAX_GC_PERCENT + 1)
+        for gc_percent in gc_percents:
+            if gc_percent != UNDEFINED_GC:
+                gc_hist[gc_percent] += 1
+        return gc_hist
+    gc_percents = _array_to_bytes(gc_percents)
+    return [gc_percents.count(_array_to_bytes(array('b', [gc_percent]))) for gc_percent in range(MAX_GC_PERCENT + 1)]
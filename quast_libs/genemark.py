@@ -311,8 +311,8 @@ def do(fasta_fpaths, gene_lengths, out_dirpath, prokaryote, meta):
         if not os.path.isdir(tmp_dirpath):
             os.mkdir(tmp_dirpath)
 
-        n_jobs = min(len(fasta_fpaths), qconfig.max_threads)
-        num_threads = max(1, qconfig.max_threads // n_jobs)
+        n_jobs = min(len(fasta_fpaths), qutils.get_max_threads())
+        num_threads = max(1, qutils.get_max_threads() // n_jobs)
         parallel_run_args = [(index, fasta_fpath, gene_lengths, out_dirpath, tool_dirpath, tmp_dirpath,
                               gmhmm_p_function, prokaryote, num_threads)
                              for index, fasta_fpath in enumerate(fasta_fpaths)]
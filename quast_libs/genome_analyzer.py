@@ -10,7 +10,9 @@ import logging
 import os
 from collections import defaultdict
 
-from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils
+from quast_libs import fastaparser, genes_parser, reporting, qconfig, qutils, reference_profile
+from quast_libs.ca_utils.alignment_store import get_store_fpath, iter_mappings
+from quast_libs.intervals import merge_intervals, intervals_length, complement_intervals, IntervalIndex
 from quast_libs.log import get_logger
 from quast_libs.qutils import run_parallel
 
@@ -88,9 +90,7 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     #  338980   339138  |     2298     2134  |      159      165  |    79.76  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
     #  374145   374355  |     2306     2097  |      211      210  |    85.45  | gi|48994873|gb|U00096.2|	NODE_0_length_6088
 
-    genome_mapping = {}
-    for chr_name, chr_len in reference_chromosomes.items():
-        genome_mapping[chr_name] = [0] * (chr_len + 1)
+    aligned_intervals = dict((chr_name, []) for chr_name in reference_chromosomes)
 
     contig_tuples = fastaparser.read_fasta(contigs_fpath)  # list of FASTA entries (in tuples: name, seq)
     sorted_contig_tuples = sorted(enumerate(contig_tuples), key=lambda x: len(x[1][1]), reverse=True)
@@ -110,33 +110,29 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     if gene_searching_enabled:
         for name in sorted_contigs_names:
             aligned_blocks_by_contig_name[name] = []
-    with open(coords_fpath) as coordfile:
-        for line in coordfile:
-            s1 = int(line.split('|')[0].split()[0])
-            e1 = int(line.split('|')[0].split()[1])
-            s2 = int(line.split('|')[1].split()[0])
-            e2 = int(line.split('|')[1].split()[1])
-            contig_name = line.split()[12].strip()
-            chr_name = line.split()[11].strip()
-
-            if chr_name not in genome_mapping:
-                logger.error("Something went wrong and chromosome names in your coords file (" + coords_base_fpath + ") " \
-                             "differ from the names in the reference. Try to remove the file and restart QUAST.")
-                return None
-
-            if gene_searching_enabled:
-                aligned_blocks_by_contig_name[contig_name].append(AlignedBlock(seqname=chr_name, start=s1, end=e1,
-                                                                               contig=contig_name, start_in_contig=s2, end_in_contig=e2))
-            for i in range(s1, e1 + 1):
-                genome_mapping[chr_name][i] = 1
-
-    for chr_name in genome_mapping.keys():
-        for i in ns_by_chromosomes[chr_name]:
-            genome_mapping[chr_name][i] = 0
-        ref_lengths[chr_name] = sum(genome_mapping[chr_name])
+    for mapping in iter_mappings(coords_fpath):
+        chr_name = mapping.ref
+        if chr_name not in aligned_intervals:
+            logger.error("Something went wrong and chromosome names in your coords file (" + coords_base_fpath + ") " \
+                         "differ from the names in the reference. Try to remove the file and restart QUAST.")
+            return None
+
+        if gene_searching_enabled:
+            aligned_blocks_by_contig_name[mapping.contig].append(AlignedBlock(seqname=chr_name, start=mapping.s1, end=mapping.e1,
+                                                                              contig=mapping.contig, start_in_contig=mapping.s2,
+                                                                              end_in_contig=mapping.e2))
+        aligned_intervals[chr_name].append((mapping.s1, mapping.e1))
+
+    ns_intervals = {}
+    for chr_name in aligned_intervals.keys():
+        aligned_intervals[chr_name] = merge_intervals(aligned_intervals[chr_name])
+        ns_intervals[chr_name] = ns_by_chromosomes[chr_name].intervals()
+        ref_lengths[chr_name] = intervals_length(aligned_intervals[chr_name]) - \
+                                ns_by_chromosomes[chr_name].overlap(aligned_intervals[chr_name])
 
     if qconfig.space_efficient and coords_fpath.endswith('.filtered'):
         os.remove(coords_fpath)
+        qutils.safe_rm(get_store_fpath(coords_fpath))
 
     # counting genome coverage and gaps number
     gaps_count = 0
@@ -145,18 +141,11 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
         with open(gaps_fpath, 'w') as gaps_file:
             for chr_name, chr_len in reference_chromosomes.items():
                 gaps_file.write(chr_name + '\n')
-                cur_gap_size = 0
-                for i in range(1, chr_len + 1):
-                    if genome_mapping[chr_name][i] == 1 or i in ns_by_chromosomes[chr_name]:
-                        if cur_gap_size >= qconfig.min_gap_size:
-                            gaps_count += 1
-                            gaps_file.write(str(i - cur_gap_size) + ' ' + str(i - 1) + '\n')
-                        cur_gap_size = 0
-                    else:
-                        cur_gap_size += 1
-                if cur_gap_size >= qconfig.min_gap_size:
-                    gaps_count += 1
-                    gaps_file.write(str(chr_len - cur_gap_size + 1) + ' ' + str(chr_len) + '\n')
+                aligned_or_ns_intervals = merge_intervals(aligned_intervals[chr_name] + ns_intervals[chr_name])
+                for gap_start, gap_end in complement_intervals(aligned_or_ns_intervals, 1, chr_len):
+                    if gap_end - gap_start + 1 >= qconfig.min_gap_size:
+                        gaps_count += 1
+                        gaps_file.write(str(gap_start) + ' ' + str(gap_end) + '\n')
 
     results["gaps_count"] = gaps_count
     results[reporting.Fields.GENES + "_full"] = None
@@ -165,6 +154,14 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
     results[reporting.Fields.OPERONS + "_partial"] = None
 
     # finding genes and operons
+    blocks_by_chr = defaultdict(list)
+    if gene_searching_enabled:
+        for contig_id, name in enumerate(sorted_contigs_names):
+            for cur_block in aligned_blocks_by_contig_name[name]:
+                block_order = len(blocks_by_chr[cur_block.seqname])
+                blocks_by_chr[cur_block.seqname].append((cur_block.start, cur_block.end, (block_order, contig_id, cur_block)))
+    blocks_index_by_chr = dict((chr_name, IntervalIndex(blocks)) for chr_name, blocks in blocks_by_chr.items())
+
     for container in containers:
         if not container.region_list:
             continue
@@ -182,41 +179,31 @@ def process_single_file(contigs_fpath, index, coords_dirpath, genome_stats_dirpa
         found_list = [0] * len(container.region_list)
         for i, region in enumerate(container.region_list):
             found_list[i] = 0
-            gene_blocks = []
             if region.id is None:
                 region.id = '# ' + str(region.number + 1)
-            for contig_id, name in enumerate(sorted_contigs_names):
-                cur_feature_is_found = False
-                for cur_block in aligned_blocks_by_contig_name[name]:
-                    if cur_block.seqname != region.seqname:
-                        continue
-                    if region.end <= cur_block.start or cur_block.end <= region.start:
-                        continue
-                    elif cur_block.start <= region.start and region.end <= cur_block.end:
-                        if found_list[i] == 2:  # already found as partial gene
-                            total_partial -= 1
-                        found_list[i] = 1
-                        total_full += 1
-                        contig_info = cur_block.format_gene_info(region)
-                        found_file.write('%s\t\t%d\t%d\tcomplete\t%s\n' % (region.id, region.start, region.end, contig_info))
-                        if container.kind == 'operon':
-                            operons_in_contigs[contig_id] += 1  # inc number of found genes/operons in id-th contig
-                        else:
-                            features_in_contigs[contig_id] += 1
-
-                        cur_feature_is_found = True
-                        break
-                    elif min(region.end, cur_block.end) - max(region.start, cur_block.start) >= qconfig.min_gene_overlap:
-                        if found_list[i] == 0:
-                            found_list[i] = 2
-                            total_partial += 1
-                        gene_blocks.append(cur_block)
-                    if cur_feature_is_found:
-                        break
-                if cur_feature_is_found:
-                    break
+            if region.seqname not in blocks_index_by_chr:
+                continue
+            # blocks are checked in the order of contigs (from the largest one) and then in the order of alignments
+            overlapping_blocks = sorted(blocks_index_by_chr[region.seqname].find_overlaps(region.start, region.end))
+            full_blocks = [(block_order, contig_id, block) for block_order, contig_id, block in overlapping_blocks
+                           if block.start <= region.start and region.end <= block.end]
+            if full_blocks:
+                found_list[i] = 1
+                total_full += 1
+                _, contig_id, cur_block = full_blocks[0]
+                contig_info = cur_block.format_gene_info(region)
+                found_file.write('%s\t\t%d\t%d\tcomplete\t%s\n' % (region.id, region.start, region.end, contig_info))
+                if container.kind == 'operon':
+                    operons_in_contigs[contig_id] += 1  # inc number of found genes/operons in id-th contig
+                else:
+                    features_in_contigs[contig_id] += 1
+                continue
+            gene_blocks = [block for _, _, block in overlapping_blocks
+                           if min(region.end, block.end) - max(region.start, block.start) >= qconfig.min_gene_overlap]
             # adding info about partially found genes/operons
-            if found_list[i] == 2:  # partial gene/operon
+            if gene_blocks:
+                found_list[i] = 2
+                total_partial += 1
                 contig_info = ','.join([block.format_gene_info(region) for block in sorted(gene_blocks, key=lambda block: block.start)])
                 found_file.write('%s\t\t%d\t%d\tpartial\t%s\n' % (region.id, region.start, region.end, contig_info))
 
@@ -252,7 +239,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
     if not os.path.isdir(genome_stats_dirpath):
         os.mkdir(genome_stats_dirpath)
 
-    genome_size, reference_chromosomes, ns_by_chromosomes = fastaparser.get_genome_stats(ref_fpath)
+    genome_size, reference_chromosomes, ns_by_chromosomes = reference_profile.get(ref_fpath).get_genome_stats()
 
     # reading genome size
     # genome_size = fastaparser.get_lengths_from_fastafile(reference)[0]
@@ -319,7 +306,7 @@ def do(ref_fpath, aligned_contigs_fpaths, output_dirpath, features_dict, operons
 
     # process all contig files
     num_nf_errors = logger._num_nf_errors
-    n_jobs = min(len(aligned_contigs_fpaths), qconfig.max_threads)
+    n_jobs = min(len(aligned_contigs_fpaths), qutils.get_max_threads())
 
     parallel_run_args = [(contigs_fpath, index, coords_dirpath, genome_stats_dirpath,
                           reference_chromosomes, ns_by_chromosomes, containers)
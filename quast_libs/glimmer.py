@@ -24,22 +24,12 @@ from quast_libs.qutils import compile_tool, get_path_to_program, run_parallel
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
 OUTPUT_FASTA = False # whether output only .gff or with corresponding .fasta files
+CHUNK_SIZE = 1000 * 1000  # total length of contigs processed by one task
+CHUNKS_PER_THREAD = 4
 
 
-def merge_gffs(gffs, out_path):
-    '''Merges all GFF files into a single one, dropping GFF header.'''
-    out_file = open_gzipsafe(out_path, 'w')
-    out_file.write('##gff-version 3\n')
-    for gff_path in gffs:
-        with open(gff_path) as gff_file:
-            out_file.writelines(itertools.islice(gff_file, 2, None))
-    out_file.close()
-    return out_path
-
-
-def parse_gff(gff_path):
-    gff_file = open_gzipsafe(gff_path)
-    r = csv.reader(list(filter(lambda l: not l.startswith("#"), gff_file)),
+def parse_gff(gff_lines):
+    r = csv.reader(list(filter(lambda l: not l.startswith("#"), gff_lines)),
         delimiter='\t')
     for index, _source, type, start, end, score, strand, phase, extra in r:
         if type != 'mRNA':
@@ -47,12 +37,41 @@ def parse_gff(gff_path):
 
         attrs = dict(kv.split("=") for kv in extra.split(";"))
         yield index, attrs.get('Name'), int(start), int(end), strand
-    gff_file.close()
 
 
-def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths, err_path, tmp_dir, index):
-    def run(contig_path, tmp_path):
-        with open(err_path, 'a') as err_file:
+def get_genes(gff_lines, contig_seq):
+    genes = []
+    for contig, gene_id, start, end, strand in parse_gff(gff_lines):
+        if strand == '+':
+            gene_seq = contig_seq[start - 1:end]
+        else:
+            gene_seq = rev_comp(contig_seq[start - 1:end])
+        gene = Gene(contig=contig, start=start, end=end, strand=strand, seq=gene_seq)
+        gene.is_full = gene.start > 1 and gene.end < len(contig_seq)
+        genes.append(gene)
+    return genes
+
+
+def iter_chunks(fasta_fpath, chunk_size):
+    """
+        Generator of consecutive groups of contigs with total length of about chunk_size
+    """
+    chunk = []
+    chunk_len = 0
+    for name, seq in read_fasta(fasta_fpath):
+        chunk.append((name[:qutils.MAX_CONTIG_NAME_GLIMMER], seq))
+        chunk_len += len(seq)
+        if chunk_len >= chunk_size:
+            yield chunk
+            chunk = []
+            chunk_len = 0
+    if chunk:
+        yield chunk
+
+
+def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths, err_path, tmp_dir, index, threads=1):
+    def run(contig_path, tmp_path, chunk_err_path):
+        with open(chunk_err_path, 'a') as err_file:
             return_code = qutils.call_subprocess(
                 [tool_exec_fpath, contig_path, '-d', trained_dir, '-g', '-o', tmp_path],
                 stdout=err_file,
@@ -60,55 +79,69 @@ def glimmerHMM(tool_dir, tool_exec_fpath, fasta_fpath, out_fpath, gene_lengths,
                 indent='  ' + qutils.index_to_str(index) + '  ')
             return return_code
 
+    def run_chunk(chunk):
+        # glimmerhmm predicts genes only in the first sequence of a file, so contigs of a chunk are processed one by one
+        chunk_dir = tempfile.mkdtemp(dir=base_dir)
+        contig_path = os.path.join(chunk_dir, 'contig.fasta')
+        gff_path = os.path.join(chunk_dir, 'contig.gff')
+        chunk_err_path = os.path.join(chunk_dir, 'glimmer.stderr')
+        open(chunk_err_path, 'w').close()
+        chunk_results = []
+        for ind, seq in chunk:
+            write_fasta(contig_path, [(ind, seq)])
+            if run(contig_path, gff_path, chunk_err_path) == 0:
+                with open(gff_path) as gff_file:
+                    gff_lines = list(itertools.islice(gff_file, 2, None))  # dropping GFF header
+                chunk_results.append((gff_lines, get_genes(gff_lines, seq)))
+        with open(chunk_err_path) as chunk_err_file:
+            chunk_err = chunk_err_file.read()
+        return chunk_results, chunk_err
+
     # Note: why arabidopsis? for no particular reason, really.
     trained_dir = os.path.join(tool_dir, 'trained', 'arabidopsis')
 
-    contigs = {}
-    gffs = []
     base_dir = tempfile.mkdtemp(dir=tmp_dir)
-    for seq_num, (ind, seq) in enumerate(read_fasta(fasta_fpath)):
-        seq_num = str(seq_num)
-        ind = ind[:qutils.MAX_CONTIG_NAME_GLIMMER]
-        contig_path = os.path.join(base_dir, seq_num + '.fasta')
-        gff_path = os.path.join(base_dir, seq_num + '.gff')
-
-        write_fasta(contig_path, [(ind, seq)])
-        if run(contig_path, gff_path) == 0:
-            gffs.append(gff_path)
-            contigs[ind] = seq
-
-    if not gffs:
-        return None, None, None, None, None, None
-
     out_gff_fpath = out_fpath + '_genes.gff' + ('.gz' if not qconfig.no_gzip else '')
-    out_gff_path = merge_gffs(gffs, out_gff_fpath)
-    unique, total = set(), 0
+    out_gff_file = None
     genes = []
-    for contig, gene_id, start, end, strand in parse_gff(out_gff_path):
-        total += 1
-        if strand == '+':
-            gene_seq = contigs[contig][start - 1:end]
-        else:
-            gene_seq = rev_comp(contigs[contig][start - 1:end])
-        if gene_seq not in unique:
-            unique.add(gene_seq)
-        gene = Gene(contig=contig, start=start, end=end, strand=strand, seq=gene_seq)
-        gene.is_full = gene.start > 1 and gene.end < len(contigs[contig])
-        genes.append(gene)
+    chunks = iter_chunks(fasta_fpath, CHUNK_SIZE)
+    try:
+        while True:
+            # chunks are processed in portions to keep only a few contigs in memory, GFFs are merged in the order of contigs
+            chunks_portion = list(itertools.islice(chunks, threads * CHUNKS_PER_THREAD))
+            if not chunks_portion:
+                break
+            for chunk_results, chunk_err in qutils.run_in_threads(run_chunk, [(chunk,) for chunk in chunks_portion], threads):
+                with open(err_path, 'a') as err_file:
+                    err_file.write(chunk_err)
+                for gff_lines, contig_genes in chunk_results:
+                    if out_gff_file is None:
+                        out_gff_file = open_gzipsafe(out_gff_fpath, 'w')
+                        out_gff_file.write('##gff-version 3\n')
+                    out_gff_file.writelines(gff_lines)
+                    genes.extend(contig_genes)
+    finally:
+        if out_gff_file is not None:
+            out_gff_file.close()
+        if not qconfig.debug:
+            shutil.rmtree(base_dir)
+
+    if out_gff_file is None:
+        return None, None, None, None, None, None
 
+    unique = set(gene.seq for gene in genes)
+    total = len(genes)
     full_cnt = [sum([gene.end - gene.start >= threshold for gene in genes if gene.is_full]) for threshold in gene_lengths]
     partial_cnt = [sum([gene.end - gene.start >= threshold for gene in genes if not gene.is_full]) for threshold in gene_lengths]
     if OUTPUT_FASTA:
         out_fasta_fpath = out_fpath + '_genes.fasta'
         add_genes_to_fasta(genes, out_fasta_fpath)
-    if not qconfig.debug:
-        shutil.rmtree(base_dir)
 
     #return out_gff_path, out_fasta_path, len(unique), total, cnt
-    return out_gff_path, genes, len(unique), total, full_cnt, partial_cnt
+    return out_gff_fpath, genes, len(unique), total, full_cnt, partial_cnt
 
 
-def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath):
+def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath, threads):
     assembly_label = qutils.label_from_fpath(contigs_fpath)
     corr_assembly_label = qutils.label_from_fpath_for_fname(contigs_fpath)
 
@@ -121,7 +154,7 @@ def predict_genes(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath,
     #    fasta_path, out_path, gene_lengths, err_path)
 
     out_gff_path, genes, unique, total, full_genes, partial_genes = glimmerHMM(tool_dirpath, tool_exec_fpath,
-        contigs_fpath, out_fpath, gene_lengths, err_fpath, tmp_dirpath, index)
+        contigs_fpath, out_fpath, gene_lengths, err_fpath, tmp_dirpath, index, threads)
 
     if out_gff_path:
         logger.info('  ' + qutils.index_to_str(index) + '  Genes = ' + str(unique) + ' unique, ' + str(total) + ' total')
@@ -154,8 +187,9 @@ def do(contigs_fpaths, gene_lengths, out_dirpath):
     if not os.path.isdir(tmp_dirpath):
         os.makedirs(tmp_dirpath)
 
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    parallel_args = [(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath)
+    n_jobs = min(len(contigs_fpaths), qutils.get_max_threads())
+    threads = max(1, qutils.get_max_threads() // n_jobs)
+    parallel_args = [(index, contigs_fpath, gene_lengths, out_dirpath, tool_dirpath, tool_exec_fpath, tmp_dirpath, threads)
                      for index, contigs_fpath in enumerate(contigs_fpaths)]
     genes_list, unique, full_genes, partial_genes = run_parallel(predict_genes, parallel_args, n_jobs)
 
@@ -25,7 +25,7 @@ except ImportError:
 import os
 import re
 from collections import defaultdict
-from quast_libs import qconfig, qutils, fastaparser, genome_analyzer
+from quast_libs import qconfig, qutils, genome_analyzer, reference_profile
 from quast_libs.ca_utils.misc import ref_labels_by_chromosomes
 import quast_libs.html_saver.html_saver as html_saver
 
@@ -52,10 +52,9 @@ def do(contigs_fpaths, contig_report_fpath_pattern, output_dirpath, ref_fpath,
     features_data = None
 
     if ref_fpath:
-        for name, seq in fastaparser.read_fasta(ref_fpath):
+        for name, chr_len in reference_profile.get(ref_fpath).chr_lengths.items():
             chr_name = name.split()[0]
             chr_names.append(chr_name)
-            chr_len = len(seq)
             total_genome_size += chr_len
             reference_chromosomes[chr_name] = chr_len
         virtual_genome_shift = 100
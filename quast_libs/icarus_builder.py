@@ -65,7 +65,7 @@ def add_contig_structure_data(data_str, structure, ref_contigs, chr_full_names,
             data_str.append('{corr_start: ' + str(corr_el_start) + ',corr_end: ' +
                             str(corr_el_end) + ',start:' + str(el.unshifted_start) + ',end:' + str(el.unshifted_end) +
                             ',start_in_contig:' + str(el.start_in_contig) + ',end_in_contig:' +
-                            str(el.end_in_contig) + ',IDY:' + el.idy + ',chr: "' + chr_names_by_id[el.ref_name] + '"},')
+                            str(el.end_in_contig) + ',IDY:' + str(el.idy) + ',chr: "' + chr_names_by_id[el.ref_name] + '"},')
         elif type(el) == str:
             ms_description, ms_type = parse_misassembly_info(el)
             data_str.append('{contig_type: "M", mstype: "' + ms_type + '", msg: "' + ms_description + '"},')
@@ -275,7 +275,7 @@ def add_contig(cum_length, contig, not_used_nx, assemblies_n50, assembly, contig
                     structure.append('{contig:"' + contig.name + '",corr_start: ' + str(el.start) + ',corr_end: ' +
                                     str(el.end) + ',start:' + str(el.unshifted_start) + ',end:' + str(el.unshifted_end) +
                                     ',start_in_contig:' + str(el.start_in_contig) + ',end_in_contig:' +
-                                    str(el.end_in_contig) + ',size:' + str(contig.size) + ',IDY:' + el.idy + ',chr:"' + el.ref_name + '"},')
+                                    str(el.end_in_contig) + ',size:' + str(contig.size) + ',IDY:' + str(el.idy) + ',chr:"' + el.ref_name + '"},')
                 elif type(el) == str:
                     ms_description, ms_type = parse_misassembly_info(el)
                     structure.append('{contig_type: "M", mstype: "' + ms_type + '", msg: "' + ms_description + '"},')
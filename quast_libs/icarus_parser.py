@@ -66,7 +66,7 @@ def parse_aligner_contig_report(report_fpath, ref_names, cumulative_ref_lengths)
                 block = Alignment(
                     name=contig_id, start=start, end=end, unshifted_start=unshifted_start, unshifted_end=unshifted_end,
                     is_rc=is_rc, start_in_contig=start_in_contig, end_in_contig=end_in_contig, position_in_ref=position_in_ref, ref_name=ref_name,
-                    idy=idy, is_best_set=is_best == 'True')
+                    idy=float(idy), is_best_set=is_best == 'True')
                 block.ambiguous = ambiguity
                 if block.is_best_set:
                     misassembled_id_to_structure[contig_id].append(block)
@@ -80,8 +80,8 @@ def parse_aligner_contig_report(report_fpath, ref_names, cumulative_ref_lengths)
 
 def parse_contigs_fpath(contigs_fpath):
     contigs = []
-    for name, seq in fastaparser.read_fasta(contigs_fpath):
-        contig = Contig(name=name, size=len(seq))
+    for name, seq_len in fastaparser.read_fasta_lengths(contigs_fpath):
+        contig = Contig(name=name, size=seq_len)
         contigs.append(contig)
     return contigs
 
@@ -10,12 +10,17 @@
 from __future__ import with_statement
 
 import os
+from bisect import bisect_left, bisect_right
 
 from quast_libs import qconfig, qutils
 from quast_libs.html_saver.html_saver import trim_ref_name
 
 
-class Alignment:
+class Alignment(object):
+    __slots__ = ('name', 'start', 'end', 'unshifted_start', 'unshifted_end', 'is_rc', 'idy', 'start_in_contig',
+                 'end_in_contig', 'position_in_ref', 'ref_name', 'is_best_set', 'order', 'similar', 'misassembled',
+                 'misassemblies', 'color', 'vPositionDelta', 'ambiguous', 'label')
+
     def __init__(self, name, start, end, unshifted_start=None, unshifted_end=None, is_rc=None,
                  start_in_contig=None, end_in_contig=None, position_in_ref=None, ref_name=None, idy=None, is_best_set=None):
         self.name = name
@@ -72,6 +77,7 @@ class Assembly:
         self.alignments = []
         self.misassembled_contig_ids = []
         self.contigs_by_ids = {}
+        self.alignments_by_refs = None  # ref_name -> (sorted starts, ids of alignments), built by the first find
 
         i = 0
         for block in aligned_blocks:
@@ -91,18 +97,31 @@ class Assembly:
             self.alignments.append(block)
             self.contigs_by_ids[c_id].alignments.append(len(self.alignments) - 1)
 
+    def index_alignments(self):
+        self.alignments_by_refs = {}
+        for i, block in sorted(enumerate(self.alignments), key=lambda x: (x[1].start, x[0])):
+            starts, ids = self.alignments_by_refs.setdefault(block.ref_name, ([], []))
+            starts.append(block.start)
+            ids.append(i)
+
     def find(self, alignment):
+        """
+            Returns the id of the first alignment similar to the given one (see Alignment.compare_inexact) or -1.
+            Only alignments of the same reference starting within the allowed distance are compared
+        """
         if alignment.length() < qconfig.min_similar_contig_size:
             return -1
 
-        i = 0
-        while i < len(self.alignments) and not alignment.compare_inexact(self.alignments[i]):
-            i += 1
-
-        if i == len(self.alignments):
+        if self.alignments_by_refs is None:
+            self.index_alignments()
+        if alignment.ref_name not in self.alignments_by_refs:
             return -1
-        else:
-            return i
+        starts, ids = self.alignments_by_refs[alignment.ref_name]
+        max_delta = qconfig.contig_len_delta * abs(alignment.end - alignment.start) + 1  # + 1 for rounding errors
+        first_idx = bisect_left(starts, alignment.start - max_delta)
+        last_idx = bisect_right(starts, alignment.start + max_delta)
+        similar_ids = [i for i in ids[first_idx:last_idx] if alignment.compare_inexact(self.alignments[i])]
+        return min(similar_ids) if similar_ids else -1
 
     def apply_color(self, settings):
         for block in self.alignments:
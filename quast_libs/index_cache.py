@@ -0,0 +1,199 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Shared on-disk cache of tool indexes (minimap2 .mmi, BWA index, KMC database of the reference, BLAST databases).
+# An entry is keyed by checksums of the indexed file and of the tool binary and by the tool parameters.
+# Entries are built in private temporary directories and published by an atomic rename, entries in use are locked,
+# so concurrent QUAST runs on one host can share the cache. The least recently used entries are removed
+# when the cache exceeds the size limit.
+#
+############################################################################
+
+from __future__ import with_statement
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from os.path import basename, getmtime, getsize, isdir, join
+
+from quast_libs import qconfig
+from quast_libs.log import get_logger
+from quast_libs.qutils import checksum
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+INDEX_CACHE_ENV_VAR = 'QUAST_INDEX_CACHE'
+INDEX_NAME = 'index'  # index files in an entry are named 'index' + suffix, e.g. index.bwt
+LOCK_FNAME = '.lock'
+TMP_PREFIX = '.tmp_'
+TRASH_PREFIX = '.trash_'
+MAX_TMP_AGE = 24 * 60 * 60  # temporary directories of interrupted runs are removed after one day
+MAX_BUILD_ATTEMPTS = 2  # an entry is built once more if another run removed it before it was locked
+
+_locked_entries = dict()  # entry dirpath -> open lock file (locks are held until the end of the run)
+
+
+def get_cache_dirpath():
+    cache_dirpath = qconfig.index_cache_dirpath or os.environ.get(INDEX_CACHE_ENV_VAR)
+    return os.path.abspath(os.path.expanduser(cache_dirpath)) if cache_dirpath else None
+
+
+def get_entry_name(tool_fpath, input_fpath, params):
+    key_items = [checksum(input_fpath), checksum(tool_fpath)] + [str(param) for param in params]
+    return basename(tool_fpath) + '_' + hashlib.md5('\t'.join(key_items).encode()).hexdigest()
+
+
+def _get_dir_size(dirpath):
+    return sum(getsize(join(dirpath, fname)) for fname in os.listdir(dirpath))
+
+
+def _lock_entry(entry_dirpath):
+    """
+        Takes a shared lock of the entry, so it will not be removed while this run uses it
+        Returns False if the entry was removed by another run
+    """
+    if entry_dirpath in _locked_entries:
+        return True
+    lock_fpath = join(entry_dirpath, LOCK_FNAME)
+    try:
+        lock_file = open(lock_fpath)
+    except IOError:
+        return False
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    try:
+        is_same_entry = os.fstat(lock_file.fileno()).st_ino == os.stat(lock_fpath).st_ino
+    except OSError:
+        is_same_entry = False
+    if not is_same_entry:  # the entry was removed before it was locked
+        lock_file.close()
+        return False
+    _locked_entries[entry_dirpath] = lock_file
+    return True
+
+
+def _remove_entry(entry_dirpath):
+    """
+        Removes the entry if no run uses it
+        Returns True if the entry was removed
+    """
+    try:
+        lock_file = open(join(entry_dirpath, LOCK_FNAME))
+    except IOError:
+        return False
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError:
+        lock_file.close()
+        return False
+    trash_dirpath = join(os.path.dirname(entry_dirpath), TRASH_PREFIX + basename(entry_dirpath) + '_' + str(os.getpid()))
+    try:
+        os.rename(entry_dirpath, trash_dirpath)
+    except OSError:
+        return False
+    finally:
+        lock_file.close()
+    shutil.rmtree(trash_dirpath, ignore_errors=True)
+    return True
+
+
+def _evict_entries(cache_dirpath, new_entry_dirpath):
+    max_size = qconfig.index_cache_max_size * 1024 ** 3
+    entries = []
+    for fname in os.listdir(cache_dirpath):
+        fpath = join(cache_dirpath, fname)
+        try:
+            if fname.startswith(TRASH_PREFIX) or (fname.startswith(TMP_PREFIX) and time.time() - getmtime(fpath) > MAX_TMP_AGE):
+                shutil.rmtree(fpath, ignore_errors=True)
+            elif not fname.startswith('.') and isdir(fpath):
+                entries.append((getmtime(fpath), _get_dir_size(fpath), fpath))
+        except OSError:  # removed by another run
+            continue
+    total_size = sum(size for last_used, size, fpath in entries)
+    for last_used, size, entry_dirpath in sorted(entries):
+        if total_size <= max_size:
+            break
+        if entry_dirpath != new_entry_dirpath and entry_dirpath not in _locked_entries and _remove_entry(entry_dirpath):
+            logger.debug('Removed index ' + entry_dirpath + ' from the index cache')
+            total_size -= size
+
+
+def _build_entry(cache_dirpath, entry_dirpath, build_index):
+    tmp_dirpath = tempfile.mkdtemp(prefix=TMP_PREFIX + basename(entry_dirpath) + '_', dir=cache_dirpath)
+    try:
+        if not build_index(join(tmp_dirpath, INDEX_NAME)):
+            return False
+        open(join(tmp_dirpath, LOCK_FNAME), 'w').close()
+        os.chmod(tmp_dirpath, 0o755)  # mkdtemp creates a private directory
+        try:
+            os.rename(tmp_dirpath, entry_dirpath)
+        except OSError:
+            if not isdir(entry_dirpath):
+                raise
+            # the same index was published by another run
+    finally:
+        if isdir(tmp_dirpath):
+            shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    return True
+
+
+def _get_entry(cache_dirpath, entry_name, build_index):
+    entry_dirpath = join(cache_dirpath, entry_name)
+    build_attempts = 0
+    while not _lock_entry(entry_dirpath):
+        if build_attempts == MAX_BUILD_ATTEMPTS:  # e.g. the lock file of the entry can't be opened
+            raise IOError('cannot lock ' + entry_dirpath)
+        if not isdir(cache_dirpath):
+            try:
+                os.makedirs(cache_dirpath)
+            except OSError:  # created by another run
+                pass
+        if not _build_entry(cache_dirpath, entry_dirpath, build_index):
+            return None
+        build_attempts += 1
+    os.utime(entry_dirpath, None)  # the time of the last use
+    if build_attempts:
+        _evict_entries(cache_dirpath, entry_dirpath)
+    return entry_dirpath
+
+
+def _link_index(entry_dirpath, index_prefix):
+    for fname in os.listdir(entry_dirpath):
+        if not fname.startswith(INDEX_NAME):
+            continue
+        link_fpath = index_prefix + fname[len(INDEX_NAME):]
+        tmp_link_fpath = link_fpath + '.tmp' + str(os.getpid())
+        if os.path.lexists(tmp_link_fpath):
+            os.remove(tmp_link_fpath)
+        os.symlink(join(entry_dirpath, fname), tmp_link_fpath)
+        os.rename(tmp_link_fpath, link_fpath)
+
+
+def get_index(tool_fpath, input_fpath, params, build_index, index_prefix, link=True):
+    """
+        Returns the path prefix of index files of input_fpath or None if the index was not built.
+        build_index(prefix) must create index files (prefix + suffix) and return True on success,
+        it is called with index_prefix if the cache is disabled and only for a new cache entry otherwise.
+        If link is True, cached files are symlinked to index_prefix + suffix and index_prefix is returned.
+        index_prefix may be None if link is False, then the index is built only in the cache
+    """
+    cache_dirpath = get_cache_dirpath()
+    if cache_dirpath:
+        try:
+            entry_dirpath = _get_entry(cache_dirpath, get_entry_name(tool_fpath, input_fpath, params), build_index)
+            if entry_dirpath is None:
+                return None
+            if not link:
+                return join(entry_dirpath, INDEX_NAME)
+            _link_index(entry_dirpath, index_prefix)
+            return index_prefix
+        except (IOError, OSError) as e:
+            logger.notice('Failed to use the index cache ' + cache_dirpath + ' (' + str(e) + '), '
+                          'the index is built without the cache.')
+    if index_prefix is None:
+        return None
+    return index_prefix if build_index(index_prefix) else None
@@ -0,0 +1,146 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Arithmetic on closed 1-based intervals [start, end] used instead of per-base arrays
+# for computing reference coverage, and an index for searching intervals overlapping a query.
+#
+############################################################################
+
+from __future__ import with_statement
+import re
+from bisect import bisect_left, bisect_right
+
+
+def merge_intervals(intervals):
+    """
+        Takes iterable of intervals (start, end)
+        Returns sorted list of disjoint non-adjacent intervals [start, end] covering the same positions
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if start > end:
+            continue
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def intervals_length(intervals):
+    return sum(end - start + 1 for start, end in intervals)
+
+
+def intersection_length(intervals1, intervals2):
+    """
+        Takes two sorted lists of disjoint intervals
+        Returns number of positions covered by both lists
+    """
+    total_len = 0
+    i, j = 0, 0
+    while i < len(intervals1) and j < len(intervals2):
+        start = max(intervals1[i][0], intervals2[j][0])
+        end = min(intervals1[i][1], intervals2[j][1])
+        if start <= end:
+            total_len += end - start + 1
+        if intervals1[i][1] < intervals2[j][1]:
+            i += 1
+        else:
+            j += 1
+    return total_len
+
+
+def complement_intervals(intervals, start, end):
+    """
+        Takes sorted list of disjoint intervals and bounds of a region
+        Returns sorted list of intervals [start, end] of the region not covered by the list
+    """
+    complement = []
+    cur_pos = start
+    for interval_start, interval_end in intervals:
+        if interval_end < cur_pos:
+            continue
+        if interval_start > end:
+            break
+        if interval_start > cur_pos:
+            complement.append([cur_pos, interval_start - 1])
+        cur_pos = interval_end + 1
+    if cur_pos <= end:
+        complement.append([cur_pos, end])
+    return complement
+
+
+class NsIndex(object):
+    """
+        Positions of N's in a sequence stored as sorted runs [start, end] of consecutive N's (1-based)
+    """
+    def __init__(self, seq=''):
+        self.starts = []
+        self.ends = []
+        self.total_len = 0
+        for match in re.finditer('N+', seq):
+            self.starts.append(match.start() + 1)
+            self.ends.append(match.end())
+            self.total_len += match.end() - match.start()
+
+    def __len__(self):
+        return self.total_len
+
+    def __contains__(self, pos):
+        run_idx = bisect_right(self.starts, pos) - 1
+        return run_idx >= 0 and pos <= self.ends[run_idx]
+
+    def intervals(self):
+        return [[start, end] for start, end in zip(self.starts, self.ends)]
+
+    def overlap(self, intervals):
+        """
+            Takes sorted list of disjoint intervals
+            Returns number of N's inside them
+        """
+        return intersection_length(intervals, self.intervals())
+
+
+class IntervalIndex(object):
+    """
+        Static index of intervals (start, end) with attached items.
+        Intervals are sorted by start and the implicit binary tree over them stores maximal ends of subtrees,
+        so a query visits only subtrees containing overlapping intervals
+    """
+    def __init__(self, intervals_with_items):
+        intervals_with_items = sorted(intervals_with_items, key=lambda interval_with_item: interval_with_item[0])
+        self.starts = [start for start, end, item in intervals_with_items]
+        self.ends = [end for start, end, item in intervals_with_items]
+        self.items = [item for start, end, item in intervals_with_items]
+        self.leaves_num = 1
+        while self.leaves_num < len(self.starts):
+            self.leaves_num *= 2
+        self.max_ends = [None] * (2 * self.leaves_num)
+        self.max_ends[self.leaves_num:self.leaves_num + len(self.ends)] = self.ends
+        for node in range(self.leaves_num - 1, 0, -1):
+            children_ends = [end for end in self.max_ends[2 * node:2 * node + 2] if end is not None]
+            self.max_ends[node] = max(children_ends) if children_ends else None
+
+    def find_overlaps(self, start, end):
+        """
+            Returns items of intervals (s, e) with s < end and e > start in the order of interval starts
+        """
+        last_idx = bisect_left(self.starts, end)  # intervals starting at or after the query end are skipped
+        found = []
+        stack = [(1, 0, self.leaves_num)]  # (node, index of the first leaf, number of leaves)
+        while stack:
+            node, first_idx, node_size = stack.pop()
+            if first_idx >= last_idx or self.max_ends[node] is None or self.max_ends[node] <= start:
+                continue
+            if node_size == 1:
+                found.append(self.items[first_idx])
+            else:
+                node_size //= 2
+                stack.append((2 * node + 1, first_idx + node_size, node_size))
+                stack.append((2 * node, first_idx, node_size))
+        return found
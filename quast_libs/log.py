@@ -7,12 +7,46 @@
 from __future__ import with_statement
 import os
 import sys
+import threading
 from datetime import datetime
 from quast_libs import qconfig
 
 import logging
 
 _loggers = {}
+_thread_data = threading.local()
+
+
+class BufferingFilter(logging.Filter):
+    """
+        Keeps records in the buffer of the current thread (if any) instead of passing them to handlers.
+        Processes forked by the thread log as usual
+    """
+    def filter(self, record):
+        records = get_log_records_buffer()
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+_buffering_filter = BufferingFilter()
+
+
+def buffer_log_records(records):
+    """
+        Records of all loggers in the current thread are appended to the list records until it is called with None
+    """
+    _thread_data.log_records = (os.getpid(), records)
+
+
+def get_log_records_buffer():
+    pid, records = getattr(_thread_data, 'log_records', (None, None))
+    return records if pid == os.getpid() else None
+
+
+def flush_log_records(records):
+    for record in records:
+        logging.getLogger(record.name).handle(record)
 
 
 def get_main_logger():
@@ -59,6 +93,7 @@ class QLogger(object):
         self._name = name
         self._logger = logging.getLogger(name)
         self._logger.setLevel(logging.DEBUG)
+        self._logger.addFilter(_buffering_filter)
 
     def set_up_metaquast(self, is_parallel_run=False, ref_name=None):
         self._is_metaquast = True
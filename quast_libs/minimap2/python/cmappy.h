@@ -5,6 +5,7 @@
 #include <string.h>
 #include <zlib.h>
 #include "minimap.h"
+#include "mmpriv.h"
 #include "kseq.h"
 KSEQ_DECLARE(gzFile)
 
@@ -101,6 +102,35 @@ static inline mm_reg1_t *mm_map_aux(const mm_idx_t *mi, const char *seq1, const
 	}
 }
 
+static char *mappy_map_paf(const mm_idx_t *mi, const char *name, const char *seq, mm_tbuf_t *b, const mm_mapopt_t *opt)
+{ // map one query and format its hits as the command-line tool does; returns NULL if there are no hits
+	mm_bseq1_t t;
+	mm_reg1_t *regs;
+	kstring_t s = {0,0,0}, paf = {0,0,0};
+	int i, n_regs;
+	memset(&t, 0, sizeof(mm_bseq1_t));
+	t.name = (char*)name, t.seq = (char*)seq, t.l_seq = strlen(seq);
+	regs = mm_map(mi, t.l_seq, t.seq, &n_regs, b, opt, name);
+	for (i = 0; i < n_regs; ++i) {
+		if (!(opt->flag & MM_F_NO_PRINT_2ND) || regs[i].id == regs[i].parent) {
+			mm_write_paf(&s, mi, &t, &regs[i], 0, opt->flag);
+			if (paf.l + s.l + 2 > paf.m) {
+				paf.m = paf.l + s.l + 2;
+				kroundup32(paf.m);
+				paf.s = (char*)realloc(paf.s, paf.m);
+			}
+			memcpy(paf.s + paf.l, s.s, s.l);
+			paf.l += s.l;
+			paf.s[paf.l++] = '\n';
+			paf.s[paf.l] = 0;
+		}
+		free(regs[i].p);
+	}
+	free(regs);
+	free(s.s);
+	return paf.s;
+}
+
 static inline char *mappy_revcomp(int len, const uint8_t *seq)
 {
 	int i;
@@ -106,6 +106,7 @@ cdef extern from "cmappy.h":
 	void mm_free_reg1(mm_reg1_t *r)
 	mm_reg1_t *mm_map_aux(const mm_idx_t *mi, const char *seq1, const char *seq2, int *n_regs, mm_tbuf_t *b, const mm_mapopt_t *opt)
 	char *mappy_fetch_seq(const mm_idx_t *mi, const char *name, int st, int en, int *l)
+	char *mappy_map_paf(const mm_idx_t *mi, const char *name, const char *seq, mm_tbuf_t *b, const mm_mapopt_t *opt) nogil
 
 	ctypedef struct kstring_t:
 		unsigned l, m
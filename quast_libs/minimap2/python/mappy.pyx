@@ -102,7 +102,8 @@ cdef class Aligner:
 	cdef cmappy.mm_idxopt_t idx_opt
 	cdef cmappy.mm_mapopt_t map_opt
 
-	def __cinit__(self, fn_idx_in, preset=None, k=None, w=None, min_cnt=None, min_chain_score=None, min_dp_score=None, bw=None, best_n=None, n_threads=3, fn_idx_out=None, max_frag_len=None):
+	def __cinit__(self, fn_idx_in, preset=None, k=None, w=None, min_cnt=None, min_chain_score=None, min_dp_score=None, bw=None, best_n=None, n_threads=3, fn_idx_out=None, max_frag_len=None,
+			extra_flags=None, a=None, b=None, q=None, e=None, q2=None, e2=None, sc_ambi=None, max_gap=None, mask_level=None, zdrop=None, mid_occ=None, min_mid_occ=None):
 		cmappy.mm_set_opt(NULL, &self.idx_opt, &self.map_opt) # set the default options
 		if preset is not None:
 			cmappy.mm_set_opt(str.encode(preset), &self.idx_opt, &self.map_opt) # apply preset
@@ -116,6 +117,19 @@ cdef class Aligner:
 		if bw is not None: self.map_opt.bw = bw
 		if best_n is not None: self.map_opt.best_n = best_n
 		if max_frag_len is not None: self.map_opt.max_frag_len = max_frag_len
+		if extra_flags is not None: self.map_opt.flag |= extra_flags
+		if a is not None: self.map_opt.a = a
+		if b is not None: self.map_opt.b = b
+		if q is not None: self.map_opt.q = q
+		if e is not None: self.map_opt.e = e
+		if q2 is not None: self.map_opt.q2 = q2
+		if e2 is not None: self.map_opt.e2 = e2
+		if sc_ambi is not None: self.map_opt.sc_ambi = sc_ambi
+		if max_gap is not None: self.map_opt.max_gap = max_gap
+		if mask_level is not None: self.map_opt.mask_level = mask_level
+		if zdrop is not None: self.map_opt.zdrop = self.map_opt.zdrop_inv = zdrop
+		if mid_occ is not None: self.map_opt.mid_occ = mid_occ
+		if min_mid_occ is not None: self.map_opt.min_mid_occ = min_mid_occ
 
 		cdef cmappy.mm_idx_reader_t *r;
 		if fn_idx_out is None:
@@ -165,6 +179,27 @@ cdef class Aligner:
 			cmappy.mm_free_reg1(&regs[i])
 		free(regs)
 
+	def map_paf(self, name, seq, buf=None):
+		"""Maps one query and returns its hits as PAF lines formatted by the minimap2 tool (empty string if there are no hits)"""
+		cdef ThreadBuffer b
+		cdef char *paf
+		cdef const char *c_name
+		cdef const char *c_seq
+
+		if self._idx is NULL: return None
+		if buf is None: b = ThreadBuffer()
+		else: b = buf
+
+		_name = name if isinstance(name, bytes) else name.encode()
+		_seq = seq if isinstance(seq, bytes) else seq.encode()
+		c_name, c_seq = _name, _seq
+		with nogil:
+			paf = cmappy.mappy_map_paf(self._idx, c_name, c_seq, b._b, &self.map_opt)
+		if paf is NULL: return ''
+		r = <bytes>paf
+		free(paf)
+		return r if isinstance(r, str) else r.decode()
+
 	def seq(self, str name, int start=0, int end=0x7fffffff):
 		cdef int l
 		cdef char *s = cmappy.mappy_fetch_seq(self._idx, name.encode(), start, end, &l)
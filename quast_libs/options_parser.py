@@ -74,6 +74,13 @@ def check_output_dir(option, opt_str, value, parser, logger):
                      'Please, use a different directory.')
 
 
+def set_index_cache_dir(option, opt_str, value, parser, logger):
+    dirpath = os.path.abspath(value)
+    check_dirpath(dirpath, 'You have specified ' + str(dirpath) + ' as an index cache directory.\n'
+                  'Please, use a different directory.')
+    setattr(qconfig, option.dest, dirpath)
+
+
 def set_extensive_mis_size(option, opt_str, value, parser, logger):
     if value <= qconfig.MAX_INDEL_LENGTH:
         logger.error("--extensive-mis-size should be greater than maximum indel length (%d)!"
@@ -684,6 +691,25 @@ def parse_options(logger, quast_args):
              callback_kwargs={'store_true_values': ['space_efficient'],
                               'store_false_values': ['show_snps', 'create_icarus_html']},)
          ),
+        (['--mappy'], dict(
+             dest='use_mappy',
+             action='store_true')
+         ),
+        (['--index-cache'], dict(
+             dest='index_cache_dirpath',
+             type='string',
+             action='callback',
+             callback=set_index_cache_dir,
+             callback_args=(logger,))
+         ),
+        (['--index-cache-max-size'], dict(
+             dest='index_cache_max_size',
+             type='int',
+             action='callback',
+             callback=check_arg_value,
+             callback_args=(logger,),
+             callback_kwargs={'default_value': qconfig.index_cache_max_size, 'min_value': 1})
+         ),
         (['--silent'], dict(
              dest='silent',
              action='store_true')
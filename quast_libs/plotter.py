@@ -240,7 +240,7 @@ def create_plot(plot_fpath, title, plots, legend_list=None, x_label=None, y_labe
     plt.close('all')
 
 
-def cumulative_plot(reference, contigs_fpaths, lists_of_lengths, plot_fpath, title):
+def cumulative_plot(reference, contigs_fpaths, lists_of_nx_stats, plot_fpath, title):
     if not can_draw_plots:
         return
 
@@ -249,10 +249,8 @@ def cumulative_plot(reference, contigs_fpaths, lists_of_lengths, plot_fpath, tit
     plots = []
     max_x = 0
 
-    for (contigs_fpath, lengths) in zip(contigs_fpaths, lists_of_lengths):
-        y_vals = [0]
-        for l in sorted(lengths, reverse=True):
-            y_vals.append(y_vals[-1] + l)
+    for (contigs_fpath, nx_stats) in zip(contigs_fpaths, lists_of_nx_stats):
+        y_vals = [0] + nx_stats.cum_lengths
         x_vals = list(range(0, len(y_vals)))
         if x_vals:
             max_x = max(x_vals[-1], max_x)
@@ -347,7 +345,8 @@ def frc_plot(results_dir, ref_fpath, contigs_fpaths, contigs_aligned_lengths, fe
 
 
 # common routine for Nx-plot and NGx-plot (and probably for others Nyx-plots in the future)
-def Nx_plot(results_dir, reduce_points, contigs_fpaths, lists_of_lengths, plot_fpath, title='Nx', reference_lengths=None):
+# lists_of_nx_stats are N50.NxStats of assemblies, their sorted lengths and cumulative sums are reused
+def Nx_plot(results_dir, reduce_points, contigs_fpaths, lists_of_nx_stats, plot_fpath, title='Nx', reference_lengths=None):
     if can_draw_plots:
         logger.info('  Drawing ' + title + ' plot...')
 
@@ -355,27 +354,25 @@ def Nx_plot(results_dir, reduce_points, contigs_fpaths, lists_of_lengths, plot_f
     json_vals_x = []  # coordinates for Nx-like plots in HTML-report
     json_vals_y = []
 
-    for id, (contigs_fpath, lengths) in enumerate(zip(contigs_fpaths, lists_of_lengths)):
+    for id, (contigs_fpath, nx_stats) in enumerate(zip(contigs_fpaths, lists_of_nx_stats)):
+        lengths = nx_stats.lengths
         if not lengths:
             json_vals_x.append([])
             json_vals_y.append([])
             continue
-        lengths.sort(reverse=True)
         vals_x = [0.0]
         vals_y = [lengths[0]]
         # calculate values for the plot
         vals_Nx = [0.0]
         vals_l = [lengths[0]]
-        lcur = 0
         # if Nx-plot then we just use sum of contigs lengths, else use reference_length
-        lsum = sum(lengths)
+        lsum = nx_stats.total_length
         if reference_lengths:
             lsum = reference_lengths[id]
         min_difference = 0
         if reduce_points:
             min_difference = qconfig.min_difference
-        for l in lengths:
-            lcur += l
+        for l, lcur in zip(lengths, nx_stats.cum_lengths):
             x = lcur * 100.0 / lsum
             if can_draw_plots:
                 vals_Nx.append(vals_Nx[-1] + 1e-10) # eps
@@ -205,6 +205,9 @@ DEFAULT_MAX_THREADS = 4  # this value is used if QUAST fails to determine number
 assemblies_num = 1
 memory_efficient = False
 space_efficient = False
+use_mappy = False  # align contigs in-process with the bundled minimap2 Python bindings
+index_cache_dirpath = None  # shared cache of tool indexes (if None, QUAST_INDEX_CACHE environment variable is used)
+index_cache_max_size = 50  # in Gb
 
 # genome analyzer
 analyze_gaps = True
@@ -491,6 +494,12 @@ def usage(show_hidden=False, mode=None, short=True, stream=sys.stdout):
         stream.write("                                      This may significantly reduce memory consumption on large genomes\n")
         stream.write("    --space-efficient                 Create only reports and plots files. Aux files including .stdout, .stderr, .coords will not be created.\n")
         stream.write("                                      This may significantly reduce space consumption on large genomes. Icarus viewers also will not be built\n")
+        stream.write("    --mappy                           Align contigs in-process using the bundled minimap2 Python bindings (mappy).\n")
+        stream.write("                                      The reference index is built once and shared by all assemblies\n")
+        stream.write("    --index-cache  <dirname>          Directory for caching indexes of the reference and assemblies built by the tools\n")
+        stream.write("                                      (minimap2, BWA, KMC, BLAST), it can be shared by several QUAST runs.\n")
+        stream.write("                                      QUAST_INDEX_CACHE environment variable is used if the option is not specified\n")
+        stream.write("    --index-cache-max-size  <int>     Maximum size of the index cache in Gb [default: %d]\n" % index_cache_max_size)
         stream.write("-1  --pe1     <filename>              File with forward paired-end reads (in FASTQ format, may be gzipped)\n")
         stream.write("-2  --pe2     <filename>              File with reverse paired-end reads (in FASTQ format, may be gzipped)\n")
         stream.write("    --pe12    <filename>              File with interlaced forward and reverse paired-end reads. (in FASTQ format, may be gzipped)\n")
@@ -15,7 +15,9 @@ import os
 import stat
 import sys
 import re
+import threading
 from collections import defaultdict
+from multiprocessing.pool import ThreadPool
 from os.path import basename, isfile, isdir, exists, join
 
 try:
@@ -25,10 +27,28 @@ except:
     from urllib.request import urlopen
     import urllib.request as urllib
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 from quast_libs import fastaparser, qconfig, plotter_data
-from quast_libs.log import get_logger
+from quast_libs.log import get_logger, get_log_records_buffer, buffer_log_records
 logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
 
+_thread_data = threading.local()  # limits of threads of pipeline stages
+# external tools are compiled and downloaded one at a time, since concurrent pipeline stages may require the same tool
+tools_lock = threading.RLock()
+# number of helper threads of the scheduler running pipeline stages, worker processes are not forked while they run
+_helper_threads = threading.Condition()
+_helper_threads_count = 0
+
+CHECKSUMS_FNAME = 'checksums.tsv'
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+MAX_CHECKSUMS_FILE_LINES = 10000
+_checksums = dict()  # (real path, size, mtime in ns, inode) -> checksum
+_checksums_loaded = False
+
 MAX_CONTIG_NAME = 1021  # Nucmer's constraint
 MAX_CONTIG_NAME_GLIMMER = 298   # Glimmer's constraint
 
@@ -85,54 +105,93 @@ def set_up_output_dir(output_dirpath, json_outputpath,
     return output_dirpath, json_outputpath, existing_quast_dir
 
 
-def correct_seq(seq, original_fpath):
-    corr_seq = seq.upper()
+def _make_translation_table(default_letter, letters_mapping):
+    table = bytearray(default_letter * 256)
+    for letters, replacement in letters_mapping:
+        for letter in letters:
+            table[ord(letter)] = ord(replacement)
+    return bytes(table)
+
+
+# correcting alternatives (gage can't work with alternatives)
+# dic = {'M': 'A', 'K': 'G', 'R': 'A', 'Y': 'C', 'W': 'A', 'S': 'C', 'V': 'A', 'B': 'C', 'H': 'A', 'D': 'A'}
+# all letters except A, C, G, T, N and alternatives (in any case) are replaced by the invalid letter
+INVALID_LETTER = b'!'
+CORRECTION_TABLE = _make_translation_table(INVALID_LETTER, [(letter + letter.lower(), letter) for letter in 'ACGTN'] +
+                                                           [('MKRYWSVBHD' + 'MKRYWSVBHD'.lower(), 'N')])
+CHECK_TABLE = _make_translation_table(INVALID_LETTER, [(letter, letter) for letter in 'ACGTN'])
+
+
+def _seq_to_bytes(seq):
+    return seq if isinstance(seq, bytes) else seq.encode()
+
+
+def _seq_from_bytes(seq):
+    return seq if is_python2() else seq.decode()
+
 
-    # correcting alternatives (gage can't work with alternatives)
-    # dic = {'M': 'A', 'K': 'G', 'R': 'A', 'Y': 'C', 'W': 'A', 'S': 'C', 'V': 'A', 'B': 'C', 'H': 'A', 'D': 'A'}
-    dic = {'M': 'N', 'K': 'N', 'R': 'N', 'Y': 'N', 'W': 'N', 'S': 'N', 'V': 'N', 'B': 'N', 'H': 'N', 'D': 'N'}
-    pat = "(%s)" % "|".join(map(re.escape, dic.keys()))
-    corr_seq = re.sub(pat, lambda m: dic[m.group()], corr_seq)
+def is_acgtn_seq(seq):
+    return INVALID_LETTER not in _seq_to_bytes(seq).translate(CHECK_TABLE)
+
+
+def correct_seq(seq, original_fpath):
+    # seq to uppercase (because we later looking only uppercase letters), alternatives to N
+    corr_seq = _seq_to_bytes(seq).translate(CORRECTION_TABLE)
 
     # make sure that only A, C, G, T or N are in the sequence
-    if re.compile(r'[^ACGTN]').search(corr_seq):
+    if INVALID_LETTER in corr_seq:
         logger.error('Skipping ' + original_fpath + ' because it contains non-ACGTN characters.', indent='    ')
         return None
-    return corr_seq
+    return _seq_from_bytes(corr_seq)
 
 
 def correct_fasta(original_fpath, min_contig, corrected_fpath=None, is_reference=False):
-    modified_fasta_entries = []
-    used_seq_names = defaultdict(int)
-    for first_line, seq in fastaparser.read_fasta(original_fpath):
-        if not first_line:
-            logger.error('Skipping ' + original_fpath + ' because >sequence_name field is empty '
-                                                        'for the entry starting with "%s".' % seq[:20], indent='    ')
+    """
+        Corrected entries are written as soon as they are read. The output is written to a temporary file
+        which replaces corrected_fpath only if the whole file is correct
+    """
+    tmp_corrected_fpath = corrected_fpath + '.tmp' if corrected_fpath else None
+    out_f = open(tmp_corrected_fpath, 'w') if corrected_fpath else None
+    is_correct = False
+    try:
+        is_empty = True
+        used_seq_names = defaultdict(int)
+        for first_line, seq in fastaparser.read_fasta(original_fpath):
+            if not first_line:
+                logger.error('Skipping ' + original_fpath + ' because >sequence_name field is empty '
+                                                            'for the entry starting with "%s".' % seq[:20], indent='    ')
+                return False
+            if (len(seq) >= min_contig) or is_reference:
+                corr_name = correct_name(first_line)
+                uniq_name = get_uniq_name(corr_name, used_seq_names)
+                used_seq_names[corr_name] += 1
+
+                if not qconfig.no_check:
+                    corr_seq = correct_seq(seq, original_fpath)
+                    if not corr_seq:
+                        return False
+                else:
+                    if not is_acgtn_seq(seq):
+                        logger.error('File ' + original_fpath + ' contains non-ACGTN characters. '
+                                     'Please re-run QUAST without --no-check.', indent='    ', exit_with_code=1)
+                        return False
+                    corr_seq = seq
+                if out_f:
+                    fastaparser.write_fasta_entry(out_f, uniq_name, corr_seq)
+                is_empty = False
+
+        if is_empty:
+            logger.warning('Skipping ' + original_fpath + ' because file is empty.', indent='    ')
             return False
-        if (len(seq) >= min_contig) or is_reference:
-            corr_name = correct_name(first_line)
-            uniq_name = get_uniq_name(corr_name, used_seq_names)
-            used_seq_names[corr_name] += 1
-
-            if not qconfig.no_check:
-                # seq to uppercase, because we later looking only uppercase letters
-                corr_seq = correct_seq(seq, original_fpath)
-                if not corr_seq:
-                    return False
+        is_correct = True
+        return True
+    finally:
+        if out_f:
+            out_f.close()
+            if is_correct:
+                os.rename(tmp_corrected_fpath, corrected_fpath)
             else:
-                if re.compile(r'[^ACGTN]').search(seq):
-                    logger.error('File ' + original_fpath + ' contains non-ACGTN characters. '
-                                 'Please re-run QUAST without --no-check.', indent='    ', exit_with_code=1)
-                    return False
-                corr_seq = seq
-            modified_fasta_entries.append((uniq_name, corr_seq))
-
-    if not modified_fasta_entries:
-        logger.warning('Skipping ' + original_fpath + ' because file is empty.', indent='    ')
-        return False
-    if corrected_fpath:
-        fastaparser.write_fasta(corrected_fpath, modified_fasta_entries)
-    return True
+                os.remove(tmp_corrected_fpath)
 
 
 # Correcting fasta and reporting stats
@@ -302,14 +361,8 @@ def broke_scaffolds(file_counter, labels, contigs_fpath, corrected_dirpath, logs
 
 def split_by_ns(seq, name, splitted_fasta, Ns_break_threshold=1, min_contig=1, total_contigs=0):
     cur_contig_start = 0
-    cumul_contig_length = 0
-    while (cumul_contig_length < len(seq)) and (seq.find('N', cumul_contig_length) != -1):
-        start = seq.find("N", cumul_contig_length)
-        end = start + 1
-        while (end != len(seq)) and (seq[end] == 'N'):
-            end += 1
-
-        cumul_contig_length = end + 1
+    for ns_run in re.finditer('N+', seq):
+        start, end = ns_run.span()
         if end - start >= Ns_break_threshold:
             splitted_fasta.append(
                 (name.split()[0] + "_" +
@@ -329,18 +382,7 @@ def split_by_ns(seq, name, splitted_fasta, Ns_break_threshold=1, min_contig=1, t
 def is_scaffold(seq):
     if qconfig.no_check:
         return False
-    cumul_contig_length = 0
-    seq_len = len(seq)
-    while cumul_contig_length < seq_len and seq.find('N', cumul_contig_length) != -1:
-        start = seq.find('N', cumul_contig_length)
-        end = start + 1
-        while end != seq_len and seq[end] == 'N':
-            end += 1
-
-        cumul_contig_length = end + 1
-        if end - start >= qconfig.Ns_break_threshold:
-            return True
-    return False
+    return 'N' * qconfig.Ns_break_threshold in seq
 
 
 def correct_reference(ref_fpath, corrected_dirpath):
@@ -636,6 +678,44 @@ def call_subprocess(args, stdin=None, stdout=None, stderr=None,
     return return_code
 
 
+def call_subprocess_with_handler(args, stdout_handler, stdin=None, stderr=None,
+                                 indent='',
+                                 only_if_debug=True, env=None, logger=logger):
+    """
+        Runs the tool and passes its stdout (text stream) to stdout_handler while the tool is running.
+        Returns the return code of the tool and the result of stdout_handler
+    """
+    printed_args = args[:]
+    if stdin:
+        printed_args += ['<', stdin.name]
+    printed_args += ['|', getattr(stdout_handler, '__name__', 'python')]
+    if stderr:
+        printed_args += ['2>>' if stderr.mode == 'a' else '2>', stderr.name]
+
+    for i, arg in enumerate(printed_args):
+        if arg.startswith(os.getcwd()):
+            printed_args[i] = relpath(arg)
+
+    logger.print_command_line(printed_args, indent, only_if_debug=only_if_debug)
+
+    proc = subprocess.Popen(args, stdin=stdin, stdout=subprocess.PIPE, stderr=stderr, env=env, universal_newlines=True)
+    try:
+        result = stdout_handler(proc.stdout)
+    except:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        proc.stdout.close()
+    return_code = proc.wait()
+
+    if return_code != 0:
+        logger.debug(' ' * len(indent) + 'The tool returned non-zero.' +
+                     (' See ' + relpath(stderr.name) + ' for stderr.' if stderr else ''))
+
+    return return_code, result
+
+
 def get_free_memory():
     total_mem, free_mem = 2, 2
     if qconfig.platform_name == 'linux_64':
@@ -843,6 +923,13 @@ def fix_configure_timestamps(dirpath):
 
 def compile_tool(name, dirpath, requirements, just_notice=False, logger=logger, only_clean=False, flag_suffix=None,
                  make_cmd=None, configure_args=None):
+    with tools_lock:
+        return _compile_tool(name, dirpath, requirements, just_notice=just_notice, logger=logger, only_clean=only_clean,
+                             flag_suffix=flag_suffix, make_cmd=make_cmd, configure_args=configure_args)
+
+
+def _compile_tool(name, dirpath, requirements, just_notice=False, logger=logger, only_clean=False, flag_suffix=None,
+                  make_cmd=None, configure_args=None):
     make_logs_basepath = join(dirpath, 'make')
     failed_compilation_flag = make_logs_basepath + (str(flag_suffix) if flag_suffix else '') + '.failed'
 
@@ -1016,6 +1103,11 @@ def download_blast_binary(blast_filename, logger=logger):
 
 
 def download_external_tool(fname, dirpath, tool, platform_specific=False, is_executable=False):
+    with tools_lock:
+        return _download_external_tool(fname, dirpath, tool, platform_specific=platform_specific, is_executable=is_executable)
+
+
+def _download_external_tool(fname, dirpath, tool, platform_specific=False, is_executable=False):
     downloaded_fpath = join(dirpath, fname)
     if os.path.exists(downloaded_fpath):
         return downloaded_fpath
@@ -1040,11 +1132,73 @@ def download_external_tool(fname, dirpath, tool, platform_specific=False, is_exe
     return downloaded_fpath
 
 
+def set_stage_threads(threads):
+    """
+        Limits the number of threads of the pipeline stage running in the current thread (None removes the limit)
+    """
+    _thread_data.max_threads = threads
+
+
+def get_max_threads():
+    return getattr(_thread_data, 'max_threads', None) or qconfig.max_threads
+
+
+def register_helper_thread(started):
+    """
+        Counts helper threads of the scheduler: started is True before a thread is started, False when it is finished
+    """
+    global _helper_threads_count
+    with _helper_threads:
+        _helper_threads_count += 1 if started else -1
+        _helper_threads.notify_all()
+
+
+def wait_for_helper_threads():
+    """
+        Waits until helper threads of the scheduler are finished. A forked process gets a copy of only the forking thread,
+        so locks held by other threads at that moment (of tools, loggers, output streams) would stay locked in it
+    """
+    with _helper_threads:
+        while _helper_threads_count > 0:
+            _helper_threads.wait()
+
+
+def run_in_threads(_fn, fn_args, n_jobs):
+    """
+        Runs _fn in a pool of threads, they have the limit of threads and the log buffer of the current thread
+    """
+    max_threads = getattr(_thread_data, 'max_threads', None)
+    log_records = get_log_records_buffer()
+
+    def run_in_stage_thread(args):
+        set_stage_threads(max_threads)
+        buffer_log_records(log_records)
+        try:
+            return _fn(*args)
+        finally:
+            set_stage_threads(None)
+            buffer_log_records(None)
+
+    if n_jobs <= 1:
+        return [_fn(*args) for args in fn_args]
+    pool = ThreadPool(n_jobs)
+    try:
+        return pool.map(run_in_stage_thread, fn_args)
+    finally:
+        pool.close()
+        pool.join()
+
+
 def run_parallel(_fn, fn_args, n_jobs=None, filter_results=False):
     if qconfig.memory_efficient:
         results_tuples = [_fn(*args) for args in fn_args]
+    elif not isinstance(threading.current_thread(), threading._MainThread):
+        # processes can't be forked by stages running in helper threads (see scheduler), threads are used instead
+        results_tuples = run_in_threads(_fn, fn_args, n_jobs or get_max_threads())
     else:
-        n_jobs = n_jobs or qconfig.max_threads
+        n_jobs = n_jobs or get_max_threads()
+        if n_jobs != 1:  # joblib runs jobs in the current process if n_jobs is 1
+            wait_for_helper_threads()
         parallel_args = {'n_jobs': n_jobs}
         try:
             import joblib
@@ -1100,6 +1254,100 @@ def md5(fpath):
     return hash_md5.hexdigest()
 
 
+def _new_checksum_hash():
+    if xxhash is not None:
+        return 'xxh64', xxhash.xxh64()
+    if hasattr(hashlib, 'blake2b'):
+        return 'blake2b', hashlib.blake2b(digest_size=16)
+    return 'md5', hashlib.md5()
+
+
+def _get_checksum_key(fpath):
+    fpath = os.path.realpath(fpath)
+    file_stat = os.stat(fpath)
+    mtime_ns = getattr(file_stat, 'st_mtime_ns', None) or int(file_stat.st_mtime * 1e9)
+    return fpath, str(file_stat.st_size), str(mtime_ns), str(file_stat.st_ino)
+
+
+def _get_checksums_fpath():
+    """
+        Checksums are stored on disk only next to the index cache (if it is enabled), None otherwise
+    """
+    from quast_libs.index_cache import get_cache_dirpath
+    cache_dirpath = get_cache_dirpath()
+    return join(cache_dirpath, CHECKSUMS_FNAME) if cache_dirpath else None
+
+
+def _load_checksums():
+    checksums_fpath = _get_checksums_fpath()
+    if not checksums_fpath:
+        return
+    try:
+        with open(checksums_fpath) as checksums_f:
+            lines = checksums_f.readlines()
+    except IOError:
+        return
+    for line in lines:
+        fields = line.rstrip('\n').rsplit('\t', 4)
+        if len(fields) == 5:
+            _checksums[tuple(fields[:4])] = fields[4]
+    if len(lines) > MAX_CHECKSUMS_FILE_LINES:  # keep only checksums of unchanged files
+        valid_checksums = []
+        for key, value in _checksums.items():
+            try:
+                if _get_checksum_key(key[0]) == key:
+                    valid_checksums.append('\t'.join(key + (value,)) + '\n')
+            except OSError:
+                continue
+        tmp_fpath = checksums_fpath + '.tmp' + str(os.getpid())
+        try:
+            with open(tmp_fpath, 'w') as checksums_f:
+                checksums_f.writelines(valid_checksums)
+            os.rename(tmp_fpath, checksums_fpath)
+        except (IOError, OSError):
+            safe_rm(tmp_fpath)
+
+
+def _save_checksum(key, value):
+    if any('\n' in field for field in key):
+        return
+    checksums_fpath = _get_checksums_fpath()
+    if not checksums_fpath:
+        return
+    try:
+        if not isdir(os.path.dirname(checksums_fpath)):
+            os.makedirs(os.path.dirname(checksums_fpath))
+        with open(checksums_fpath, 'a') as checksums_f:
+            checksums_f.write('\t'.join(key + (value,)) + '\n')
+    except (IOError, OSError):
+        pass
+
+
+def checksum(fpath):
+    """
+        Returns checksum of the file content (as hash name:hex digest) for checking whether results can be reused.
+        Checksums are memoized by file path, size, modification time and inode in the process.
+        If the index cache is enabled, they are also kept in its directory, so each file is read at most once
+        after each modification (a file rewritten with the same size within the mtime granularity is not detected)
+    """
+    global _checksums_loaded
+    key = _get_checksum_key(fpath)
+    if not _checksums_loaded:
+        _load_checksums()
+        _checksums_loaded = True
+    if key not in _checksums:
+        hash_name, file_hash = _new_checksum_hash()
+        with open(key[0], 'rb') as f:
+            while True:
+                buf = f.read(CHECKSUM_CHUNK_SIZE)
+                if not buf:
+                    break
+                file_hash.update(buf)
+        _checksums[key] = hash_name + ':' + file_hash.hexdigest()
+        _save_checksum(key, _checksums[key])
+    return _checksums[key]
+
+
 def verify_md5(fpath, md5_fpath=None):
     if md5_fpath is None:
         md5_fpath = fpath + '.md5'
@@ -10,6 +10,7 @@ import gzip
 import os
 import re
 import shutil
+import subprocess
 
 try:
    from collections import OrderedDict
@@ -22,7 +23,7 @@ except:
     from urllib.request import urlopen
 from os.path import join, isfile, basename, dirname, getsize
 
-from quast_libs import qconfig, qutils
+from quast_libs import qconfig, qutils, index_cache
 from quast_libs.ca_utils.misc import compile_minimap
 from quast_libs.fastaparser import get_chr_lengths_from_fastafile
 from quast_libs.qutils import compile_tool, get_dir_for_download, relpath, get_path_to_program, download_file, \
@@ -256,21 +257,73 @@ def all_read_names_correct(sam_fpath):
     return True
 
 
+def clean_read_name(line):
+    read_name, sep, rest = line.partition('\t')
+    if read_name[-2:] == '/1' or read_name[-2:] == '/2':
+        return read_name[:-2] + sep + rest
+    return line
+
+
 def clean_read_names(sam_fpath, correct_sam_fpath):
     with open(sam_fpath) as sam_in:
         with open(correct_sam_fpath, 'w') as sam_out:
             for l in sam_in:
                 if not l:
                     continue
-                fs = l.split('\t')
-                read_name = fs[0]
-                if read_name[-2:] == '/1' or read_name[-2:] == '/2':
-                    fs[0] = read_name[:-2]
-                    l = '\t'.join(fs)
-                sam_out.write(l)
+                sam_out.write(clean_read_name(l))
     return correct_sam_fpath
 
 
+def align_reads_to_bam(cmdline, bam_fpath, max_threads, err_fpath, logger, sam_fpath=None, lines_handler=None):
+    """
+        Runs the read aligner and passes its output with cleaned read names through a pipe to sambamba
+        writing the BAM file, and to the SAM file only if sam_fpath is specified.
+        lines_handler (if specified) receives the stream of SAM lines and may stop reading it at any moment,
+        e.g. to look only at the first alignments.
+        Returns True if both tools succeeded and the result of lines_handler
+    """
+    sambamba_cmd = [sambamba_fpath('sambamba'), 'view', '-t', str(max_threads), '-h', '-S', '-f', 'bam', '/dev/stdin']
+    logger.print_command_line(sambamba_cmd + ['>', relpath(bam_fpath)], only_if_debug=True)
+    with open(bam_fpath, 'w') as bam_file:
+        sambamba = subprocess.Popen(sambamba_cmd, stdin=subprocess.PIPE, stdout=bam_file, stderr=open(err_fpath, 'a'),
+                                    universal_newlines=True)
+
+    def write_alignments(sam_lines):
+        sam_out = open(sam_fpath, 'w') if sam_fpath else None
+
+        def iter_written_lines():
+            for line in sam_lines:
+                line = clean_read_name(line)
+                if sam_out:
+                    sam_out.write(line)
+                sambamba.stdin.write(line)
+                yield line
+
+        try:
+            written_lines = iter_written_lines()
+            result = lines_handler(written_lines) if lines_handler else None
+            for _ in written_lines:  # the rest of alignments
+                pass
+        finally:
+            if sam_out:
+                sam_out.close()
+        return result
+
+    return_code, result = None, None
+    try:
+        return_code, result = qutils.call_subprocess_with_handler(cmdline, write_alignments, stderr=open(err_fpath, 'a'),
+                                                                  logger=logger)
+    except (IOError, OSError):  # sambamba failed and closed the pipe
+        pass
+    finally:
+        try:
+            sambamba.stdin.close()
+        except (IOError, OSError):
+            pass
+        sambamba_return_code = sambamba.wait()
+    return return_code == 0 and sambamba_return_code == 0, result
+
+
 def sort_bam(bam_fpath, sorted_bam_fpath, err_path, logger, threads=None, sort_rule=None):
     if not threads:
         threads = qconfig.max_threads
@@ -283,11 +336,17 @@ def sort_bam(bam_fpath, sorted_bam_fpath, err_path, logger, threads=None, sort_r
 
 
 def bwa_index(ref_fpath, err_path, logger):
-    cmd = [bwa_fpath('bwa'), 'index', '-p', ref_fpath, ref_fpath]
+    if is_non_empty_file(ref_fpath + '.bwt'):
+        return
+    params = []
     if getsize(ref_fpath) > 2 * 1024 ** 3:  # if reference size bigger than 2GB
-        cmd += ['-a', 'bwtsw']
-    if not is_non_empty_file(ref_fpath + '.bwt'):
-        qutils.call_subprocess(cmd, stdout=open(err_path, 'a'), stderr=open(err_path, 'a'), logger=logger)
+        params += ['-a', 'bwtsw']
+
+    def build_index(index_prefix):
+        cmd = [bwa_fpath('bwa'), 'index', '-p', index_prefix, ref_fpath] + params
+        return qutils.call_subprocess(cmd, stdout=open(err_path, 'a'), stderr=open(err_path, 'a'), logger=logger) == 0
+
+    index_cache.get_index(bwa_fpath('bwa'), ref_fpath, params, build_index, ref_fpath)
 
 
 def get_gridss_memory():
@@ -15,16 +15,15 @@ from collections import defaultdict
 from math import sqrt
 from os.path import isfile, join, basename, abspath, isdir, dirname, exists
 
-from quast_libs import qconfig, qutils
+from quast_libs import qconfig, qutils, reference_profile
 from quast_libs.ca_utils.misc import minimap_fpath, ref_labels_by_chromosomes
-from quast_libs.fastaparser import create_fai_file
 from quast_libs.ra_utils.misc import compile_reads_analyzer_tools, sambamba_fpath, bwa_fpath, bedtools_fpath, \
     bwa_dirpath, download_gridss, get_gridss_fpath, get_gridss_memory, \
     paired_reads_names_are_equal, sort_bam, bwa_index, reformat_bedpe, get_correct_names_for_chroms, \
     all_read_names_correct, clean_read_names, check_cov_file, bam_to_bed, get_safe_fpath, sambamba_view, \
-    calculate_genome_cov
+    calculate_genome_cov, align_reads_to_bam
 from quast_libs.qutils import is_non_empty_file, add_suffix, get_chr_len_fpath, run_parallel, \
-    get_path_to_program, check_java_version, percentile, calc_median
+    get_path_to_program, check_java_version, percentile, calc_median, safe_rm
 
 from quast_libs.log import get_logger
 from quast_libs.reporting import save_reads
@@ -130,7 +129,7 @@ def process_one_ref(cur_ref_fpath, output_dirpath, err_fpath, max_threads, bam_f
     if not is_non_empty_file(bam_sorted_fpath + '.bai'):
         qutils.call_subprocess([sambamba_fpath('sambamba'), 'index', bam_sorted_fpath],
                                stderr=open(err_fpath, 'a'), logger=logger)
-    create_fai_file(cur_ref_fpath)
+    reference_profile.create_fai_file(cur_ref_fpath)
     vcf_output_dirpath = join(output_dirpath, ref_name + '_gridss')
     vcf_fpath = join(vcf_output_dirpath, ref_name + '.vcf')
     if not is_non_empty_file(vcf_fpath):
@@ -508,6 +507,7 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
             return correct_chr_names, sam_fpath, bam_fpath
 
     logger.info('  ' + index_str + 'Pre-processing reads...')
+    is_aligned = False  # read names are cleaned and the BAM file is written while reads are aligned
     if is_non_empty_file(sam_fpath) and can_reuse:
         logger.info('  ' + index_str + 'Using existing SAM-file: ' + sam_fpath)
         correct_chr_names = get_correct_names_for_chroms(output_dirpath, fpath, sam_fpath, err_fpath, reads_fpaths, logger, is_reference)
@@ -532,13 +532,17 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
         if len(sam_fpaths) > 1:
             merge_sam_files(sam_fpaths, sam_fpath, bam_fpath, max_threads, err_fpath)
         elif len(sam_fpaths) == 1:
-            shutil.move(sam_fpaths[0], sam_fpath)
             tmp_bam_fpath = sam_fpaths[0].replace('.sam', '.bam')
+            if is_non_empty_file(sam_fpaths[0]):
+                shutil.move(sam_fpaths[0], sam_fpath)
+            elif is_non_empty_file(tmp_bam_fpath):  # SAM file is not written if other libraries were expected
+                sambamba_view(tmp_bam_fpath, sam_fpath, max_threads, err_fpath, logger)
             if is_non_empty_file(tmp_bam_fpath):
                 shutil.move(tmp_bam_fpath, bam_fpath)
 
         logger.info('  ' + index_str + 'Done.')
         os.chdir(prev_dir)
+        is_aligned = True
         if not is_non_empty_file(sam_fpath):
             logger.error('  Failed running BWA for ' + fpath + '. See ' + log_path + ' for information.')
             return None, None, None
@@ -551,7 +555,7 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
     else:
         logger.info('  ' + index_str + 'Sorting SAM-file...')
 
-    if can_reuse and is_non_empty_file(bam_fpath) and all_read_names_correct(sam_fpath):
+    if (can_reuse or is_aligned) and is_non_empty_file(bam_fpath) and all_read_names_correct(sam_fpath):
         logger.info('  ' + index_str + 'Using existing BAM-file: ' + bam_fpath)
     else:
         correct_sam_fpath = join(output_dirpath, filename + '.' + using_reads + '.correct.sam')  # write in output dir
@@ -575,21 +579,24 @@ def align_single_file(fpath, main_output_dir, output_dirpath, log_path, err_fpat
 
 def align_reads(ref_fpath, sam_fpath, using_reads, output_dir, err_fpath, max_threads):
     out_sam_fpaths = []
-
-    if using_reads == 'all' or using_reads == 'pe':
-        run_aligner(qconfig.paired_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='pe')
-    if using_reads == 'all' or using_reads == 'mp':
-        run_aligner(qconfig.mate_pairs, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='mp')
-    if using_reads == 'all' or using_reads == 'single':
-        run_aligner(qconfig.unpaired_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='single')
-    if using_reads == 'all' or using_reads == 'pacbio':
-        run_aligner(qconfig.pacbio_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='pacbio')
-    if using_reads == 'all' or using_reads == 'nanopore':
-        run_aligner(qconfig.nanopore_reads, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type='nanopore')
+    libraries = [('pe', qconfig.paired_reads), ('mp', qconfig.mate_pairs), ('single', qconfig.unpaired_reads),
+                 ('pacbio', qconfig.pacbio_reads), ('nanopore', qconfig.nanopore_reads)]
+    libraries = [(reads_type, read_fpaths) for reads_type, read_fpaths in libraries if using_reads in ['all', reads_type]]
+    # alignments of several libraries are merged from BAM files, so the SAM file is needed only for a single library
+    # (it becomes the final SAM file used by the text consumers: chromosome names check, splitting by references, etc.)
+    keep_sam = sum(len(read_fpaths) for reads_type, read_fpaths in libraries) == 1
+    for reads_type, read_fpaths in libraries:
+        run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads,
+                    reads_type=reads_type, keep_sam=keep_sam)
     return out_sam_fpaths
 
 
-def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type):
+def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, err_fpath, max_threads, reads_type,
+                keep_sam=False):
+    """
+        Aligns each library to a BAM file, the SAM file of the library is written only if keep_sam is True.
+        Insert sizes of paired-end libraries are sampled from the aligner output while it is running
+    """
     bwa_cmd = bwa_fpath('bwa') + ' mem -t ' + str(max_threads)
     insert_sizes = []
     temp_sam_fpaths = []
@@ -608,20 +615,31 @@ def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, e
             cmdline = bwa_cmd + ' ' + ref_fpath + ' ' + read1 + ' ' + read2
         output_fpath = add_suffix(sam_fpath, reads_type + str(idx + 1))
         bam_fpath = output_fpath.replace('.sam', '.bam')
-        if not is_non_empty_file(output_fpath):
-            qutils.call_subprocess(shlex.split(cmdline), stdout=open(output_fpath, 'w'), stderr=open(err_fpath, 'a'), logger=logger)
+        library_insert_sizes = None
         if not is_non_empty_file(bam_fpath):
-            if not is_non_empty_file(bam_fpath):
+            if is_non_empty_file(output_fpath):
                 sambamba_view(output_fpath, bam_fpath, max_threads, err_fpath, logger, filter_rule=None)
+            else:
+                is_aligned, library_insert_sizes = align_reads_to_bam(
+                    shlex.split(cmdline), bam_fpath, max_threads, err_fpath, logger, sam_fpath=output_fpath if keep_sam else None,
+                    lines_handler=get_insert_sizes if reads_type == 'pe' else None)
+                if not is_aligned:
+                    logger.error('  Failed aligning reads ' + (reads if isinstance(reads, str) else ' '.join(reads)) +
+                                 ' to ' + ref_fpath + '. See ' + err_fpath + ' for information.')
+                    safe_rm(output_fpath)
+                    safe_rm(bam_fpath)
+                    continue
             if reads_type == 'pe':
-                bam_dedup_fpath = add_suffix(bam_fpath, 'dedup')
+                # deduplicated alignments are kept separately, the BAM file matches the SAM file
                 qutils.call_subprocess([sambamba_fpath('sambamba'), 'markdup', '-r', '-t', str(max_threads), '--tmpdir',
-                                        output_dir, bam_fpath, bam_dedup_fpath],
+                                        output_dir, bam_fpath, add_suffix(bam_fpath, 'dedup')],
                                         stderr=open(err_fpath, 'a'), logger=logger)
-                if exists(bam_dedup_fpath):
-                    shutil.move(bam_dedup_fpath, bam_fpath)
+        elif keep_sam and not is_non_empty_file(output_fpath):
+            sambamba_view(bam_fpath, output_fpath, max_threads, err_fpath, logger)
         if reads_type == 'pe':
-            insert_size, _, _ = calculate_insert_size(output_fpath, output_dir, qutils.name_from_fpath(sam_fpath))
+            alignments_fpath = output_fpath if is_non_empty_file(output_fpath) else bam_fpath
+            insert_size, _, _ = calculate_insert_size(alignments_fpath, output_dir, qutils.name_from_fpath(sam_fpath),
+                                                      insert_sizes=library_insert_sizes)
             if insert_size is not None and insert_size < qconfig.optimal_assembly_max_IS:
                 insert_sizes.append(insert_size)
         temp_sam_fpaths.append(output_fpath)
@@ -629,8 +647,12 @@ def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, e
     if len(temp_sam_fpaths) == 1:
         final_sam_fpath = add_suffix(sam_fpath, reads_type)
         final_bam_fpath = final_sam_fpath.replace('.sam', '.bam')
-        shutil.move(temp_sam_fpaths[0], final_sam_fpath)
-        shutil.move(temp_sam_fpaths[0].replace('.sam', '.bam'), final_bam_fpath)
+        temp_bam_fpath = temp_sam_fpaths[0].replace('.sam', '.bam')
+        if exists(temp_sam_fpaths[0]):
+            shutil.move(temp_sam_fpaths[0], final_sam_fpath)
+        shutil.move(temp_bam_fpath, final_bam_fpath)
+        if exists(add_suffix(temp_bam_fpath, 'dedup')):
+            shutil.move(add_suffix(temp_bam_fpath, 'dedup'), add_suffix(final_bam_fpath, 'dedup'))
         out_sam_fpaths.append(final_sam_fpath)
     else:
         out_sam_fpaths.extend(temp_sam_fpaths)
@@ -645,8 +667,10 @@ def run_aligner(read_fpaths, ref_fpath, sam_fpath, out_sam_fpaths, output_dir, e
 def merge_sam_files(tmp_sam_fpaths, sam_fpath, bam_fpath, max_threads, err_fpath):
     tmp_bam_fpaths = []
     for tmp_sam_fpath in tmp_sam_fpaths:
-        if is_non_empty_file(tmp_sam_fpath):
-            tmp_bam_fpath = tmp_sam_fpath.replace('.sam', '.bam')
+        tmp_bam_fpath = tmp_sam_fpath.replace('.sam', '.bam')
+        if is_non_empty_file(tmp_bam_fpath):
+            if is_non_empty_file(add_suffix(tmp_bam_fpath, 'dedup')):
+                tmp_bam_fpath = add_suffix(tmp_bam_fpath, 'dedup')
             tmp_bam_sorted_fpath = add_suffix(tmp_bam_fpath, 'sorted')
             if not is_non_empty_file(tmp_bam_sorted_fpath):
                 sort_bam(tmp_bam_fpath, tmp_bam_sorted_fpath, err_fpath, logger)
@@ -801,10 +825,9 @@ def get_coverage(output_dirpath, ref_fpath, ref_name, bam_fpath, bam_sorted_fpat
                 sort_bam(bam_fpath, bam_sorted_fpath, err_fpath, logger)
             calculate_genome_cov(bam_sorted_fpath, raw_cov_fpath, chr_len_fpath, err_fpath, logger)
             qutils.assert_file_exists(raw_cov_fpath, 'coverage file')
-        if uncovered_fpath:
-            print_uncovered_regions(raw_cov_fpath, uncovered_fpath, correct_chr_names)
-        if create_cov_files:
-            proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names)
+        if create_cov_files or uncovered_fpath:
+            proceed_cov_file(raw_cov_fpath, cov_fpath if create_cov_files else None, correct_chr_names,
+                             uncovered_fpath=uncovered_fpath)
     if not is_non_empty_file(physical_cov_fpath) and create_cov_files:
         raw_cov_fpath = get_physical_coverage(output_dirpath, ref_name, bam_fpath, log_path, err_fpath,
                                               physical_cov_fpath, chr_len_fpath)
@@ -812,34 +835,54 @@ def get_coverage(output_dirpath, ref_fpath, ref_name, bam_fpath, bam_sorted_fpat
     return cov_fpath, physical_cov_fpath
 
 
-def proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names):
-    chr_depth = defaultdict(list)
+def proceed_cov_file(raw_cov_fpath, cov_fpath, correct_chr_names, uncovered_fpath=None):
+    """
+        Reads the raw coverage file once: writes depth averaged over windows of COVERAGE_FACTOR positions to cov_fpath
+        and regions with zero depth to uncovered_fpath (if they are set).
+        Runs of equal depth are added to windows as a whole, so memory does not depend on their length
+    """
+    windows = dict()  # chromosome -> [sum of depths, number of positions] of the current window
     used_chromosomes = dict()
-    chr_index = 0
+    out_coverage = open(cov_fpath, 'w') if cov_fpath else None
+    out_uncovered = open(uncovered_fpath, 'w') if uncovered_fpath else None
     with open(raw_cov_fpath, 'r') as in_coverage:
-        with open(cov_fpath, 'w') as out_coverage:
-            for line in in_coverage:
-                fs = list(line.split())
-                name = fs[0]
-                depth = int(float(fs[-1]))
-                if name not in used_chromosomes:
-                    chr_index += 1
-                    used_chromosomes[name] = str(chr_index)
-                    correct_name = correct_chr_names[name] if correct_chr_names else name
-                    out_coverage.write('#' + correct_name + ' ' + used_chromosomes[name] + '\n')
-                if len(fs) > 3:
-                    start, end = int(fs[1]), int(fs[2])
-                    chr_depth[name].extend([depth] * (end - start))
-                else:
-                    chr_depth[name].append(depth)
-                if len(chr_depth[name]) >= COVERAGE_FACTOR:
-                    max_index = len(chr_depth[name]) - (len(chr_depth[name]) % COVERAGE_FACTOR)
-                    for index in range(0, max_index, COVERAGE_FACTOR):
-                        cur_depth = sum(chr_depth[name][index: index + COVERAGE_FACTOR]) // COVERAGE_FACTOR
-                        out_coverage.write(' '.join([used_chromosomes[name], str(cur_depth) + '\n']))
-                    chr_depth[name] = chr_depth[name][index + COVERAGE_FACTOR:]
-            if not qconfig.debug:
-                os.remove(raw_cov_fpath)
+        for line in in_coverage:
+            fs = list(line.split())
+            name = fs[0]
+            depth = int(float(fs[-1]))
+            correct_name = correct_chr_names[name] if correct_chr_names else name
+            if len(fs) > 3:
+                run_len = int(fs[2]) - int(fs[1])
+                if out_uncovered and depth == 0:
+                    out_uncovered.write('\t'.join([correct_name, fs[1], fs[2]]) + '\n')
+            else:
+                run_len = 1
+            if not out_coverage:
+                continue
+            if name not in used_chromosomes:
+                used_chromosomes[name] = str(len(used_chromosomes) + 1)
+                windows[name] = [0, 0]
+                out_coverage.write('#' + correct_name + ' ' + used_chromosomes[name] + '\n')
+            window = windows[name]
+            while run_len > 0:
+                if not window[1] and run_len >= COVERAGE_FACTOR:
+                    full_windows = run_len // COVERAGE_FACTOR
+                    out_coverage.write((used_chromosomes[name] + ' ' + str(depth) + '\n') * full_windows)
+                    run_len -= full_windows * COVERAGE_FACTOR
+                    continue
+                added_len = min(run_len, COVERAGE_FACTOR - window[1])
+                window[0] += depth * added_len
+                window[1] += added_len
+                run_len -= added_len
+                if window[1] == COVERAGE_FACTOR:
+                    out_coverage.write(used_chromosomes[name] + ' ' + str(window[0] // COVERAGE_FACTOR) + '\n')
+                    window[0], window[1] = 0, 0
+    if out_uncovered:
+        out_uncovered.close()
+    if out_coverage:
+        out_coverage.close()
+        if not qconfig.debug:
+            os.remove(raw_cov_fpath)
 
 
 def get_max_min_is(insert_sizes):
@@ -848,7 +891,30 @@ def get_max_min_is(insert_sizes):
     return decile_1, decile_9
 
 
-def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
+def get_insert_sizes(sam_lines):
+    """
+        Returns insert sizes of read pairs mapped in correct orientation among the first alignments
+    """
+    insert_sizes = []
+    mapped_flags = ['99', '147', '83', '163']  # reads mapped in correct orientation and within insert size
+    for i, l in enumerate(sam_lines):
+        if i > 1000000:
+            break
+        if l.startswith('@'):
+            continue
+        fs = l.split('\t')
+        flag = fs[1]
+        if flag not in mapped_flags:
+            continue
+        insert_size = abs(int(fs[8]))
+        insert_sizes.append(insert_size)
+    return insert_sizes
+
+
+def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix='', insert_sizes=None):
+    """
+        sam_fpath may be a SAM or a BAM file, it is not read if insert sizes are already sampled
+    """
     insert_size_fpath = join(output_dir, ref_name + ('.' + reads_suffix if reads_suffix else '') + '.is.txt')
     if is_non_empty_file(insert_size_fpath):
         try:
@@ -860,20 +926,13 @@ def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
                 return insert_size, min_insert_size, max_insert_size
         except:
             pass
-    insert_sizes = []
-    mapped_flags = ['99', '147', '83', '163']  # reads mapped in correct orientation and within insert size
-    with open(sam_fpath) as sam_in:
-        for i, l in enumerate(sam_in):
-            if i > 1000000:
-                break
-            if l.startswith('@'):
-                continue
-            fs = l.split('\t')
-            flag = fs[1]
-            if flag not in mapped_flags:
-                continue
-            insert_size = abs(int(fs[8]))
-            insert_sizes.append(insert_size)
+    if insert_sizes is None and sam_fpath.endswith('.bam'):
+        # sambamba is stopped when enough alignments are read
+        _, insert_sizes = qutils.call_subprocess_with_handler([sambamba_fpath('sambamba'), 'view', '-h', sam_fpath],
+                                                              get_insert_sizes, stderr=open(os.devnull, 'w'), logger=logger)
+    elif insert_sizes is None:
+        with open(sam_fpath) as sam_in:
+            insert_sizes = get_insert_sizes(sam_in)
 
     if insert_sizes:
         insert_sizes.sort()
@@ -890,22 +949,6 @@ def calculate_insert_size(sam_fpath, output_dir, ref_name, reads_suffix=''):
     return None, None, None
 
 
-def print_uncovered_regions(raw_cov_fpath, uncovered_fpath, correct_chr_names):
-    uncovered_regions = defaultdict(list)
-    with open(raw_cov_fpath) as in_coverage:
-        for line in in_coverage:
-            fs = list(line.split())
-            name = fs[0]
-            depth = int(float(fs[-1]))
-            correct_name = correct_chr_names[name] if correct_chr_names else name
-            if len(fs) > 3 and depth == 0:
-                uncovered_regions[correct_name].append((fs[1], fs[2]))
-    with open(uncovered_fpath, 'w') as out_f:
-        for chrom, regions in uncovered_regions.items():
-            for start, end in regions:
-                out_f.write('\t'.join([chrom, start, end]) + '\n')
-
-
 def do(ref_fpath, contigs_fpaths, output_dir, meta_ref_fpaths=None, external_logger=None):
     if external_logger:
         global logger
@@ -0,0 +1,163 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Reference profile: chromosome lengths, N runs, GC content of chromosomes and windows, .fai fields.
+# The profile is computed in a single pass over the corrected reference and cached on disk
+# (the cache is checked by checksum of the reference, like existing alignments).
+#
+############################################################################
+
+from __future__ import with_statement
+from __future__ import division
+import os
+import pickle
+from array import array
+from os.path import join, isfile
+
+try:
+   from collections import OrderedDict
+except ImportError:
+   from quast_libs.site_packages.ordered_dict import OrderedDict
+
+from quast_libs import fastaparser, qconfig, qutils
+from quast_libs.gc_content import UNDEFINED_GC, count_blocks, get_windows_GC, get_GC_hist
+from quast_libs.log import get_logger
+from quast_libs.intervals import NsIndex
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+PROFILE_VERSION = 1
+
+_profiles = dict()  # reference fpath -> ReferenceProfile
+
+
+class ReferenceProfile(object):
+    def __init__(self):
+        self.chr_lengths = OrderedDict()
+        self.ns_by_chromosomes = OrderedDict()
+        self.gc_by_chromosomes = OrderedDict()  # chromosome -> (# G and C, # ACGT)
+        self.gc_windows_hist = [0] * 101  # number of windows of qconfig.GC_window_size by GC %
+        self.gc_windows = dict()  # window size -> {chromosome -> array of GC % of non-overlapping windows}
+        self.fai_fields = []
+
+    @property
+    def total_length(self):
+        return sum(self.chr_lengths.values())
+
+    def get_genome_stats(self, skip_ns=False):
+        """
+            Returns the same as fastaparser.get_genome_stats
+        """
+        genome_size = self.total_length
+        if skip_ns:
+            genome_size -= sum(len(ns) for ns in self.ns_by_chromosomes.values())
+        return genome_size, dict(self.chr_lengths), dict(self.ns_by_chromosomes)
+
+    def iter_gc_windows(self, window_size):
+        """
+            Generator that returns windows with defined GC in tuples (chromosome, start, end, GC %),
+            start is 0-based, end is exclusive
+        """
+        for chr_name, gc_percents in self.gc_windows[window_size].items():
+            chr_len = self.chr_lengths[chr_name]
+            for i, gc_percent in enumerate(gc_percents):
+                if gc_percent != UNDEFINED_GC:
+                    yield chr_name, i * window_size, min(chr_len, (i + 1) * window_size), gc_percent
+
+    def save_fai(self, fai_fpath):
+        with open(fai_fpath, 'w') as out_f:
+            for fields in self.fai_fields:
+                out_f.write('\t'.join([str(fs) for fs in fields]) + '\n')
+
+
+def get_icarus_window_size():
+    return qconfig.GC_window_size_large if qconfig.large_genome else qconfig.GC_window_size
+
+
+def compute_profile(ref_fpath):
+    """
+        Reads the reference once. All GC window sizes must be multiples of qconfig.GC_window_size
+    """
+    from quast_libs.circos import set_window_size
+
+    block_size = qconfig.GC_window_size
+    profile = ReferenceProfile()
+    blocks_by_chromosomes = OrderedDict()
+    blocks_gc_percents = array('b')
+    for name, seq, fai_fields in fastaparser.read_fasta_with_fai_fields(ref_fpath):
+        profile.chr_lengths[name] = len(seq)
+        profile.ns_by_chromosomes[name] = NsIndex(seq)
+        if fai_fields:
+            profile.fai_fields.append(fai_fields)
+        ACGT_counts, GC_counts = count_blocks(seq, block_size)
+        profile.gc_by_chromosomes[name] = (sum(GC_counts), sum(ACGT_counts))
+        blocks_gc_percents.extend(get_windows_GC(len(seq), ACGT_counts, GC_counts, block_size, block_size))
+        blocks_by_chromosomes[name] = (ACGT_counts, GC_counts)
+    profile.gc_windows_hist = get_GC_hist(blocks_gc_percents)
+
+    for window_size in set([get_icarus_window_size(), set_window_size(profile.total_length)]):
+        profile.gc_windows[window_size] = OrderedDict(
+            (name, get_windows_GC(profile.chr_lengths[name], ACGT_counts, GC_counts, block_size, window_size))
+            for name, (ACGT_counts, GC_counts) in blocks_by_chromosomes.items())
+    return profile
+
+
+def _get_profile_params():
+    return PROFILE_VERSION, qconfig.GC_window_size, get_icarus_window_size()
+
+
+def _load_profile(profile_fpath, ref_checksum):
+    try:
+        with open(profile_fpath, 'rb') as in_f:
+            cached = pickle.load(in_f)
+    except Exception:
+        return None
+    if cached.get('checksum') != ref_checksum or cached.get('params') != _get_profile_params():
+        return None
+    return cached.get('profile')
+
+
+def _save_profile(profile, profile_fpath, ref_checksum):
+    tmp_fpath = profile_fpath + '.tmp'
+    with open(tmp_fpath, 'wb') as out_f:
+        pickle.dump({'checksum': ref_checksum, 'params': _get_profile_params(), 'profile': profile}, out_f, protocol=2)
+    os.rename(tmp_fpath, profile_fpath)
+
+
+def do(ref_fpath, output_dirpath):
+    """
+        Computes the reference profile or loads it from the cache in output_dirpath
+    """
+    if not os.path.isdir(output_dirpath):
+        os.makedirs(output_dirpath)
+    profile_fpath = join(output_dirpath, qutils.name_from_fpath(ref_fpath) + '.profile')
+    ref_checksum = qutils.checksum(ref_fpath)
+    profile = _load_profile(profile_fpath, ref_checksum) if isfile(profile_fpath) else None
+    if profile is not None:
+        logger.info('  Using existing reference profile...')
+    else:
+        logger.info('  Calculating reference profile...')
+        profile = compute_profile(ref_fpath)
+        _save_profile(profile, profile_fpath, ref_checksum)
+    _profiles[ref_fpath] = profile
+    return profile
+
+
+def get(ref_fpath):
+    """
+        Returns the reference profile, it is computed in-place if the profile stage was not run for ref_fpath
+    """
+    if ref_fpath not in _profiles:
+        _profiles[ref_fpath] = compute_profile(ref_fpath)
+    return _profiles[ref_fpath]
+
+
+def create_fai_file(fasta_fpath):
+    profile = _profiles.get(fasta_fpath)
+    if profile is not None and profile.fai_fields:
+        profile.save_fai(fasta_fpath + '.fai')
+    else:
+        fastaparser.create_fai_file(fasta_fpath)
@@ -25,8 +25,8 @@ def do(contigs_fpaths, output_dir, logger):
     logger.print_timestamp()
     logger.info('Running Barrnap...')
 
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    threads = max(1, qconfig.max_threads // n_jobs)
+    n_jobs = min(len(contigs_fpaths), qutils.get_max_threads())
+    threads = max(1, qutils.get_max_threads() // n_jobs)
     if not os.path.isdir(output_dir):
         os.makedirs(output_dir)
 
@@ -36,7 +36,7 @@ def do(contigs_fpaths, output_dir, logger):
     gff_fpaths = [join(output_dir, qutils.label_from_fpath_for_fname(contigs_fpath) + '.rna.gff') for contigs_fpath in contigs_fpaths]
 
     barrnap_args = [(contigs_fpath, gff_fpath, log_fpath, threads, kingdom) for contigs_fpath, gff_fpath in zip(contigs_fpaths, gff_fpaths)]
-    run_parallel(run, barrnap_args, qconfig.max_threads)
+    run_parallel(run, barrnap_args, qutils.get_max_threads())
 
     if not any(fpath for fpath in gff_fpaths):
         logger.info('Failed predicting the location of ribosomal RNA genes.')
@@ -212,8 +212,8 @@ def do(contigs_fpaths, output_dir, logger):
     if not os.path.isdir(tmp_dir):
         os.makedirs(tmp_dir)
 
-    n_jobs = min(len(contigs_fpaths), qconfig.max_threads)
-    busco_threads = max(1, qconfig.max_threads // n_jobs)
+    n_jobs = min(len(contigs_fpaths), qutils.get_max_threads())
+    busco_threads = max(1, qutils.get_max_threads() // n_jobs)
 
     clade_dirpath = download_db(logger, is_prokaryote=qconfig.prokaryote, is_fungus=qconfig.is_fungus)
     if not clade_dirpath:
@@ -228,7 +228,7 @@ def do(contigs_fpaths, output_dir, logger):
     if not os.environ['AUGUSTUS_CONFIG_PATH']:
         logger.error('Augustus configs not found, failed to run BUSCO without them.')
     busco_args = [[contigs_fpath, qutils.label_from_fpath_for_fname(contigs_fpath)] for contigs_fpath in contigs_fpaths]
-    summary_fpaths = run_parallel(busco_main_handler, busco_args, qconfig.max_threads)
+    summary_fpaths = run_parallel(busco_main_handler, busco_args, qutils.get_max_threads())
     if not any(fpath for fpath in summary_fpaths):
         logger.error('Failed running BUSCO for all the assemblies. See log files in ' + output_dir + ' for information '
                      '(rerun with --debug to keep all intermediate files).')
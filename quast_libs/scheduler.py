@@ -0,0 +1,136 @@
+############################################################################
+# Copyright (c) 2015-2020 Saint Petersburg State University
+# Copyright (c) 2011-2015 Saint Petersburg Academic University
+# All Rights Reserved
+# See file LICENSE for details.
+############################################################################
+#
+# Scheduler of pipeline stages. A stage declares names of its inputs and outputs,
+# a stage is started as soon as all its inputs are produced, so independent stages run concurrently.
+# Stages running in the main thread (Python-heavy stages, plots) are executed one by one, other stages
+# (mostly waiting for external tools) run in helper threads and share half of the thread budget.
+# Stages in the main thread log as usual, log messages of a stage in a helper thread are buffered
+# and printed together when it is finished, so messages of stages are not interleaved.
+# External tools should be compiled and downloaded before stages are run (quast.py does it), qutils.tools_lock
+# also prevents concurrent builds of the same tool. Helper stages are not started while a stage runs in the main
+# thread, and run_parallel of a stage in the main thread waits for running helper stages before forking worker
+# processes: a forked process gets a copy of only the forking thread, so locks held by other threads would stay locked.
+#
+############################################################################
+
+from __future__ import with_statement
+import sys
+import threading
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+from quast_libs import qconfig, qutils
+from quast_libs.log import buffer_log_records, flush_log_records
+
+
+class Stage(object):
+    """
+        fn is called with keyword arguments named by inputs, its result is stored under the name of the output
+        (or a tuple of results under names of outputs). threads is the maximal number of threads the stage can use
+    """
+    def __init__(self, name, fn, inputs=None, outputs=None, threads=None, in_main_thread=False):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs or []
+        self.outputs = outputs or []
+        self.threads = threads
+        self.in_main_thread = in_main_thread
+        self.log_records = []
+
+    def run(self, data):
+        results = self.fn(**dict((name, data[name]) for name in self.inputs))
+        if len(self.outputs) == 1:
+            results = [results]
+        return dict(zip(self.outputs, results or [None] * len(self.outputs)))
+
+
+def check_stages(stages, data):
+    available_names = set(data)
+    for stage in stages:
+        for name in stage.inputs:
+            if name not in available_names:
+                raise ValueError('Input ' + name + ' of stage ' + stage.name + ' is not produced by previous stages')
+        for name in stage.outputs:
+            if name in available_names:
+                raise ValueError('Output ' + name + ' of stage ' + stage.name + ' is produced twice')
+            available_names.add(name)
+
+
+def _run_stage(stage, data, threads, finished_stages):
+    if not stage.in_main_thread:
+        buffer_log_records(stage.log_records)
+    qutils.set_stage_threads(threads)
+    try:
+        result = (stage, stage.run(data), None)
+    except BaseException:  # SystemExit of logger.error is passed to the main thread too
+        result = (stage, None, sys.exc_info()[1])
+    finally:
+        qutils.set_stage_threads(None)
+        buffer_log_records(None)
+    finished_stages.put(result)
+    if not stage.in_main_thread:
+        qutils.register_helper_thread(started=False)
+
+
+def run_stages(stages, data, max_threads=None):
+    """
+        Runs stages on data (dict of names of inputs and their values), adds outputs of stages to data.
+        Stages are run one after another in the given order if only one thread is available
+    """
+    check_stages(stages, data)
+    max_threads = max_threads or qconfig.max_threads
+    if max_threads <= 1 or qconfig.memory_efficient:
+        for stage in stages:
+            data.update(stage.run(data))
+        return data
+
+    helper_threads_budget = max(1, max_threads // 2)
+    pending_stages = list(stages)
+    running_stages = dict()  # stage -> number of threads
+    finished_stages = queue.Queue()
+    error = None
+    while (pending_stages or running_stages) and error is None:
+        ready_stages = [stage for stage in pending_stages if all(name in data for name in stage.inputs)]
+        ready_helper_stages = [stage for stage in ready_stages if not stage.in_main_thread]
+        for i, stage in enumerate(ready_helper_stages):
+            free_threads = helper_threads_budget - sum(running_stages.values())
+            if free_threads < 1 and running_stages:
+                break
+            threads = max(1, free_threads // (len(ready_helper_stages) - i))
+            threads = min(threads, stage.threads or threads)
+            pending_stages.remove(stage)
+            running_stages[stage] = threads
+            qutils.register_helper_thread(started=True)
+            thread = threading.Thread(target=_run_stage, name=stage.name, args=(stage, data, threads, finished_stages))
+            thread.daemon = True
+            thread.start()
+
+        main_stages = [stage for stage in ready_stages if stage.in_main_thread]
+        if main_stages:
+            stage = main_stages[0]
+            threads = max(1, max_threads - sum(running_stages.values()))
+            pending_stages.remove(stage)
+            _run_stage(stage, data, min(threads, stage.threads or threads), finished_stages)
+        finished = [finished_stages.get()]  # waiting for a helper stage if no stage can run in the main thread
+        while not finished_stages.empty():
+            finished.append(finished_stages.get())
+        for stage, outputs, exception in sorted(finished, key=lambda result: stages.index(result[0])):
+            running_stages.pop(stage, None)
+            if exception is not None:
+                error = error or exception
+            else:
+                data.update(outputs)
+            flush_log_records(stage.log_records)
+
+    if error is not None:
+        for stage in running_stages:
+            flush_log_records(list(stage.log_records))
+        raise error
+    return data
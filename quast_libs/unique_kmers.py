@@ -10,18 +10,22 @@ from __future__ import division
 
 import os
 import shutil
+import tempfile
+from bisect import bisect_right
 from collections import defaultdict
 from os.path import join, abspath, exists, basename, isdir
 
-from quast_libs import qconfig, reporting, qutils
+from quast_libs import qconfig, reporting, qutils, reference_profile, index_cache
 from quast_libs.ca_utils.misc import compile_minimap, minimap_fpath
-from quast_libs.fastaparser import read_fasta
-from quast_libs.qutils import get_free_memory, md5, download_external_tool, \
+from quast_libs.fastaparser import read_fasta, read_fasta_lengths
+from quast_libs.log import get_logger
+from quast_libs.qutils import get_free_memory, checksum, download_external_tool, run_parallel, \
     get_dir_for_download
 from quast_libs.reporting import save_kmers
 
 KMER_FRACTION = 0.001
 KMERS_INTERVAL = 1000
+DOWNSAMPLING_WINDOW = 4  # number of k-mers checked at the start of each interval in the first round
 MAX_CONTIGS_NUM = 10000
 MAX_REF_CONTIGS_NUM = 200
 MIN_CONTIGS_LEN = 10000
@@ -32,6 +36,8 @@ kmc_dirpath = abspath(join(qconfig.LIBS_LOCATION, kmc_dirname, qconfig.platform_
 kmc_bin_fpath = join(kmc_dirpath, 'kmc')
 kmc_tools_fpath = join(kmc_dirpath, 'kmc_tools')
 
+_ref_kmers = None  # downsampled k-mers of the reference: id -> (chromosome, position), inherited by worker processes
+
 
 def create_kmc_stats_file(output_dir, contigs_fpath, ref_fpath, completeness,
                           corr_len, mis_len, undef_len, total_len, translocations, relocations):
@@ -39,8 +45,8 @@ def create_kmc_stats_file(output_dir, contigs_fpath, ref_fpath, completeness,
     kmc_check_fpath = join(output_dir, label + '.sf')
     kmc_stats_fpath = join(output_dir, label + '.stat')
     with open(kmc_check_fpath, 'w') as check_f:
-        check_f.write("Assembly md5 checksum: %s\n" % md5(contigs_fpath))
-        check_f.write("Reference md5 checksum: %s\n" % md5(ref_fpath))
+        check_f.write("Assembly checksum: %s\n" % checksum(contigs_fpath))
+        check_f.write("Reference checksum: %s\n" % checksum(ref_fpath))
     with open(kmc_stats_fpath, 'w') as stats_f:
         stats_f.write("Completeness: %s\n" % completeness)
         if corr_len or mis_len:
@@ -60,32 +66,44 @@ def check_kmc_successful_check(output_dir, contigs_fpath, contigs_fpaths, ref_fp
     successful_check_content = open(kmc_check_fpath).read().split('\n')
     if len(successful_check_content) < 2:
         return False
-    if successful_check_content[0].strip().split()[-1] != str(md5(contigs_fpath)):
+    if successful_check_content[0].strip().split()[-1] != checksum(contigs_fpath):
         return False
-    if successful_check_content[1].strip().split()[-1] != str(md5(ref_fpath)):
+    if successful_check_content[1].strip().split()[-1] != checksum(ref_fpath):
         return False
     return True
 
 
-def get_kmers_cnt(tmp_dirpath, kmc_db_fpath, log_fpath, err_fpath):
+def get_kmers_cnt(tmp_dirpath, kmc_db_fpath, log_fpath, err_fpath, threads=None):
     histo_fpath = join(tmp_dirpath, basename(kmc_db_fpath) + '.histo.txt')
-    run_kmc(['histogram', kmc_db_fpath, histo_fpath], log_fpath, err_fpath)
+    run_kmc(['histogram', kmc_db_fpath, histo_fpath], log_fpath, err_fpath, threads=threads)
     kmers_cnt = 0
     if exists(histo_fpath):
         kmers_cnt = int(open(histo_fpath).read().split()[-1])
     return kmers_cnt
 
 
-def count_kmers(tmp_dirpath, fpath, kmer_len, log_fpath, err_fpath):
+def count_kmers(tmp_dirpath, fpath, kmer_len, log_fpath, err_fpath, use_index_cache=False, threads=None, max_mem=None):
     kmc_out_fpath = join(tmp_dirpath, basename(fpath) + '.kmc')
-    max_mem = max(2, get_free_memory())
-    run_kmc(['-m' + str(max_mem), '-n128', '-k' + str(kmer_len), '-fm', '-cx1', '-ci1', fpath, kmc_out_fpath, tmp_dirpath],
-            log_fpath, err_fpath, use_kmc_tools=False)
+    kmc_params = ['-k' + str(kmer_len), '-fm', '-cx1', '-ci1']
+
+    def _count_kmers(out_fpath):
+        # KMC names its temporary files in the same way, so each run needs its own working directory
+        work_dirpath = tempfile.mkdtemp(dir=tmp_dirpath)
+        try:
+            return run_kmc(['-m' + str(max_mem or max(2, get_free_memory())), '-n128'] + kmc_params +
+                           [fpath, out_fpath, work_dirpath], log_fpath, err_fpath, use_kmc_tools=False, threads=threads) == 0
+        finally:
+            shutil.rmtree(work_dirpath, ignore_errors=True)
+
+    if use_index_cache:
+        index_cache.get_index(kmc_bin_fpath, fpath, kmc_params, _count_kmers, kmc_out_fpath)
+    else:
+        _count_kmers(kmc_out_fpath)
     return kmc_out_fpath
 
 
 def align_kmers(output_dir, ref_fpath, kmers_fpath, log_err_fpath, max_threads):
-    out_fpath = join(output_dir, 'kmers.coords')
+    out_fpath = join(output_dir, qutils.label_from_fpath_for_fname(ref_fpath) + '.kmers.coords')
     cmdline = [minimap_fpath(), '-cx', 'sr', '-s' + str(qconfig.unique_kmer_len * 2), '--frag=no',
                '-t', str(max_threads), ref_fpath, kmers_fpath]
     qutils.call_subprocess(cmdline, stdout=open(out_fpath, 'w'), stderr=open(log_err_fpath, 'a'), indent='  ')
@@ -102,51 +120,122 @@ def align_kmers(output_dir, ref_fpath, kmers_fpath, log_err_fpath, max_threads):
     return kmers_by_chrom, kmers_pos_by_chrom
 
 
-def downsample_kmers(tmp_dirpath, ref_fpath, kmc_db_fpath, kmer_len, log_fpath, err_fpath):
-    downsampled_txt_fpath = join(tmp_dirpath, 'kmc.downsampled.txt')
-    open(downsampled_txt_fpath, 'w').close()
-    ref_kmers = dict()
-    prev_kmer_idx = 0
-    for chrom, seq in read_fasta(ref_fpath):
-        kmc_fasta_fpath = join(tmp_dirpath, 'kmers_' + chrom + '.fasta')
+def _iter_candidate_kmers(ref_fpath, kmer_len, chrom_offsets, intervals_by_chrom, first_offset, last_offset):
+    """
+        Generator of k-mers (id, k-mer) at offsets [first_offset, last_offset) of the given intervals of chromosomes.
+        K-mers with N's are skipped as KMC never counts them
+    """
+    for chrom_idx, (chrom, seq) in enumerate(read_fasta(ref_fpath)):
         num_kmers_in_seq = len(seq) - kmer_len + 1
-        with open(kmc_fasta_fpath, 'w') as out_f:
-            for i in range(num_kmers_in_seq):
-                out_f.write('>' + str(i) + '\n')
-                out_f.write(seq[i: i + kmer_len] + '\n')
-        filtered_fpath = join(tmp_dirpath, 'kmers_' + chrom + '.filtered.fasta')
-        filter_contigs(kmc_fasta_fpath, filtered_fpath, kmc_db_fpath, log_fpath, err_fpath, min_kmers=1)
-        filtered_kmers = set()
-        for idx, _ in read_fasta(filtered_fpath):
-            filtered_kmers.add(idx)
-        with open(downsampled_txt_fpath, 'a') as out_f:
-            kmer_i = 0
-            for idx, seq in read_fasta(kmc_fasta_fpath):
-                if idx in filtered_kmers:
-                    if not kmer_i or int(idx) - kmer_i >= KMERS_INTERVAL:
-                        kmer_i = int(idx)
-                        out_f.write('>' + str(prev_kmer_idx + kmer_i) + '\n')
-                        out_f.write(seq + '\n')
-                        ref_kmers[prev_kmer_idx + kmer_i] = (chrom, kmer_i)
-        prev_kmer_idx += num_kmers_in_seq
-        if qconfig.space_efficient:
-            os.remove(kmc_fasta_fpath)
+        for interval in intervals_by_chrom.get(chrom_idx, []):
+            interval_start = interval * KMERS_INTERVAL
+            interval_end = min(interval_start + KMERS_INTERVAL, num_kmers_in_seq)
+            for pos in range(interval_start + first_offset, min(interval_start + last_offset, interval_end)):
+                kmer = seq[pos: pos + kmer_len]
+                if 'N' not in kmer.upper():
+                    yield chrom_offsets[chrom_idx] + pos, kmer
+
+
+def downsample_kmers(tmp_dirpath, ref_fpath, kmc_db_fpath, kmer_len, log_fpath, err_fpath, downsampled_txt_fpath=None):
+    """
+        Samples the first unique k-mer (present in kmc_db_fpath) of each KMERS_INTERVAL positions of the reference.
+        Only DOWNSAMPLING_WINDOW k-mers from the start of each interval are checked at first, the window is doubled
+        for intervals without unique k-mers, so temporary files contain only a few k-mers per interval
+    """
+    chrom_offsets = []
+    intervals_by_chrom = dict()  # chromosome index -> intervals without sampled k-mers
+    num_kmers = 0
+    for chrom_idx, (chrom, seq_len) in enumerate(read_fasta_lengths(ref_fpath)):
+        num_kmers_in_seq = max(0, seq_len - kmer_len + 1)
+        chrom_offsets.append(num_kmers)
+        intervals_by_chrom[chrom_idx] = list(range((num_kmers_in_seq + KMERS_INTERVAL - 1) // KMERS_INTERVAL))
+        num_kmers += num_kmers_in_seq
+
+    sampled_kmers = dict()  # (chromosome index, interval) -> position of the sampled k-mer
+    candidates_fpath = join(tmp_dirpath, 'kmers.candidates.fasta')
+    filtered_fpath = join(tmp_dirpath, 'kmers.candidates.filtered.fasta')
+    first_offset, window = 0, DOWNSAMPLING_WINDOW
+    while first_offset < KMERS_INTERVAL and any(intervals_by_chrom.values()):
+        last_offset = first_offset + window
+        candidates_num = 0
+        with open(candidates_fpath, 'w') as out_f:
+            for kmer_idx, kmer in _iter_candidate_kmers(ref_fpath, kmer_len, chrom_offsets, intervals_by_chrom,
+                                                        first_offset, last_offset):
+                out_f.write('>' + str(kmer_idx) + '\n')
+                out_f.write(kmer + '\n')
+                candidates_num += 1
+        if exists(filtered_fpath):
+            os.remove(filtered_fpath)
+        if candidates_num:
+            filter_contigs(candidates_fpath, filtered_fpath, kmc_db_fpath, log_fpath, err_fpath, min_kmers=1)
+        if exists(filtered_fpath):
+            for idx, _ in read_fasta(filtered_fpath):
+                kmer_idx = int(idx)
+                chrom_idx = bisect_right(chrom_offsets, kmer_idx) - 1
+                pos = kmer_idx - chrom_offsets[chrom_idx]
+                key = (chrom_idx, pos // KMERS_INTERVAL)
+                if key not in sampled_kmers or pos < sampled_kmers[key]:
+                    sampled_kmers[key] = pos
+        for chrom_idx, intervals in intervals_by_chrom.items():
+            intervals_by_chrom[chrom_idx] = [interval for interval in intervals if (chrom_idx, interval) not in sampled_kmers]
+        first_offset, window = last_offset, window * 2
+    if qconfig.space_efficient:
+        os.remove(candidates_fpath)
+
+    positions_by_chrom = defaultdict(list)
+    for (chrom_idx, interval), pos in sampled_kmers.items():
+        positions_by_chrom[chrom_idx].append(pos)
+    downsampled_txt_fpath = downsampled_txt_fpath or join(tmp_dirpath, 'kmc.downsampled.txt')
+    ref_kmers = dict()
+    with open(downsampled_txt_fpath, 'w') as out_f:
+        for chrom_idx, (chrom, seq) in enumerate(read_fasta(ref_fpath)):
+            for pos in sorted(positions_by_chrom[chrom_idx]):
+                kmer_idx = chrom_offsets[chrom_idx] + pos
+                out_f.write('>' + str(kmer_idx) + '\n')
+                out_f.write(seq[pos: pos + kmer_len] + '\n')
+                ref_kmers[kmer_idx] = (chrom, pos)
     return ref_kmers, downsampled_txt_fpath
 
 
+def get_downsampled_kmers(tmp_dirpath, ref_fpath, kmc_db_fpath, kmer_len, log_fpath, err_fpath):
+    """
+        Returns k-mers sampled by downsample_kmers and the path to them, they are reused through the index cache
+    """
+    def _downsample_kmers(prefix):
+        ref_kmers, _ = downsample_kmers(tmp_dirpath, ref_fpath, kmc_db_fpath, kmer_len, log_fpath, err_fpath,
+                                        downsampled_txt_fpath=prefix + '.txt')
+        with open(prefix + '.pos.tsv', 'w') as out_f:
+            for kmer_idx in sorted(ref_kmers):
+                chrom, pos = ref_kmers[kmer_idx]
+                out_f.write('%d\t%s\t%d\n' % (kmer_idx, chrom, pos))
+        return True
+
+    downsampled_prefix = index_cache.get_index(kmc_tools_fpath, ref_fpath, ['downsampled', kmer_len, KMERS_INTERVAL, DOWNSAMPLING_WINDOW],
+                                               _downsample_kmers, join(tmp_dirpath, 'kmc.downsampled'))
+    ref_kmers = dict()
+    with open(downsampled_prefix + '.pos.tsv') as f:
+        for line in f:
+            kmer_idx, chrom, pos = line.rstrip('\n').split('\t')
+            ref_kmers[int(kmer_idx)] = (chrom, int(pos))
+    return ref_kmers, downsampled_prefix + '.txt'
+
+
 def get_clear_name(fpath):
     return basename(fpath).replace('.kmc', '')
 
 
-def intersect_kmers(tmp_dirpath, kmc_out_fpaths, log_fpath, err_fpath):
-    intersect_out_fpath = join(tmp_dirpath, '_'.join([get_clear_name(kmc_out_fpath)[:30] for kmc_out_fpath in kmc_out_fpaths]) + '.kmc')
+def intersect_kmers(tmp_dirpath, kmc_out_fpaths, log_fpath, err_fpath, threads=None):
+    # the name of the last database is not truncated, so intersections with different assemblies do not clash
+    intersect_out_fpath = join(tmp_dirpath, '_'.join([get_clear_name(kmc_out_fpath)[:30] for kmc_out_fpath in kmc_out_fpaths[:-1]] +
+                                                     [get_clear_name(kmc_out_fpaths[-1])]) + '.kmc')
     if len(kmc_out_fpaths) == 2:
-        run_kmc(['simple'] + kmc_out_fpaths + ['intersect', intersect_out_fpath], log_fpath, err_fpath)
+        run_kmc(['simple'] + kmc_out_fpaths + ['intersect', intersect_out_fpath], log_fpath, err_fpath, threads=threads)
     else:
         prev_kmc_out_fpath = kmc_out_fpaths[0]
         for i in range(1, len(kmc_out_fpaths)):
             tmp_out_fpath = join(tmp_dirpath, get_clear_name(prev_kmc_out_fpath) + '_' + str(i) + '.kmc')
-            run_kmc(['simple', prev_kmc_out_fpath, kmc_out_fpaths[i], 'intersect', tmp_out_fpath], log_fpath, err_fpath)
+            run_kmc(['simple', prev_kmc_out_fpath, kmc_out_fpaths[i], 'intersect', tmp_out_fpath], log_fpath, err_fpath,
+                    threads=threads)
             prev_kmc_out_fpath = tmp_out_fpath
         intersect_out_fpath = prev_kmc_out_fpath
     return intersect_out_fpath
@@ -158,10 +247,10 @@ def filter_contigs(input_fpath, output_fpath, db_fpath, log_fpath, err_fpath, mi
     run_kmc(['filter', db_fpath, input_fpath, '-ci' + str(min_kmers), '-fa', output_fpath], log_fpath, err_fpath)
 
 
-def run_kmc(params, log_fpath, err_fpath, use_kmc_tools=True):
+def run_kmc(params, log_fpath, err_fpath, use_kmc_tools=True, threads=None):
     tool_fpath = kmc_tools_fpath if use_kmc_tools else kmc_bin_fpath
-    qutils.call_subprocess([tool_fpath, '-t' + str(qconfig.max_threads), '-hp'] + params,
-                           stdout=open(log_fpath, 'a'), stderr=open(err_fpath, 'a'))
+    return qutils.call_subprocess([tool_fpath, '-t' + str(threads or qutils.get_max_threads()), '-hp'] + params,
+                                  stdout=open(log_fpath, 'a'), stderr=open(err_fpath, 'a'))
 
 
 def _get_dist_inconstistency(pos, prev_pos, ref_pos, prev_ref_pos, cyclic_ref_lens):
@@ -171,6 +260,89 @@ def _get_dist_inconstistency(pos, prev_pos, ref_pos, prev_ref_pos, cyclic_ref_le
     return dist
 
 
+def count_matched_kmers(index, contigs_fpath, tmp_dirpath, ref_kmc_out_fpath, kmer_len, log_fpath, err_fpath, threads, max_mem):
+    logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+    logger.info('    ' + qutils.index_to_str(index) + qutils.label_from_fpath(contigs_fpath))
+    kmc_out_fpath = count_kmers(tmp_dirpath, contigs_fpath, kmer_len, log_fpath, err_fpath, threads=threads, max_mem=max_mem)
+    intersect_out_fpath = intersect_kmers(tmp_dirpath, [ref_kmc_out_fpath, kmc_out_fpath], log_fpath, err_fpath, threads=threads)
+    return get_kmers_cnt(tmp_dirpath, intersect_out_fpath, log_fpath, err_fpath, threads=threads)
+
+
+def analyze_correctness(index, contigs_fpath, tmp_dirpath, downsampled_kmers_fpath, err_fpath, is_fragmented, ref_len, threads):
+    """
+        Finds misjoins by positions of downsampled reference k-mers (_ref_kmers) in contigs
+        Returns lengths of correct, misjoined, undefined and all contigs, numbers of translocations and relocations
+    """
+    logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+    logger.info('    ' + qutils.index_to_str(index) + qutils.label_from_fpath(contigs_fpath))
+    ref_kmers = _ref_kmers
+    total_len = 0
+    contig_lens = dict()
+    for name, seq_len in read_fasta_lengths(contigs_fpath):
+        total_len += seq_len
+        contig_lens[name] = seq_len
+
+    if is_fragmented:
+        logger.warning('Reference is too fragmented. Scaffolding accuracy will not be assessed.')
+        return None, None, None, total_len, None, None
+
+    corr_len = 0
+    mis_len = 0
+    kmers_by_contig, kmers_pos_by_contig = align_kmers(tmp_dirpath, contigs_fpath, downsampled_kmers_fpath, err_fpath, threads)
+    is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
+    cyclic_ref_lens = ref_len if is_cyclic else None
+    translocations = 0
+    relocations = 0
+    with open(join(tmp_dirpath, qutils.label_from_fpath_for_fname(contigs_fpath) + '.misjoins.txt'), 'w') as out:
+        for contig in kmers_by_contig.keys():
+            contig_markers = []
+            prev_pos, prev_ref_pos, prev_chrom, marker = None, None, None, None
+            for pos, kmer in sorted(zip(kmers_pos_by_contig[contig], kmers_by_contig[contig]), key=lambda x: x[0]):
+                ref_chrom, ref_pos = ref_kmers[kmer]
+                if prev_pos and prev_chrom:
+                    if prev_chrom == ref_chrom and abs(abs(pos - prev_pos) / abs(ref_pos - prev_ref_pos) - 1) <= 0.05:
+                        marker = (pos, ref_pos, ref_chrom)
+                    elif marker:
+                        contig_markers.append(marker)
+                        pos, ref_pos, ref_chrom, marker = None, None, None, None
+                prev_pos, prev_ref_pos, prev_chrom = pos, ref_pos, ref_chrom
+            if marker:
+                contig_markers.append(marker)
+            prev_pos, prev_ref_pos, prev_chrom = None, None, None
+            is_misassembled = False
+            for marker in contig_markers:
+                pos, ref_pos, ref_chrom = marker
+                if prev_pos and prev_chrom:
+                    if ref_chrom != prev_chrom:
+                        translocations += 1
+                        out.write('Translocation in %s: %s %d | %s %d\n' %
+                                  (contig, prev_chrom, prev_pos, ref_chrom, pos))
+                        is_misassembled = True
+                    elif _get_dist_inconstistency(pos, prev_pos, ref_pos, prev_ref_pos, cyclic_ref_lens) > EXT_RELOCATION_SIZE:
+                        relocations += 1
+                        out.write('Relocation in %s: %d (%d) | %d (%d)\n' %
+                                  (contig, prev_pos, prev_ref_pos, pos, ref_pos))
+                        is_misassembled = True
+                prev_pos, prev_ref_pos, prev_chrom = pos, ref_pos, ref_chrom
+            if is_misassembled:
+                mis_len += contig_lens[contig]
+            elif len(contig_markers) > 0:
+                corr_len += contig_lens[contig]
+    undef_len = total_len - corr_len - mis_len
+    return corr_len, mis_len, undef_len, total_len, translocations, relocations
+
+
+def download_kmc(logger):
+    global kmc_bin_fpath
+    global kmc_tools_fpath
+    kmc_dirpath = get_dir_for_download(kmc_dirname, 'KMC', ['kmc', 'kmc_tools'], logger)
+    if not kmc_dirpath:
+        return False
+    kmc_bin_fpath = download_external_tool('kmc', kmc_dirpath, 'KMC', platform_specific=True, is_executable=True)
+    kmc_tools_fpath = download_external_tool('kmc_tools', kmc_dirpath, 'KMC', platform_specific=True, is_executable=True)
+    return bool(kmc_bin_fpath and kmc_tools_fpath and exists(kmc_bin_fpath) and exists(kmc_tools_fpath))
+
+
 def do(output_dir, ref_fpath, contigs_fpaths, logger):
     logger.print_timestamp()
     kmer_len = qconfig.unique_kmer_len
@@ -212,12 +384,7 @@ def do(output_dir, ref_fpath, contigs_fpaths, logger):
         logger.warning('  Sorry, can\'t run KMC on this platform, skipping...')
         return None
 
-    kmc_dirpath = get_dir_for_download(kmc_dirname, 'KMC', ['kmc', 'kmc_tools'], logger)
-    global kmc_bin_fpath
-    global kmc_tools_fpath
-    kmc_bin_fpath = download_external_tool('kmc', kmc_dirpath, 'KMC', platform_specific=True, is_executable=True)
-    kmc_tools_fpath = download_external_tool('kmc_tools', kmc_dirpath, 'KMC', platform_specific=True, is_executable=True)
-    if not exists(kmc_bin_fpath) or not exists(kmc_tools_fpath) or not compile_minimap(logger):
+    if not download_kmc(logger) or not compile_minimap(logger):
         logger.warning('  Sorry, can\'t run KMC, skipping...')
         return None
 
@@ -232,92 +399,38 @@ def do(output_dir, ref_fpath, contigs_fpaths, logger):
     tmp_dirpath = join(output_dir, 'tmp')
     if not isdir(tmp_dirpath):
         os.makedirs(tmp_dirpath)
-    ref_kmc_out_fpath = count_kmers(tmp_dirpath, ref_fpath, kmer_len, log_fpath, err_fpath)
+    ref_kmc_out_fpath = count_kmers(tmp_dirpath, ref_fpath, kmer_len, log_fpath, err_fpath, use_index_cache=True)
     unique_kmers = get_kmers_cnt(tmp_dirpath, ref_kmc_out_fpath, log_fpath, err_fpath)
     if not unique_kmers:
         logger.warning('KMC failed, check ' + log_fpath + ' and ' + err_fpath + '. Skipping...')
         return
 
     logger.info('  Analyzing assemblies completeness...')
-    kmc_out_fpaths = []
-    for id, contigs_fpath in enumerate(contigs_fpaths):
-        assembly_label = qutils.label_from_fpath(contigs_fpath)
-        logger.info('    ' + qutils.index_to_str(id) + assembly_label)
-
-        report = reporting.get(contigs_fpath)
-        kmc_out_fpath = count_kmers(tmp_dirpath, contigs_fpath, kmer_len, log_fpath, err_fpath)
-        intersect_out_fpath = intersect_kmers(tmp_dirpath, [ref_kmc_out_fpath, kmc_out_fpath], log_fpath, err_fpath)
-        matched_kmers = get_kmers_cnt(tmp_dirpath, intersect_out_fpath, log_fpath, err_fpath)
+    n_jobs = min(len(contigs_fpaths), qutils.get_max_threads())
+    threads = max(1, qutils.get_max_threads() // n_jobs)
+    max_mem = max(2, get_free_memory() // n_jobs)
+    parallel_args = [(index, contigs_fpath, tmp_dirpath, ref_kmc_out_fpath, kmer_len, log_fpath, err_fpath, threads, max_mem)
+                     for index, contigs_fpath in enumerate(contigs_fpaths)]
+    matched_kmers_list = run_parallel(count_matched_kmers, parallel_args, n_jobs)
+    for contigs_fpath, matched_kmers in zip(contigs_fpaths, matched_kmers_list):
         completeness = matched_kmers * 100.0 / unique_kmers
-        report.add_field(reporting.Fields.KMER_COMPLETENESS, '%.2f' % completeness)
-        kmc_out_fpaths.append(intersect_out_fpath)
+        reporting.get(contigs_fpath).add_field(reporting.Fields.KMER_COMPLETENESS, '%.2f' % completeness)
 
     logger.info('  Analyzing assemblies correctness...')
-    ref_contigs = [name for name, _ in read_fasta(ref_fpath)]
+    ref_profile = reference_profile.get(ref_fpath)
+    ref_contigs = list(ref_profile.chr_lengths.keys())
     logger.info('    Downsampling k-mers...')
-    ref_kmers, downsampled_kmers_fpath = downsample_kmers(tmp_dirpath, ref_fpath, ref_kmc_out_fpath, kmer_len, log_fpath, err_fpath)
-    for id, (contigs_fpath, kmc_db_fpath) in enumerate(zip(contigs_fpaths, kmc_out_fpaths)):
-        assembly_label = qutils.label_from_fpath(contigs_fpath)
-        logger.info('    ' + qutils.index_to_str(id) + assembly_label)
-
+    global _ref_kmers
+    _ref_kmers, downsampled_kmers_fpath = get_downsampled_kmers(tmp_dirpath, ref_fpath, ref_kmc_out_fpath, kmer_len, log_fpath, err_fpath)
+    is_fragmented = len(ref_contigs) > MAX_REF_CONTIGS_NUM
+    parallel_args = [(index, contigs_fpath, tmp_dirpath, downsampled_kmers_fpath, err_fpath, is_fragmented,
+                      ref_profile.total_length, threads)
+                     for index, contigs_fpath in enumerate(contigs_fpaths)]
+    kmc_stats = run_parallel(analyze_correctness, parallel_args, n_jobs)
+    _ref_kmers = None
+    for contigs_fpath, (corr_len, mis_len, undef_len, total_len, translocations, relocations) in zip(contigs_fpaths, zip(*kmc_stats)):
         report = reporting.get(contigs_fpath)
-        corr_len = None
-        mis_len = None
-        undef_len = None
-        translocations, relocations = None, None
-        total_len = 0
-        contig_lens = dict()
-        for name, seq in read_fasta(contigs_fpath):
-            total_len += len(seq)
-            contig_lens[name] = len(seq)
-
-        if len(ref_contigs) > MAX_REF_CONTIGS_NUM:
-            logger.warning('Reference is too fragmented. Scaffolding accuracy will not be assessed.')
-        else:
-            corr_len = 0
-            mis_len = 0
-            kmers_by_contig, kmers_pos_by_contig = align_kmers(tmp_dirpath, contigs_fpath, downsampled_kmers_fpath, err_fpath,
-                                                               qconfig.max_threads)
-            is_cyclic = qconfig.prokaryote and not qconfig.check_for_fragmented_ref
-            cyclic_ref_lens = report.get_field(reporting.Fields.REFLEN) if is_cyclic else None
-            translocations = 0
-            relocations = 0
-            with open(join(tmp_dirpath, qutils.label_from_fpath_for_fname(contigs_fpath) + '.misjoins.txt'), 'w') as out:
-                for contig in kmers_by_contig.keys():
-                    contig_markers = []
-                    prev_pos, prev_ref_pos, prev_chrom, marker = None, None, None, None
-                    for pos, kmer in sorted(zip(kmers_pos_by_contig[contig], kmers_by_contig[contig]), key=lambda x: x[0]):
-                        ref_chrom, ref_pos = ref_kmers[kmer]
-                        if prev_pos and prev_chrom:
-                            if prev_chrom == ref_chrom and abs(abs(pos - prev_pos) / abs(ref_pos - prev_ref_pos) - 1) <= 0.05:
-                                marker = (pos, ref_pos, ref_chrom)
-                            elif marker:
-                                contig_markers.append(marker)
-                                pos, ref_pos, ref_chrom, marker = None, None, None, None
-                        prev_pos, prev_ref_pos, prev_chrom = pos, ref_pos, ref_chrom
-                    if marker:
-                        contig_markers.append(marker)
-                    prev_pos, prev_ref_pos, prev_chrom = None, None, None
-                    is_misassembled = False
-                    for marker in contig_markers:
-                        pos, ref_pos, ref_chrom = marker
-                        if prev_pos and prev_chrom:
-                            if ref_chrom != prev_chrom:
-                                translocations += 1
-                                out.write('Translocation in %s: %s %d | %s %d\n' %
-                                          (contig, prev_chrom, prev_pos, ref_chrom, pos))
-                                is_misassembled = True
-                            elif _get_dist_inconstistency(pos, prev_pos, ref_pos, prev_ref_pos, cyclic_ref_lens) > EXT_RELOCATION_SIZE:
-                                relocations += 1
-                                out.write('Relocation in %s: %d (%d) | %d (%d)\n' %
-                                          (contig, prev_pos, prev_ref_pos, pos, ref_pos))
-                                is_misassembled = True
-                        prev_pos, prev_ref_pos, prev_chrom = pos, ref_pos, ref_chrom
-                    if is_misassembled:
-                        mis_len += contig_lens[contig]
-                    elif len(contig_markers) > 0:
-                        corr_len += contig_lens[contig]
-            undef_len = total_len - corr_len - mis_len
+        if corr_len is not None:
             report.add_field(reporting.Fields.KMER_CORR_LENGTH, '%.2f' % (corr_len * 100.0 / total_len))
             report.add_field(reporting.Fields.KMER_MIS_LENGTH, '%.2f' % (mis_len * 100.0 / total_len))
             report.add_field(reporting.Fields.KMER_UNDEF_LENGTH, '%.2f' % (undef_len * 100.0 / total_len))
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import os
+import random
+import sys
+from heapq import heappush, heappop
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs import qconfig
+qconfig.extensive_misassembly_threshold = qconfig.DEFAULT_EXT_MIS_SIZE  # are set by options parsing in QUAST runs
+qconfig.min_alignment = qconfig.DEFAULT_MIN_ALIGNMENT
+from quast_libs.ca_utils.analyze_misassemblies import Mapping, Misassembly, is_misassembly, exclude_internal_overlaps, \
+    is_fragmented_ref_fake_translocation
+from quast_libs.ca_utils.best_set_selection import get_best_aligns_sets, ScoredSet, PutativeBestSet, score_single_align
+
+
+# Exhaustive selection as it was done before the score-ordered search of predecessors:
+# each set is extended by trying all preceding sets, alignments of the sets are cloned for scoring
+def get_added_len(set_aligns, cur_align):
+    last_align_idx = -2
+    last_align = set_aligns[last_align_idx]
+    added_right = cur_align.end() - max(cur_align.start() - 1, last_align.end())
+    added_left = 0
+    while cur_align.start() < last_align.start():
+        added_left += last_align.start() - cur_align.start()
+        last_align_idx -= 1
+        if -last_align_idx <= len(set_aligns):
+            prev_start = last_align.start()
+            last_align = set_aligns[last_align_idx]
+            added_left -= max(0, min(prev_start, last_align.end()) - cur_align.start() + 1)
+        else:
+            break
+    return added_right + added_left
+
+
+def get_score(score, aligns, ref_lens, is_cyclic, uncovered_len, seq, penalties):
+    if len(aligns) > 1:
+        align1, align2 = aligns[-2], aligns[-1]
+        is_fake_translocation = is_fragmented_ref_fake_translocation(align1, align2, ref_lens)
+        overlaped_len = max(0, align1.end() - align2.start() + 1)
+        if len(aligns) > 2:
+            exclude_internal_overlaps(aligns[-3], align1)
+        reduced_len, _ = exclude_internal_overlaps(align1, align2)
+        if min(align1.len2, align2.len2) < qconfig.min_alignment:
+            return None, None
+        added_len = get_added_len(aligns, aligns[-1])
+        uncovered_len -= (added_len - reduced_len)
+        score += score_single_align(align2, ctg_len=added_len) - score_single_align(align1, ctg_len=reduced_len)
+        is_extensive_misassembly, aux_data = is_misassembly(align1, align2, seq, ref_lens, is_cyclic, None,
+                                                            is_fake_translocation)
+        if is_extensive_misassembly:
+            misassembly_penalty = penalties['extensive']
+            if align1.ref != align2.ref:
+                misassembly = Misassembly.TRANSLOCATION
+            elif abs(aux_data["inconsistency"]) > qconfig.extensive_misassembly_threshold:
+                misassembly = Misassembly.RELOCATION
+                score -= float(abs(aux_data["inconsistency"])) / ref_lens[align1.ref]
+            else:
+                misassembly = Misassembly.INVERSION
+            score -= misassembly - Misassembly.INVERSION
+        elif aux_data['is_sv']:
+            misassembly_penalty = 0
+        elif abs(aux_data['inconsistency']) > qconfig.MAX_INDEL_LENGTH and not aux_data['is_scaffold_gap']:
+            misassembly_penalty = penalties['local']
+        elif aux_data['is_scaffold_gap']:
+            misassembly_penalty = penalties['scaffold']
+        else:
+            misassembly_penalty = 0
+        overlap_penalty = min(overlaped_len * penalties['overlap_multiplier'], misassembly_penalty)
+        score -= (misassembly_penalty + overlap_penalty)
+    else:
+        score += score_single_align(aligns[-1])
+        uncovered_len -= aligns[-1].len2
+    return score, uncovered_len
+
+
+def get_best_aligns_sets_exhaustively(sorted_aligns, ctg_len, seq, ref_lens, is_cyclic):
+    penalties = dict()
+    penalties['extensive'] = max(50, min(qconfig.BSS_EXTENSIVE_PENALTY, int(round(ctg_len * 0.05)))) - 1
+    penalties['local'] = max(2, min(qconfig.BSS_LOCAL_PENALTY, int(round(ctg_len * 0.01)))) - 1
+    penalties['scaffold'] = 5
+    penalties['overlap_multiplier'] = 0.5
+    sorted_aligns = sorted(sorted_aligns, key=lambda x: (x.end(), x.len2))
+
+    def score_set(scored_set, align):
+        cur_set_aligns = [sorted_aligns[i].clone() for i in scored_set.indexes] + [align.clone()]
+        return get_score(scored_set.score, cur_set_aligns, ref_lens, is_cyclic, scored_set.uncovered, seq, penalties)
+
+    all_scored_sets = [ScoredSet(0, [], ctg_len)]
+    max_score = 0
+    for idx, align in enumerate(sorted_aligns):
+        local_max_score = 0
+        new_scored_set = None
+        for scored_set in reversed(all_scored_sets):
+            score, uncovered = score_set(scored_set, align)
+            if score is None:
+                continue
+            if score > local_max_score:
+                local_max_score = score
+                new_scored_set = ScoredSet(score, scored_set.indexes + [idx], uncovered)
+        if new_scored_set:
+            all_scored_sets.append(new_scored_set)
+            max_score = max(max_score, local_max_score)
+
+    max_allowed_score_drop = max_score - max_score * qconfig.ambiguity_score
+    putative_sets = []
+    best_sets = []
+    for scored_set in all_scored_sets:
+        score_drop = max_score - scored_set.score
+        if score_drop <= max_allowed_score_drop:
+            heappush(putative_sets, PutativeBestSet([scored_set.indexes[-1]], score_drop, scored_set.uncovered))
+
+    ambiguity_check_is_needed = True
+    too_much_best_sets = False
+    while len(putative_sets):
+        putative_set = heappop(putative_sets)
+        if putative_set.indexes[0] == -1:
+            best_sets.append(ScoredSet(max_score - putative_set.score_drop, putative_set.indexes[1:],
+                                       putative_set.uncovered))
+            if ambiguity_check_is_needed and len(best_sets) == 1:
+                if not putative_sets:
+                    return False, too_much_best_sets, sorted_aligns, best_sets
+                elif not qconfig.ambiguity_usage == 'all':
+                    return True, too_much_best_sets, sorted_aligns, best_sets
+                ambiguity_check_is_needed = False
+            if len(best_sets) >= qconfig.BSS_MAX_SETS_NUMBER:
+                too_much_best_sets = (len(putative_sets) > 0)
+                break
+            continue
+        align = sorted_aligns[putative_set.indexes[0]]
+        local_max_score = 0
+        local_uncovered = putative_set.uncovered
+        putative_predecessors = []
+        for scored_set in all_scored_sets:
+            if scored_set.indexes and scored_set.indexes[-1] >= putative_set.indexes[0]:
+                break
+            score, uncovered = score_set(scored_set, align)
+            if score is not None:
+                putative_predecessors.append((scored_set, score, uncovered))
+                if score > local_max_score:
+                    local_max_score = score
+                    local_uncovered = uncovered
+                elif score == local_max_score and uncovered < local_uncovered:
+                    local_uncovered = uncovered
+        for preceding_set, score, uncovered in putative_predecessors:
+            score_drop = local_max_score - score + putative_set.score_drop
+            if score_drop > max_allowed_score_drop:
+                continue
+            new_index = preceding_set.indexes[-1] if preceding_set.indexes else -1
+            new_uncovered = uncovered + (putative_set.uncovered - local_uncovered)
+            heappush(putative_sets, PutativeBestSet([new_index] + putative_set.indexes, score_drop, new_uncovered))
+    return True, too_much_best_sets, sorted_aligns, best_sets
+
+
+def random_aligns(ctg_len, ref_lens):
+    aligns = []
+    ref_offset = random.randint(0, 20000)
+    for _ in range(random.randint(1, 12)):
+        start = random.randint(1, ctg_len - 100)
+        end = min(ctg_len, start + random.randint(60, 2000))
+        if aligns and random.random() < 0.3:  # repeats give alignments with equal scores
+            prev_align = random.choice(aligns)
+            start, end = prev_align.start(), prev_align.end()
+        ref = random.choice(list(ref_lens)) if random.random() < 0.2 else 'chr1'
+        ref_start = start + ref_offset + random.choice([0, 0, random.randint(-100, 100), random.randint(-5000, 5000)])
+        ref_start = max(1, min(ref_lens[ref] - (end - start), ref_start))
+        ref_end = ref_start + end - start
+        idy = random.choice([95.0, 99.0, 99.5, 100.0])
+        s2, e2 = (start, end) if random.random() < 0.85 else (end, start)
+        aligns.append(Mapping(ref_start, ref_end, s2, e2, ref_end - ref_start + 1, end - start + 1, idy, ref, 'contig'))
+    return aligns
+
+
+def random_seq(ctg_len):
+    seq = [random.choice('ACGT') for _ in range(ctg_len)]
+    for _ in range(random.randint(0, 3)):  # scaffold gaps
+        gap_start = random.randint(0, ctg_len - 1)
+        seq[gap_start:gap_start + random.randint(1, 50)] = 'N' * len(seq[gap_start:gap_start + 50])
+    return ''.join(seq)[:ctg_len]
+
+
+def get_result(result):
+    is_ambiguous, too_much_best_sets, sorted_aligns, best_sets = result
+    return is_ambiguous, too_much_best_sets, [str(align) for align in sorted_aligns], \
+           [(best_set.score, best_set.indexes, best_set.uncovered) for best_set in best_sets]
+
+
+random.seed(1)
+ref_lens = {'chr1': 100000, 'chr2': 50000}
+ambiguous_num = 0
+with open(os.devnull, 'w') as stdout_f:
+    for i in range(600):
+        qconfig.ambiguity_usage = 'all' if i % 2 else 'one'
+        ctg_len = random.randint(500, 6000)
+        aligns = random_aligns(ctg_len, ref_lens)
+        seq = random_seq(ctg_len)
+        is_cyclic = random.random() < 0.3
+        aligns_strs = [str(align) for align in aligns]
+        result = get_result(get_best_aligns_sets(aligns, ctg_len, stdout_f, seq, ref_lens, is_cyclic))
+        expected = get_result(get_best_aligns_sets_exhaustively([align.clone() for align in aligns], ctg_len, seq,
+                                                                ref_lens, is_cyclic))
+        if result != expected:
+            sys.stderr.write('Best sets of alignments %s (ambiguity usage: %s) differ:\n%s expected,\ngot %s\n'
+                             % (aligns_strs, qconfig.ambiguity_usage, expected, result))
+            exit(1)
+        if [str(align) for align in aligns] != aligns_strs:
+            sys.stderr.write('Alignments were modified during selection of the best set\n')
+            exit(1)
+        ambiguous_num += result[0]
+print('Best sets are the same as found exhaustively (%d of contigs are ambiguous)' % ambiguous_num)
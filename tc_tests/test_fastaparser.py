@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import gzip
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs import fastaparser
+
+
+def read_fasta_by_lines(fasta_str):  # FASTA entries as they were read line by line before the bytes-level parser
+    entries = []
+    name, seq = None, []
+    for line in fasta_str.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        if not line:
+            continue
+        if line[0] == '>':
+            if name is not None:
+                entries.append((name, ''.join(seq)))
+            name = line[1:].split()[0] if line[1:].split() else ''
+            seq = []
+        else:
+            seq.append(line.strip())
+    if name or seq:
+        entries.append((name or '', ''.join(seq)))
+    return entries
+
+
+def write_file(fpath, fasta_str):
+    with (gzip.open(fpath, 'wb') if fpath.endswith('.gz') else open(fpath, 'wb')) as out_f:
+        out_f.write(fasta_str.encode())
+
+
+def check(value, expected, what):
+    if value != expected:
+        sys.stderr.write('%s: %s expected, got %s\n' % (what, expected, value))
+        exit(1)
+
+
+def check_fasta(fasta_str, what):
+    expected = read_fasta_by_lines(fasta_str)
+    for ext in ['.fasta', '.fasta.gz']:
+        fpath = os.path.join(tmp_dirpath, 'contigs' + ext)
+        write_file(fpath, fasta_str)
+        for chunk_size in [default_chunk_size, 7]:  # compressed files are read in chunks
+            fastaparser.FASTA_CHUNK_SIZE = chunk_size
+            file_what = '%s (%s, chunks of %d bytes)' % (what, ext, chunk_size)
+            check(list(fastaparser.read_fasta(fpath)), expected, 'entries of ' + file_what)
+            check(list(fastaparser.read_fasta_lengths(fpath)), [(name, len(seq)) for name, seq in expected],
+                  'lengths of ' + file_what)
+            check(list(fastaparser.read_fasta_range(fpath, 1, 3)), expected[1:3], 'range of entries of ' + file_what)
+            check(fastaparser.read_fasta_str(fpath), ''.join(seq for name, seq in expected), 'sequence of ' + file_what)
+            with_fai_fields = list(fastaparser.read_fasta_with_fai_fields(fpath))
+            check([(name, seq) for name, seq, fai_fields in with_fai_fields], expected, 'entries with .fai of ' + file_what)
+    fastaparser.FASTA_CHUNK_SIZE = default_chunk_size
+
+
+default_chunk_size = fastaparser.FASTA_CHUNK_SIZE
+tmp_dirpath = tempfile.mkdtemp()
+try:
+    check_fasta('', 'empty file')
+    check_fasta('>contig_1 length=8\nACGT\nACGT\n>contig_2\nNNAC\n', 'LF line breaks')
+    check_fasta('>contig_1 length=8\r\nACGT\r\nACGT\r\n>contig_2\r\nNNAC\r\n', 'CRLF line breaks')
+    check_fasta('>contig_1\rACGT\rACGT\r>contig_2\rNNAC', 'CR line breaks')
+    check_fasta('ACGT\nAC\n>contig_1\nGGCC\n>contig_2\nTT\n', 'headless preamble')
+    check_fasta('ACGT\r\nAC\r\n', 'sequence without a name')
+    check_fasta('>contig_1\n>contig_2\nACGT\n>contig_3\n', 'empty entries')
+    check_fasta('>contig_1\nAC GT \n\n  ACGT\t\n>contig_2\nAC\n', 'whitespaces and empty lines')
+    random.seed(1)
+    for i in range(50):
+        line_break = random.choice(['\n', '\r\n'])
+        entries = []
+        for j in range(random.randint(1, 5)):
+            seq = ''.join(random.choice('ACGTN') for _ in range(random.randint(0, 40)))
+            lines = [seq[k:k + 10] for k in range(0, len(seq), 10)]
+            entries.append(line_break.join(['>contig_%d' % j] + lines))
+        check_fasta(line_break.join(entries) + random.choice(['', line_break]), 'random FASTA %d' % i)
+    print('FASTA reading is OK')
+
+    fpath = os.path.join(tmp_dirpath, 'contigs.fasta')
+    write_file(fpath, '>contig_1 length=7\nACGTA\nCG\n>contig_2\nACGTACGT\nA\n')
+    fastaparser.create_fai_file(fpath)
+    with open(fpath + '.fai') as fai_f:
+        expected_fai_fields = [[int(fs) if fs.isdigit() else fs for fs in line.split()] for line in fai_f]
+    check([fai_fields for name, seq, fai_fields in fastaparser.read_fasta_with_fai_fields(fpath)], expected_fai_fields,
+          '.fai fields')
+    write_file(fpath, '>contig_1\r\nACGTA\r\nCG\r\n>contig_2\r\n\r\n>contig_3\nAC\n')
+    check([fai_fields for name, seq, fai_fields in fastaparser.read_fasta_with_fai_fields(fpath)],
+          [['contig_1', 7, 11, 5, 7], None, ['contig_3', 2, 45, 2, 3]], '.fai fields with CRLF line breaks')
+    print('.fai fields are OK')
+finally:
+    shutil.rmtree(tmp_dirpath)
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import os
+import random
+import sys
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs import gc_content
+from quast_libs.gc_content import UNDEFINED_GC, MIN_GC_WINDOW_SIZE, count_blocks, get_windows_GC, get_GC_hist
+
+numpy = gc_content.numpy
+block_size = 100
+window_sizes = [100, 300, 1000]
+
+
+def get_GC_percent(seq):  # GC % of a window as it was counted before batching
+    if len(seq) < MIN_GC_WINDOW_SIZE:
+        return None
+    ACGT_len = len(seq) - seq.count('N')
+    if ACGT_len < len(seq) // 2:
+        return None
+    return 100 * (seq.count('G') + seq.count('C')) // ACGT_len
+
+
+def get_expected_windows_GC(seq, window_size):
+    gc_percents = [get_GC_percent(seq[i:i + window_size]) for i in range(0, len(seq), window_size)]
+    return [UNDEFINED_GC if gc_percent is None else gc_percent for gc_percent in gc_percents]
+
+
+def get_windows(seq, window_size):
+    ACGT_counts, GC_counts = count_blocks(seq, block_size)
+    return list(get_windows_GC(len(seq), ACGT_counts, GC_counts, block_size, window_size))
+
+
+def random_seq(length):
+    seq = []
+    while len(seq) < length:
+        letters = 'N' if random.random() < 0.2 else random.choice(['ACGT', 'AT', 'GC', 'AAGT'])
+        seq.extend(random.choice(letters) for _ in range(random.randint(1, 150)))
+    return ''.join(seq[:length])
+
+
+def check(value, expected, what):
+    if value != expected:
+        sys.stderr.write('%s: %s expected, got %s\n' % (what, expected, value))
+        exit(1)
+
+
+random.seed(1)
+seqs = ['', 'A', 'N' * 99, 'G' * 49, 'G' * 50, 'C' * 100 + 'N' * 100 + 'A' * 149, 'N' * 150 + 'G' * 150] + \
+       [random_seq(random.choice([random.randint(1, 3000), 100 * random.randint(1, 30), 100 * random.randint(1, 30) + 50]))
+        for _ in range(200)]
+engines = [('pure Python', None)] + ([('NumPy', numpy)] if numpy is not None else [])
+results_by_engines = []
+for engine, engine_module in engines:
+    gc_content.numpy = engine_module
+    results = []
+    for seq in seqs:
+        for window_size in window_sizes:
+            windows = get_windows(seq, window_size)
+            check(windows, get_expected_windows_GC(seq, window_size),
+                  '%s GC of %d bp windows of %s' % (engine, window_size, seq))
+            results.append(windows)
+    all_windows = [gc_percent for windows in results for gc_percent in windows]
+    for windows in [all_windows, all_windows[:500], []]:  # long arrays are counted differently
+        check(get_GC_hist(array('b', windows)), [sum(1 for gc in windows if gc == i) for i in range(101)],
+              '%s histogram of windows' % engine)
+    results_by_engines.append(results)
+    print('%s GC windows are OK' % engine)
+gc_content.numpy = numpy
+
+if len(results_by_engines) > 1:
+    check(results_by_engines[0], results_by_engines[1], 'GC windows of NumPy and pure Python')
+    print('NumPy and pure Python GC windows are the same')
+else:
+    print('NumPy is not installed, only pure Python GC windows are tested')
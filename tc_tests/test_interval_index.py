@@ -0,0 +1,55 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs.intervals import NsIndex, IntervalIndex
+
+
+def check(value, expected, what):
+    if value != expected:
+        sys.stderr.write('%s: %s expected, got %s\n' % (what, expected, value))
+        exit(1)
+
+
+random.seed(1)
+
+# N's
+ns = NsIndex('NNACGTNACNN')
+check(ns.intervals(), [[1, 2], [7, 7], [10, 11]], 'runs of N\'s')
+check(len(ns), 5, 'number of N\'s')
+check([pos for pos in range(0, 13) if pos in ns], [1, 2, 7, 10, 11], 'positions of N\'s')
+check(ns.overlap([[2, 7]]), 2, 'N\'s inside interval')
+check(ns.overlap([[3, 6], [8, 9]]), 0, 'N\'s between intervals')
+check(ns.overlap([]), 0, 'N\'s inside no intervals')
+empty_ns = NsIndex('ACGT')
+check((len(empty_ns), 1 in empty_ns, empty_ns.overlap([[1, 4]])), (0, False, 0), 'sequence without N\'s')
+check((len(NsIndex()), 0 in NsIndex()), (0, False), 'empty sequence')
+print('Index of N\'s is OK')
+
+# overlapping intervals, s < end and e > start
+check(IntervalIndex([]).find_overlaps(1, 10), [], 'search in the empty index')
+index = IntervalIndex([(10, 20, 'a'), (20, 30, 'b'), (5, 50, 'c'), (40, 45, 'd')])
+check(index.find_overlaps(20, 40), ['c', 'b'], 'search of intervals touching the query')
+check(index.find_overlaps(0, 5), [], 'search before intervals')
+check(index.find_overlaps(0, 6), ['c'], 'search of the first position')
+check(index.find_overlaps(49, 100), ['c'], 'search of the last position')
+check(index.find_overlaps(50, 100), [], 'search after intervals')
+check(index.find_overlaps(12, 13), ['c', 'a'], 'search inside nested intervals')
+check(IntervalIndex([(1, 2, 'x')]).find_overlaps(1, 2), ['x'], 'search in the index of one interval')
+
+for _ in range(300):
+    intervals_with_items = [(start, start + random.randint(0, 20), i)
+                            for i, start in enumerate(random.randint(0, 100) for _ in range(random.randint(1, 40)))]
+    index = IntervalIndex(intervals_with_items)
+    query_start = random.randint(-5, 110)
+    query_end = query_start + random.randint(0, 30)
+    expected = [item for start, end, item in sorted(intervals_with_items, key=lambda interval: interval[0])
+                if start < query_end and end > query_start]
+    check(index.find_overlaps(query_start, query_end), expected,
+          'overlaps of (%d, %d) in %s' % (query_start, query_end, intervals_with_items))
+print('Index of intervals is OK')
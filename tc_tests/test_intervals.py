@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs.intervals import merge_intervals, intervals_length, intersection_length, complement_intervals
+
+
+def positions(intervals):
+    return set(pos for start, end in intervals for pos in range(start, end + 1))
+
+
+def check(value, expected, what):
+    if value != expected:
+        sys.stderr.write('%s: %s expected, got %s\n' % (what, expected, value))
+        exit(1)
+
+
+# merging
+check(merge_intervals([]), [], 'merging of no intervals')
+check(merge_intervals([(5, 4)]), [], 'merging of an empty interval')
+check(merge_intervals([(1, 5), (6, 10)]), [[1, 10]], 'merging of touching intervals')
+check(merge_intervals([(1, 5), (7, 10)]), [[1, 5], [7, 10]], 'merging of separated intervals')
+check(merge_intervals([(1, 10), (3, 4), (2, 10)]), [[1, 10]], 'merging of nested intervals')
+check(merge_intervals([(8, 9), (1, 3), (2, 5)]), [[1, 5], [8, 9]], 'merging of unsorted intervals')
+check(merge_intervals([(1, 1), (1, 1)]), [[1, 1]], 'merging of single positions')
+check(intervals_length([]), 0, 'length of no intervals')
+check(intervals_length([[1, 1], [3, 7]]), 6, 'length of intervals')
+
+# intersection
+check(intersection_length([], [[1, 10]]), 0, 'intersection with no intervals')
+check(intersection_length([[1, 5]], [[6, 10]]), 0, 'intersection of touching intervals')
+check(intersection_length([[1, 5]], [[5, 10]]), 1, 'intersection of intervals with a common end')
+check(intersection_length([[1, 10]], [[3, 4], [6, 6]]), 3, 'intersection with nested intervals')
+
+# complement
+check(complement_intervals([], 1, 10), [[1, 10]], 'complement of no intervals')
+check(complement_intervals([[1, 10]], 1, 10), [], 'complement of the whole region')
+check(complement_intervals([[1, 3], [4, 10]], 1, 10), [], 'complement of touching intervals')
+check(complement_intervals([[2, 3], [5, 5]], 1, 6), [[1, 1], [4, 4], [6, 6]], 'complement of inner intervals')
+check(complement_intervals([[-5, 2], [9, 20]], 1, 10), [[3, 8]], 'complement of intervals crossing the bounds')
+check(complement_intervals([[1, 2]], 5, 10), [[5, 10]], 'complement of intervals outside the region')
+check(complement_intervals([[1, 2]], 5, 4), [], 'complement in an empty region')
+
+random.seed(1)
+for _ in range(500):
+    intervals1 = [(start, start + random.randint(-1, 8)) for start in random.sample(range(1, 60), random.randint(0, 6))]
+    intervals2 = [(start, start + random.randint(-1, 8)) for start in random.sample(range(1, 60), random.randint(0, 6))]
+    merged1, merged2 = merge_intervals(intervals1), merge_intervals(intervals2)
+    check(positions(merged1), positions(intervals1), 'positions of merged %s' % intervals1)
+    check(all(cur[0] > prev[1] + 1 for prev, cur in zip(merged1, merged1[1:])), True, 'disjointness of %s' % merged1)
+    check(intersection_length(merged1, merged2), len(positions(intervals1) & positions(intervals2)),
+          'intersection of %s and %s' % (merged1, merged2))
+    region_start, region_end = random.randint(1, 30), random.randint(20, 70)
+    check(positions(complement_intervals(merged1, region_start, region_end)),
+          set(range(region_start, region_end + 1)) - positions(intervals1), 'complement of %s' % merged1)
+print('Interval arithmetic is OK')
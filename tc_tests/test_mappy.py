@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import os
+import sys
+from common import *
+
+name = os.path.basename(__file__)[5:-3]
+minimap_name = name + '_minimap2'
+
+try:
+    import Cython
+except ImportError:
+    print('Cython is not installed, in-process alignment with mappy is not tested')
+    exit(0)
+
+test_data_dirpath = os.path.join('..', '..', 'test_data')  # QUAST is run from the data directory
+contigs = [os.path.join(test_data_dirpath, 'contigs_1.fasta'), os.path.join(test_data_dirpath, 'contigs_2.fasta')]
+params = '-r ' + os.path.join(test_data_dirpath, 'reference.fasta.gz')
+
+run_quast(minimap_name, contigs=contigs, params=params)
+run_quast(name, contigs=contigs, params=params + ' --mappy')
+check_report_files(name)
+
+with open(os.path.join(get_results_dirpath(name), 'quast.log')) as log_f:
+    if 'Building reference index for in-process alignment' not in log_f.read():
+        sys.stderr.write('Contigs were not aligned with mappy\n')
+        exit(8)
+
+# mappy output should be the same as output of minimap2 tool
+mappy_dirpath = os.path.join(get_results_dirpath(name), 'contigs_reports', 'minimap_output')
+minimap_dirpath = os.path.join(get_results_dirpath(minimap_name), 'contigs_reports', 'minimap_output')
+for label in ['contigs_1', 'contigs_2']:
+    for fname in [label + '.coords', label + '.coords_tmp']:
+        with open(os.path.join(minimap_dirpath, fname)) as minimap_f:
+            with open(os.path.join(mappy_dirpath, fname)) as mappy_f:
+                if minimap_f.read() != mappy_f.read():
+                    sys.stderr.write('%s differs from minimap2 output\n' % fname)
+                    exit(8)
+        print('%s is the same as minimap2 output' % fname)
+
+for metric in ['Genome fraction (%)', '# misassemblies', 'NGA50']:
+    if get_metric_values(name, metric) != get_metric_values(minimap_name, metric):
+        sys.stderr.write('%s differs from the run with minimap2\n' % metric)
+        exit(8)
+print('Reports are the same')
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs import qconfig
+qconfig.extensive_misassembly_threshold = qconfig.DEFAULT_EXT_MIS_SIZE  # is set by options parsing in QUAST runs
+from quast_libs import reference_profile
+
+computed_fpaths = []
+compute_profile = reference_profile.compute_profile
+
+
+def counting_compute_profile(ref_fpath):
+    computed_fpaths.append(ref_fpath)
+    return compute_profile(ref_fpath)
+
+reference_profile.compute_profile = counting_compute_profile
+
+
+def write_reference(ref_fpath, seqs):
+    mtime = os.stat(ref_fpath).st_mtime if os.path.exists(ref_fpath) else time.time()
+    with open(ref_fpath, 'w') as ref_f:
+        for name, seq in seqs:
+            ref_f.write('>' + name + '\n' + seq + '\n')
+    os.utime(ref_fpath, (mtime + 10, mtime + 10))  # the file is modified even if the clock is coarse
+
+
+def get_profile(ref_fpath, output_dirpath, is_computed_expected, what):
+    reference_profile._profiles.clear()
+    del computed_fpaths[:]
+    profile = reference_profile.do(ref_fpath, output_dirpath)
+    if bool(computed_fpaths) != is_computed_expected:
+        sys.stderr.write('%s: the profile was %s\n' % (what, 'computed' if computed_fpaths else 'loaded from the cache'))
+        exit(1)
+    print('%s: the profile was %s as expected' % (what, 'computed' if computed_fpaths else 'loaded from the cache'))
+    return profile
+
+
+def check_profile(profile, seqs):
+    expected_gc = dict((name, (seq.count('G') + seq.count('C'), len(seq) - seq.count('N'))) for name, seq in seqs)
+    if dict(profile.chr_lengths) != dict((name, len(seq)) for name, seq in seqs) or \
+            dict(profile.gc_by_chromosomes) != expected_gc:
+        sys.stderr.write('The profile does not match the reference\n')
+        exit(1)
+
+
+tmp_dirpath = tempfile.mkdtemp()
+try:
+    ref_fpath = os.path.join(tmp_dirpath, 'reference.fasta')
+    output_dirpath = os.path.join(tmp_dirpath, 'basic_stats')
+    seqs = [('chr1', 'ACGT' * 300 + 'N' * 100), ('chr2', 'GGCC' * 200)]
+    write_reference(ref_fpath, seqs)
+    check_profile(get_profile(ref_fpath, output_dirpath, True, 'New reference'), seqs)
+    check_profile(get_profile(ref_fpath, output_dirpath, False, 'Same reference'), seqs)
+
+    seqs = [('chr1', 'AAAT' * 300 + 'N' * 100), ('chr2', 'GGCC' * 200)]  # the same length, other GC content
+    write_reference(ref_fpath, seqs)
+    check_profile(get_profile(ref_fpath, output_dirpath, True, 'Modified reference'), seqs)
+    check_profile(get_profile(ref_fpath, output_dirpath, False, 'Modified reference again'), seqs)
+
+    qconfig.large_genome = not qconfig.large_genome  # other size of GC windows for Icarus
+    check_profile(get_profile(ref_fpath, output_dirpath, True, 'Other parameters'), seqs)
+    qconfig.large_genome = not qconfig.large_genome
+    get_profile(ref_fpath, output_dirpath, True, 'Previous parameters')
+
+    reference_profile.PROFILE_VERSION += 1
+    get_profile(ref_fpath, output_dirpath, True, 'Other version of the profile')
+    reference_profile.PROFILE_VERSION -= 1
+    get_profile(ref_fpath, output_dirpath, True, 'Previous version of the profile')
+
+    profile_fpath = os.path.join(output_dirpath, 'reference.profile')
+    with open(profile_fpath, 'wb') as profile_f:
+        profile_f.write(b'corrupted')
+    check_profile(get_profile(ref_fpath, output_dirpath, True, 'Corrupted cache'), seqs)
+    get_profile(ref_fpath, output_dirpath, False, 'Restored cache')
+finally:
+    shutil.rmtree(tmp_dirpath)
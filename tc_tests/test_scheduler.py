@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+from __future__ import with_statement
+import logging
+import os
+import sys
+import threading
+import time
+from site import addsitedir
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from quast_libs import qconfig
+addsitedir(os.path.join(qconfig.LIBS_LOCATION, 'site_packages'))
+
+from quast_libs import qutils
+from quast_libs.log import get_logger
+from quast_libs.scheduler import Stage, run_stages
+
+logger = get_logger(qconfig.LOGGER_DEFAULT_NAME)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+handler = ListHandler()
+logging.getLogger(qconfig.LOGGER_DEFAULT_NAME).addHandler(handler)
+logging.getLogger(qconfig.LOGGER_DEFAULT_NAME).setLevel(logging.DEBUG)
+
+started_stages = []
+helper_finished = threading.Event()
+
+
+def square(x):
+    return x * x
+
+
+def make_stage_fn(name, result=None, delay=0, finished_event=None):
+    def fn(**kwargs):
+        started_stages.append(name)
+        logger.info(name + ': started')
+        time.sleep(delay)
+        logger.info(name + ': finished')
+        if finished_event:
+            finished_event.set()
+        return result
+    return fn
+
+
+def check_forking_stage(x):
+    started_stages.append('forking')
+    # worker processes are forked only when helper stages are finished
+    squares = qutils.run_parallel(square, [(x,), (x + 1,)], 2)
+    assert helper_finished.is_set(), 'worker processes were forked while a helper stage was running'
+    return squares
+
+
+def get_stages():
+    return [Stage('first', make_stage_fn('first', 1, delay=0.2), [], ['x'], in_main_thread=True),
+            Stage('slow_helper', make_stage_fn('slow_helper', 'slow', delay=0.5, finished_event=helper_finished), [], ['slow']),
+            Stage('fast_helper', make_stage_fn('fast_helper', 'fast', delay=0.1), ['x'], ['fast']),
+            Stage('forking', check_forking_stage, ['x'], ['squares'], in_main_thread=True),
+            Stage('last', make_stage_fn('last', 'done'), ['fast', 'slow', 'squares'], ['result'])]
+
+
+def check_run(max_threads, expected_order=None):
+    del started_stages[:]
+    del handler.messages[:]
+    helper_finished.clear()
+    data = run_stages(get_stages(), dict(), max_threads=max_threads)
+    assert data['squares'] == [1, 4], data['squares']
+    assert data['result'] == 'done', data['result']
+    assert started_stages.index('last') == len(started_stages) - 1, started_stages
+    assert started_stages.index('first') < started_stages.index('fast_helper'), started_stages
+    if expected_order:
+        assert started_stages == expected_order, started_stages
+    # messages of each stage are printed together
+    messages_by_stages = [message.split(':')[0] for message in handler.messages]
+    stages_order = [name for i, name in enumerate(messages_by_stages) if i == 0 or messages_by_stages[i - 1] != name]
+    assert len(stages_order) == len(set(stages_order)), handler.messages
+
+
+qconfig.max_threads = 4
+qconfig.memory_efficient = False
+check_run(4)
+print('Concurrent run is OK')
+
+sequential_order = ['first', 'slow_helper', 'fast_helper', 'forking', 'last']
+check_run(1, sequential_order)
+print('Sequential run is OK')
+
+qconfig.memory_efficient = True
+check_run(4, sequential_order)
+qconfig.memory_efficient = False
+print('Sequential run in the memory efficient mode is OK')
+
+try:
+    run_stages([Stage('consumer', make_stage_fn('consumer'), ['missing'])], dict(), max_threads=4)
+except ValueError:
+    print('Missing inputs are reported')
+else:
+    sys.stderr.write('Missing input of a stage is not reported\n')
+    exit(1)